@@ -77,10 +77,23 @@ const api = {
   // ========================================
   expenses: {
     /**
-     * 获取所有支出记录
+     * 获取所有支出记录（不分页的完整列表）
      * @returns {Promise<Array>} 支出列表
      */
-    getAll: () => request('/api/expenses'),
+    getAll: () => request('/api/expenses?all=true'),
+
+    /**
+     * 分页获取支出记录（游标分页，按日期倒序）
+     * @param {object} [params] - 查询参数
+     * @param {number} [params.limit] - 每页条数（默认 20）
+     * @param {string} [params.cursor] - 上一页返回的 next_cursor
+     * @param {string} [params.from] - 开始日期（YYYY-MM-DD）
+     * @param {string} [params.to] - 结束日期（YYYY-MM-DD）
+     * @param {string} [params.type] - 支出类型
+     * @param {string} [params.category] - 分类
+     * @returns {Promise<object>} { items, next_cursor, has_more, limit }
+     */
+    getPage: (params = {}) => request(`/api/expenses?${new URLSearchParams(params)}`),
 
     /**
      * 创建新支出
@@ -124,10 +137,22 @@ const api = {
   // ========================================
   activities: {
     /**
-     * 获取所有活动记录
+     * 获取所有活动记录（不分页的完整列表）
      * @returns {Promise<Array>} 活动列表
      */
-    getAll: () => request('/api/activities'),
+    getAll: () => request('/api/activities?all=true'),
+
+    /**
+     * 分页获取活动记录（游标分页，按日期倒序）
+     * @param {object} [params] - 查询参数
+     * @param {number} [params.limit] - 每页条数（默认 20）
+     * @param {string} [params.cursor] - 上一页返回的 next_cursor
+     * @param {string} [params.from] - 开始日期（YYYY-MM-DD）
+     * @param {string} [params.to] - 结束日期（YYYY-MM-DD）
+     * @param {string} [params.type] - 活动类型
+     * @returns {Promise<object>} { items, next_cursor, has_more, limit }
+     */
+    getPage: (params = {}) => request(`/api/activities?${new URLSearchParams(params)}`),
 
     /**
      * 创建新活动（自动计算权重）
@@ -181,6 +206,26 @@ const api = {
      */
     getSummary: () => request('/api/roi/summary'),
 
+    /**
+     * 获取累计 ROI 时间序列及回本日期
+     * @param {string} [granularity='month'] - 分桶粒度（day | week | month）
+     * @returns {Promise<object>} { granularity, market_reference_price, points: [...], break_even_date }
+     */
+    getTimeseries: (granularity = 'month') => request(`/api/roi/timeseries?granularity=${granularity}`),
+
+    /**
+     * What-if 模拟：按参数网格计算 ROI 矩阵
+     * @param {object} grids - 参数网格
+     * @param {number[]} grids.market_reference_price - 市场参考价网格
+     * @param {number[]} grids.baseline - 基准距离网格
+     * @param {number[]} grids.sigma - 标准差网格
+     * @returns {Promise<object>} { weighted_total, paid_roi, planned_roi, ... }
+     */
+    simulate: (grids) => request('/api/roi/simulate', {
+      method: 'POST',
+      body: JSON.stringify(grids),
+    }),
+
     /**
      * 更新市场参考价
      * @param {number} price - 新的市场参考价
@@ -217,18 +262,41 @@ const api = {
       body: JSON.stringify(data),
     }),
 
+    /**
+     * 预览扣费计划（只读，不写数据库；适合表单输入时实时调用）
+     * @param {object} data - 同 create 的请求体；传 contract_id 时预览更新该合同
+     * @returns {Promise<object>} { charge_dates, charges_count, paid_count, pending_count, schedule_total, changes? }
+     */
+    preview: (data) => request('/api/contracts/preview', {
+      method: 'POST',
+      body: JSON.stringify(data),
+    }),
+
     /**
      * 获取所有合同
-     * @returns {Promise<Array>} 合同列表
+     * @returns {Promise<Array>} 合同列表（每项含 paid_count、pending_count、paid_amount、remaining_amount、next_charge_date）
      */
     getAll: () => request('/api/contracts'),
 
     /**
-     * 获取合同详情
+     * 获取合同详情（含全部扣费，不分页）
+     * @param {number} id - 合同 ID
+     * @returns {Promise<object>} { contract, charges, summary }
+     */
+    getById: (id) => request(`/api/contracts/${id}?all=true`),
+
+    /**
+     * 分页获取合同详情及扣费（游标分页，按扣费日期升序）
      * @param {number} id - 合同 ID
-     * @returns {Promise<object>} 合同详情及扣费列表
+     * @param {object} [params] - 查询参数
+     * @param {string} [params.status] - 扣费状态（paid / pending）
+     * @param {string} [params.from] - 开始日期（YYYY-MM-DD）
+     * @param {string} [params.to] - 结束日期（YYYY-MM-DD）
+     * @param {number} [params.limit] - 每页条数（默认 20）
+     * @param {string} [params.cursor] - 上一页返回的 next_cursor
+     * @returns {Promise<object>} { contract, charges, next_cursor, has_more, limit, summary }
      */
-    getById: (id) => request(`/api/contracts/${id}`),
+    getChargesPage: (id, params = {}) => request(`/api/contracts/${id}?${new URLSearchParams(params)}`),
 
     /**
      * 更新合同
@@ -262,6 +330,29 @@ const api = {
       body: JSON.stringify(data),
     }),
 
+    /**
+     * 按扣费日期更新某期扣费（虚拟扣费计划中的待付期数没有 id，只能按日期更新）
+     * @param {number} contractId - 合同 ID
+     * @param {string} chargeDate - 扣费日期（YYYY-MM-DD）
+     * @param {object} data - 要更新的数据（同 updateCharge）
+     * @returns {Promise<object>} { charge, created }
+     */
+    updateChargeByDate: (contractId, chargeDate, data) => request(`/api/contracts/${contractId}/charges/by-date/${chargeDate}`, {
+      method: 'PUT',
+      body: JSON.stringify(data),
+    }),
+
+    /**
+     * 批量更新多期扣费（一个事务，合同总金额只重算一次）
+     * @param {number} contractId - 合同 ID
+     * @param {Array<object>} charges - [{ charge_id 或 charge_date, amount?, status? }, ...]
+     * @returns {Promise<object>} { charges, updated_count, contract }
+     */
+    batchUpdateCharges: (contractId, charges) => request(`/api/contracts/${contractId}/charges`, {
+      method: 'PATCH',
+      body: JSON.stringify({ charges }),
+    }),
+
     /**
      * 删除合同
      * @param {number} id - 合同 ID
@@ -285,6 +376,28 @@ const api = {
       body: JSON.stringify(data),
     }),
   },
+
+  // ========================================
+  // 数据导出 API
+  // ========================================
+  export: {
+    /**
+     * 提交后台导出任务（立即返回；相同选项的任务在进行中时合并到该任务）
+     * @param {object} options - 导出选项（force / mode / layout / precompress）
+     * @returns {Promise<object>} { job_id, status, coalesced, status_url }
+     */
+    startJob: (options = {}) => request('/api/export/json', {
+      method: 'POST',
+      body: JSON.stringify({ ...options, async: true }),
+    }),
+
+    /**
+     * 查询导出任务状态
+     * @param {string} jobId - 任务 ID
+     * @returns {Promise<object>} { status, progress, duration, result, error, ... }
+     */
+    getJob: (jobId) => request(`/api/export/jobs/${jobId}`),
+  },
 };
 
 export default api;
@@ -191,9 +191,9 @@ export default function ExpenseList({ refreshTrigger, onDelete }) {
     }
   };
 
-  // 开始编辑扣费记录
+  // 开始编辑扣费记录（按扣费日期定位，虚拟扣费计划中的待付期数没有 id）
   const startEditCharge = (charge) => {
-    setEditingChargeId(charge.id);
+    setEditingChargeId(charge.charge_date);
     setEditChargeData({
       amount: charge.amount,
       status: charge.status,
@@ -207,9 +207,9 @@ export default function ExpenseList({ refreshTrigger, onDelete }) {
   };
 
   // 保存扣费记录编辑
-  const saveEditCharge = async (contractId, chargeId) => {
+  const saveEditCharge = async (contractId, chargeDate) => {
     try {
-      await api.contracts.updateCharge(contractId, chargeId, editChargeData);
+      await api.contracts.updateChargeByDate(contractId, chargeDate, editChargeData);
 
       setEditingChargeId(null);
       setEditChargeData({});
@@ -226,11 +226,11 @@ export default function ExpenseList({ refreshTrigger, onDelete }) {
   };
 
   // 切换扣费状态
-  const toggleChargeStatus = async (contractId, chargeId, currentStatus) => {
+  const toggleChargeStatus = async (contractId, chargeDate, currentStatus) => {
     const newStatus = currentStatus === 'paid' ? 'pending' : 'paid';
 
     try {
-      await api.contracts.updateCharge(contractId, chargeId, { status: newStatus });
+      await api.contracts.updateChargeByDate(contractId, chargeDate, { status: newStatus });
 
       // 只重新加载合同详情（模态框内数据），不重新加载支出列表以避免闪烁
       const details = await api.contracts.getById(contractId);
@@ -614,10 +614,10 @@ export default function ExpenseList({ refreshTrigger, onDelete }) {
                   </h4>
                   <div style={styles.chargesTable}>
                     {contractDetails.charges.map((charge, index) => {
-                      const isEditingCharge = editingChargeId === charge.id;
+                      const isEditingCharge = editingChargeId === charge.charge_date;
 
                       return (
-                        <div key={charge.id} style={styles.chargeRow} className="charge-row-item">
+                        <div key={charge.charge_date} style={styles.chargeRow} className="charge-row-item">
                           {isEditingCharge ? (
                             // 编辑模式
                             <>
@@ -647,7 +647,7 @@ export default function ExpenseList({ refreshTrigger, onDelete }) {
                               </select>
                               <div style={styles.chargeActions}>
                                 <button
-                                  onClick={() => saveEditCharge(contractDetails.contract.id, charge.id)}
+                                  onClick={() => saveEditCharge(contractDetails.contract.id, charge.charge_date)}
                                   style={styles.chargeActionBtn}
                                   title="保存"
                                 >
@@ -669,7 +669,7 @@ export default function ExpenseList({ refreshTrigger, onDelete }) {
                               <span style={styles.chargeDate}>{charge.charge_date}</span>
                               <span style={styles.chargeAmount}>${charge.amount.toFixed(2)}</span>
                               <button
-                                onClick={() => toggleChargeStatus(contractDetails.contract.id, charge.id, charge.status)}
+                                onClick={() => toggleChargeStatus(contractDetails.contract.id, charge.charge_date, charge.status)}
                                 style={{
                                   ...styles.chargeStatusButton,
                                   background: charge.status === 'paid' ? '#d1fae5' : '#fee2e2',
@@ -15,6 +15,9 @@ import ExpenseList from '../components/ExpenseList';
 import ActivityList from '../components/ActivityList';
 import api from '../api/client';
 
+// 导出任务轮询间隔（毫秒）
+const EXPORT_POLL_INTERVAL = 1000;
+
 export default function Dashboard() {
   // 用于触发 ROI 卡片刷新
   const [refreshKey, setRefreshKey] = useState(0);
@@ -22,6 +25,7 @@ export default function Dashboard() {
   const [listRefreshKey, setListRefreshKey] = useState(0);
   // 导出状态
   const [exporting, setExporting] = useState(false);
+  const [exportProgress, setExportProgress] = useState(null);
 
   const handleDataChange = () => {
     // 数据变化时，触发 ROI 卡片和列表刷新
@@ -32,23 +36,31 @@ export default function Dashboard() {
   const handleExportData = async () => {
     try {
       setExporting(true);
-      const response = await fetch('http://localhost:5002/api/export/json', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        }
-      });
-
-      if (!response.ok) {
-        throw new Error('导出失败');
+      // 后台导出：提交任务后轮询进度，不占着请求等导出完成
+      const { job_id: jobId } = await api.export.startJob();
+
+      let job = await api.export.getJob(jobId);
+      while (job.status === 'queued' || job.status === 'running') {
+        setExportProgress(job.progress.percentage);
+        await new Promise(resolve => setTimeout(resolve, EXPORT_POLL_INTERVAL));
+        job = await api.export.getJob(jobId);
       }
 
-      const result = await response.json();
-      alert(`数据导出成功！\n文件路径: ${result.file_path}\n支出: ${result.stats.expenses_count} 条\n活动: ${result.stats.activities_count} 条\nROI: ${result.stats.roi_percentage.toFixed(1)}%`);
+      if (job.status === 'failed') {
+        throw new Error(job.error || '导出失败');
+      }
+
+      const result = job.result;
+      if (result.skipped) {
+        alert(`数据没有变化，沿用上次导出的文件\n文件路径: ${result.file_path}`);
+      } else {
+        alert(`数据导出成功！\n文件路径: ${result.file_path}\n支出: ${result.stats.expenses_count} 条\n活动: ${result.stats.activities_count} 条\nROI: ${result.stats.roi_percentage.toFixed(1)}%\n耗时: ${job.duration.toFixed(1)} 秒`);
+      }
     } catch (err) {
       alert(`导出失败: ${err.message}`);
     } finally {
       setExporting(false);
+      setExportProgress(null);
     }
   };
 
@@ -75,7 +87,9 @@ export default function Dashboard() {
                 cursor: exporting ? 'not-allowed' : 'pointer'
               }}
             >
-              {exporting ? '导出中...' : '📤 导出数据'}
+              {exporting
+                ? `导出中${exportProgress ? ` ${Math.round(exportProgress)}%` : ''}...`
+                : '📤 导出数据'}
             </button>
           </div>
         </div>
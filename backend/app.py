@@ -44,7 +44,7 @@ CORS(app, origins=['http://localhost:5173', 'http://127.0.0.1:5173'])
 # 初始化数据库
 # ========================================
 # 导入 db 和模型
-from models import db, Expense, Activity, Setting, MembershipContract, WeeklyCharge
+from models import db, Expense, Activity, Setting, MembershipContract, WeeklyCharge, RoiAggregate, upgrade_schema
 
 # 将 db 绑定到 Flask 应用
 db.init_app(app)
@@ -64,6 +64,50 @@ app.register_blueprint(roi_bp)
 app.register_blueprint(contracts_bp)
 app.register_blueprint(export_bp)
 
+# ========================================
+# SQL 语句计数（调试模式下响应头带 X-Query-Count）
+# ========================================
+from utils.query_counter import install_query_counter, install_query_count_header
+
+with app.app_context():
+    install_query_counter(db.engine)
+install_query_count_header(app)
+
+# ========================================
+# 数据版本号（每次提交写操作加 1，导出时判断数据是否变化）
+# ========================================
+from utils.data_version import install_data_version_tracking, init_data_version
+
+install_data_version_tracking()
+
+# ========================================
+# 权重重算（进度只在内存里，启动时继续被重启打断的重算）
+# ========================================
+from utils.weight_model import resume_weight_recompute
+
+# ========================================
+# 到期扣费自动结算（命令行：flask --app app settle-charges）
+# ========================================
+import atexit
+import click
+from utils.settlement import settle_due_charges, start_settlement_worker, stop_settlement_worker
+
+# 进程退出时最多等待当前这一轮结算完成的时间（秒）
+SETTLEMENT_STOP_TIMEOUT = 30
+
+
+@app.cli.command('settle-charges')
+@click.option('--today', default=None, help='按指定日期结算（YYYY-MM-DD），默认为 TIMEZONE 时区的今天')
+def settle_charges_command(today):
+    """
+    把所有到期的待付扣费结算为已付（可以配合 cron 定时运行）
+    """
+    if today is not None:
+        today = datetime.fromisoformat(today).date()
+    result = settle_due_charges(today)
+    print(f"[OK] {result['today']} 结算 {result['settled']} 期，"
+          f"虚拟扣费计划补上 {result['virtual_settled']} 期，共 ${result['amount']}")
+
 # ========================================
 # 健康检查接口
 # ========================================
@@ -118,6 +162,7 @@ def index():
 # ========================================
 with app.app_context():
     db.create_all()
+    upgrade_schema()  # 给已有的表补上新增的列和索引
     print("[OK] 数据库表创建成功！")
 
     # 初始化默认设置（如果不存在）
@@ -131,15 +176,53 @@ with app.app_context():
         db.session.commit()
         print("[OK] 初始化默认市场参考价：$50.0 NZD")
 
+    # 初始化 ROI 合计表（如果不存在，用全量重算结果创建）
+    from utils.roi import rebuild_roi_aggregates
+    if not db.session.get(RoiAggregate, 1):
+        rebuild_roi_aggregates()
+        db.session.commit()
+        print("[OK] 初始化 ROI 合计表")
+
+    # 初始化数据版本号（如果不存在）
+    init_data_version()
+
+# ========================================
+# 后台线程（自动结算 + 继续被打断的权重重算）
+# ========================================
+def start_background_workers():
+    """
+    启动后台线程（只在处理请求的进程里调用一次）
+
+    - 设置了 SETTLEMENT_INTERVAL（秒）时启动自动结算线程，进程退出时通知它停止
+    - 上次权重重算被重启打断（还有旧版本的活动）时在后台继续重算
+
+    用 gunicorn 等 WSGI 服务器部署时，在 worker 进程启动后调用这个函数。
+    """
+    settlement_interval = os.getenv('SETTLEMENT_INTERVAL')
+    if settlement_interval:
+        start_settlement_worker(app, float(settlement_interval))
+        atexit.register(stop_settlement_worker, SETTLEMENT_STOP_TIMEOUT)
+        print(f"[OK] 自动结算线程已启动（每 {settlement_interval} 秒）")
+
+    if resume_weight_recompute(app):
+        print("[OK] 检测到未完成的权重重算，已在后台继续")
+
 # ========================================
 # 启动开发服务器
 # ========================================
 if __name__ == '__main__':
-    # debug=True: 代码改动时自动重启，显示详细错误信息
+    # 调试模式（自动重载 + 详细错误信息），FLASK_DEBUG=False 时关闭
+    debug = os.getenv('FLASK_DEBUG', 'True').lower() in ('1', 'true', 'yes')
+
+    # 自动重载时，当前进程只负责监视文件、重启子进程，
+    # 真正处理请求的是子进程（WERKZEUG_RUN_MAIN=true）；后台线程只在处理请求的进程里启动
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
+
     # host='0.0.0.0': 允许局域网访问（开发时可选）
     # port=5000: 默认端口
     app.run(
-        debug=True,
+        debug=debug,
         host='0.0.0.0',  # 允许 localhost 和 127.0.0.1 都能访问
         port=5002  # 使用 5002 端口
     )
@@ -0,0 +1,121 @@
+"""
+基准测试：合同扣费记录生成（逐条 flush vs 批量插入）
+
+对比两种方式为一个 520 期（10 年周扣费）、全部已付的合同生成记录：
+- 逐条：每期 add 子支出 + flush 拿 id + add 扣费记录（重构前的做法）
+- 批量：utils/charges.py 的 materialize_charges（INSERT ... RETURNING + executemany）
+
+运行方法（在 backend/ 目录下）：
+    python benchmarks/bench_contract_charges.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, Expense, MembershipContract, WeeklyCharge
+from utils.charges import materialize_charges
+from utils.query_counter import install_query_counter, count_queries
+
+PERIODS = 520
+
+
+def create_app(db_path):
+    """
+    独立的测试应用（临时 SQLite 文件，不影响 gym_roi.db）
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def create_contract_rows():
+    """
+    创建父支出和合同，返回 (contract, parent_expense, charge_dates)
+    """
+    start_date = date(2015, 1, 5)
+    charge_dates = [start_date + timedelta(weeks=i) for i in range(PERIODS)]
+
+    parent_expense = Expense(
+        type='membership', category='年卡', amount=10.0 * PERIODS,
+        currency='NZD', date=start_date, is_installment=True
+    )
+    db.session.add(parent_expense)
+    db.session.flush()
+
+    contract = MembershipContract(
+        expense_id=parent_expense.id, total_amount=10.0 * PERIODS, period_amount=10.0,
+        period_type='weekly', day_of_week=0,
+        start_date=start_date, end_date=charge_dates[-1] + timedelta(days=1)
+    )
+    db.session.add(contract)
+    db.session.flush()
+
+    return contract, parent_expense, charge_dates
+
+
+def generate_row_by_row(contract, parent_expense, charge_dates):
+    """
+    重构前的做法：每期 add + flush
+    """
+    for number, charge_date in enumerate(charge_dates, start=1):
+        child_expense = Expense(
+            type=parent_expense.type, category=parent_expense.category,
+            amount=contract.period_amount, currency=parent_expense.currency,
+            date=charge_date, note=f"{parent_expense.category} - 第 {number} 期",
+            parent_expense_id=parent_expense.id, is_installment=False
+        )
+        db.session.add(child_expense)
+        db.session.flush()
+
+        db.session.add(WeeklyCharge(
+            contract_id=contract.id, expense_id=child_expense.id,
+            charge_date=charge_date, amount=contract.period_amount, status='paid'
+        ))
+
+
+def generate_bulk(contract, parent_expense, charge_dates):
+    """
+    批量插入（materialize_charges）
+    """
+    materialize_charges(contract, parent_expense, charge_dates)
+
+
+def run(name, generate):
+    """
+    在全新的临时数据库上运行一次，打印耗时和 SQL 条数
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            install_query_counter(db.engine)
+
+            contract, parent_expense, charge_dates = create_contract_rows()
+
+            with count_queries() as counter:
+                started = time.perf_counter()
+                generate(contract, parent_expense, charge_dates)
+                db.session.commit()
+                elapsed = time.perf_counter() - started
+
+            charges = WeeklyCharge.query.count()
+            children = Expense.query.filter(Expense.parent_expense_id != None).count()
+            db.session.remove()
+            db.engine.dispose()
+
+    print(f"{name:<10} {elapsed * 1000:>9.1f} ms {counter.count:>8} 条 SQL   "
+          f"(扣费记录 {charges}，子支出 {children})")
+
+
+if __name__ == '__main__':
+    print(f"生成 {PERIODS} 期已付合同记录\n" + "=" * 60)
+    run('逐条 flush', generate_row_by_row)
+    run('批量插入', generate_bulk)
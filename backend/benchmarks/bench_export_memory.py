@@ -0,0 +1,212 @@
+"""
+基准测试：导出的内存峰值（一次性构建列表 vs 流式写入）
+
+在一个合成的临时数据库上（默认 100 万条活动 + 几千条支出）对比：
+- 列表：先把所有记录读成 ORM 对象、拼成字典列表，再 json.dump 整个文档（流式导出之前的做法）
+- 流式：utils/exporter.py 的 export_json（yield_per 分批读取，边编码边写，另外还写分片和 manifest）
+
+每种方式在单独的子进程里运行，用 resource.getrusage 读该进程的内存峰值（RSS），
+同时给出导出前的 RSS，差值就是导出本身占用的内存。
+
+运行方法（在 backend/ 目录下）：
+    python benchmarks/bench_export_memory.py
+    python benchmarks/bench_export_memory.py --activities 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, Expense, Activity
+from utils.roi import rebuild_roi_aggregates
+
+ACTIVITIES = 1_000_000
+EXPENSES = 5_000
+INSERT_BATCH_SIZE = 50_000
+
+
+def create_app(db_path):
+    """
+    独立的测试应用（临时 SQLite 文件，不影响 gym_roi.db）
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def peak_rss_mb():
+    """
+    当前进程的内存峰值（MB；Linux 的 ru_maxrss 单位是 KB，macOS 是字节）
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """
+    当前进程的常驻内存（MB；读不到 /proc 时退回到峰值）
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def build_database(db_path, activities):
+    """
+    生成合成数据（批量 INSERT，十年的日期均匀分布）
+    """
+    app = create_app(db_path)
+    random.seed(0)
+    start = date(2015, 1, 1)
+
+    with app.app_context():
+        db.create_all()
+
+        for offset in range(0, activities, INSERT_BATCH_SIZE):
+            db.session.execute(db.insert(Activity), [
+                {
+                    'type': 'swimming',
+                    'date': start + timedelta(days=random.randrange(3650)),
+                    'distance': random.randrange(500, 3000, 50),
+                    'calculated_weight': round(random.uniform(0.5, 2.0), 2),
+                    'note': random.choice([None, '晨泳', '晚上人多'])
+                }
+                for _ in range(min(INSERT_BATCH_SIZE, activities - offset))
+            ])
+
+        db.session.execute(db.insert(Expense), [
+            {
+                'type': 'membership',
+                'category': '次卡',
+                'amount': 10.0,
+                'currency': 'NZD',
+                'date': start + timedelta(days=random.randrange(3650)),
+                'is_installment': False
+            }
+            for _ in range(EXPENSES)
+        ])
+
+        rebuild_roi_aggregates()
+        db.session.commit()
+
+
+def export_in_memory(out_dir):
+    """
+    流式导出之前的做法：全部读成 ORM 对象 → 字典列表 → json.dump
+    """
+    from utils.roi import get_roi_summary_data
+
+    expenses = Expense.query.order_by(Expense.date.desc()).all()
+    expenses_data = [
+        {
+            'id': expense.id,
+            'amount': float(expense.amount),
+            'currency': expense.currency,
+            'date': expense.date.isoformat(),
+            'type': expense.type,
+            'category': expense.category,
+            'note': expense.note,
+            'is_installment': expense.is_installment,
+            'parent_expense_id': expense.parent_expense_id
+        }
+        for expense in expenses
+    ]
+
+    activities = Activity.query.order_by(Activity.date.desc()).all()
+    activities_data = [
+        {
+            'id': activity.id,
+            'distance': activity.distance,
+            'date': activity.date.isoformat(),
+            'calculated_weight': float(activity.calculated_weight),
+            'note': activity.note
+        }
+        for activity in activities
+    ]
+
+    export_data = {
+        'roi': get_roi_summary_data(),
+        'expenses': expenses_data,
+        'activities': activities_data
+    }
+    with open(os.path.join(out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(export_data, f, ensure_ascii=False, indent=2)
+
+
+def export_streaming(out_dir):
+    """
+    流式导出（utils/exporter.py）
+    """
+    from utils.exporter import export_json
+
+    export_json(force=True, data_dir=out_dir)
+
+
+VARIANTS = {
+    '列表': export_in_memory,
+    '流式': export_streaming,
+}
+
+
+def run_variant(name, db_path):
+    """
+    子进程里运行一种导出方式，输出 JSON 结果
+    """
+    app = create_app(db_path)
+    with app.app_context(), tempfile.TemporaryDirectory() as out_dir:
+        before = current_rss_mb()
+        started = time.perf_counter()
+        VARIANTS[name](out_dir)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(out_dir, 'summary.json'))
+
+    print(json.dumps({
+        'elapsed': elapsed,
+        'rss_before': before,
+        'rss_peak': peak_rss_mb(),
+        'summary_mb': size / (1024 * 1024)
+    }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--activities', type=int, default=ACTIVITIES, help='合成活动条数')
+    parser.add_argument('--variant', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.db)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        build_database(db_path, args.activities)
+        print(f"合成数据：{args.activities} 条活动 + {EXPENSES} 条支出"
+              f"（{time.perf_counter() - started:.1f} s）\n" + "=" * 72)
+
+        for name in VARIANTS:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--variant', name, '--db', db_path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<4} {result['elapsed']:>7.1f} s   "
+                  f"RSS 峰值 {result['rss_peak']:>7.1f} MB   "
+                  f"导出占用 {result['rss_peak'] - result['rss_before']:>7.1f} MB   "
+                  f"summary.json {result['summary_mb']:.1f} MB")
@@ -7,6 +7,9 @@
 1. Expense - 支出记录
 2. Activity - 活动记录
 3. Setting - 系统设置（如市场参考价）
+4. MembershipContract - 分期合同
+5. WeeklyCharge - 周扣费记录
+6. RoiAggregate - ROI 合计值（物化表，写入时增量维护）
 
 为什么用 ORM？
 - 不需要写 SQL 语句
@@ -23,6 +26,37 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+
+def upgrade_schema():
+    """
+    给已有数据库补上后来新增的列和索引（轻量迁移）
+
+    为什么需要？
+    - db.create_all() 只会创建不存在的表，不会给已有的表加列或加索引
+    - 新增字段都允许为空，所以直接 ALTER TABLE ADD COLUMN 即可
+
+    在 app.py 中 db.create_all() 之后调用。
+    """
+    inspector = db.inspect(db.engine)
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            # 1. 补上缺少的列
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(db.text(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                    ))
+
+            # 2. 补上缺少的索引
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
 # ========================================
 # Expense 模型（支出表）
 # ========================================
@@ -45,6 +79,11 @@ class Expense(db.Model):
 
     __tablename__ = 'expenses'  # 表名
 
+    # 复合索引：列表接口按 (date, id) 游标分页
+    __table_args__ = (
+        db.Index('ix_expenses_date_id', 'date', 'id'),
+    )
+
     # 主键（自增整数）
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -78,10 +117,15 @@ class Expense(db.Model):
     # 关系定义
     children = db.relationship('Expense', backref=db.backref('parent', remote_side=[id]), lazy=True)
 
-    def to_dict(self):
+    def to_dict(self, contract_info_map=None):
         """
         将数据库记录转换为 Python 字典（方便转 JSON）
 
+        参数:
+            contract_info_map (dict): 可选，{父支出 id: contract_info}，
+                由 Expense.load_contract_info() 批量预取。
+                传入时不再单独查询数据库（列表接口用，避免 N+1 查询）。
+
         返回:
         {
           "id": 1,
@@ -112,20 +156,62 @@ class Expense(db.Model):
 
         # 如果是分期合同父记录，加入合同信息
         if self.is_installment and not self.parent_expense_id:
-            # 查询关联的合同
-            try:
-                contract = MembershipContract.query.filter_by(expense_id=self.id).first()
-                if contract:
-                    # 获取合同关联的所有扣费记录数量作为总期数
-                    total_periods = WeeklyCharge.query.filter_by(contract_id=contract.id).count()
-                    result['contract_info'] = {
-                        'total_periods': total_periods
-                    }
-            except:
-                pass  # 如果查询失败，就不添加 contract_info
+            if contract_info_map is None:
+                # 单条序列化：单独查询一次
+                try:
+                    contract_info_map = Expense.load_contract_info([self])
+                except:
+                    contract_info_map = {}  # 如果查询失败，就不添加 contract_info
+
+            if self.id in contract_info_map:
+                result['contract_info'] = contract_info_map[self.id]
 
         return result
 
+    @staticmethod
+    def load_contract_info(expenses):
+        """
+        批量预取分期父支出的合同信息（一次 GROUP BY 查询）
+
+        参数:
+            expenses (list): Expense 列表（只有分期合同父记录会被查询）
+
+        返回:
+            dict: {父支出 id: {"total_periods": 52}}
+        """
+        parent_ids = [
+            expense.id for expense in expenses
+            if expense.is_installment and not expense.parent_expense_id
+        ]
+        if not parent_ids:
+            return {}
+
+        # 避免循环导入（utils.schedule 依赖本模块）
+        from utils.schedule import count_contract_periods
+
+        rows = db.session.execute(
+            db.select(MembershipContract, db.func.count(WeeklyCharge.id))
+            .outerjoin(WeeklyCharge, WeeklyCharge.contract_id == MembershipContract.id)
+            .where(MembershipContract.expense_id.in_(parent_ids))
+            .group_by(MembershipContract.id)
+            .order_by(MembershipContract.id.desc())
+        ).all()
+
+        # 同一父支出有多份合同时取 id 最小的一份（与以前的 .first() 一致）
+        # 虚拟扣费计划的合同只存了部分期数，总期数按规则计算
+        return {
+            contract.expense_id: {'total_periods': count_contract_periods(contract, stored_count)}
+            for contract, stored_count in rows
+        }
+
+    @staticmethod
+    def serialize_many(expenses):
+        """
+        序列化支出列表（合同信息批量预取，查询次数与条数无关）
+        """
+        contract_info_map = Expense.load_contract_info(expenses)
+        return [expense.to_dict(contract_info_map) for expense in expenses]
+
     def __repr__(self):
         """
         打印对象时的显示格式（方便调试）
@@ -150,12 +236,18 @@ class Activity(db.Model):
     - date: 活动日期
     - distance: 游泳距离（米）
     - calculated_weight: 计算出的权重（基于高斯函数）
+    - weight_model_version: 计算权重时使用的参数版本（见 utils/weight_model.py）
     - note: 备注
     - created_at: 创建时间（自动生成）
     """
 
     __tablename__ = 'activities'  # 表名
 
+    # 复合索引：列表接口按 (date, id) 游标分页
+    __table_args__ = (
+        db.Index('ix_activities_date_id', 'date', 'id'),
+    )
+
     # 主键（自增整数）
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -172,6 +264,9 @@ class Activity(db.Model):
     # 计算出的权重（由后端自动计算）
     calculated_weight = db.Column(db.Float)
 
+    # 计算权重时使用的参数版本（NULL 表示最初的默认参数）
+    weight_model_version = db.Column(db.Integer, nullable=True)
+
     # 备注（可选）
     note = db.Column(db.Text)
 
@@ -189,6 +284,7 @@ class Activity(db.Model):
           "date": "2025-10-17",
           "distance": 1500,
           "calculated_weight": 1.64,
+          "weight_model_version": 1,
           "note": "状态不错",
           "created_at": "2025-10-18T10:30:15"
         }
@@ -199,6 +295,7 @@ class Activity(db.Model):
             'date': self.date.isoformat() if self.date else None,
             'distance': self.distance,
             'calculated_weight': self.calculated_weight,
+            'weight_model_version': self.weight_model_version,
             'note': self.note,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -295,6 +392,7 @@ class MembershipContract(db.Model):
     - day_of_month: 每月扣费日（1-28号，仅 monthly 模式）
     - start_date: 合同开始日期
     - end_date: 合同结束日期
+    - schedule_mode: 扣费计划存储模式（'materialized'=每期一条记录, 'virtual'=只存规则和覆盖记录）
     - created_at: 创建时间（自动生成）
     """
 
@@ -325,6 +423,12 @@ class MembershipContract(db.Model):
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
 
+    # 扣费计划存储模式（见 utils/schedule.py）
+    # - 'materialized': 每一期都存一条 weekly_charges 记录
+    # - 'virtual': 只存已付和被修改过的期数，其余待付期数读取时按规则生成
+    # 旧数据为空，按 'materialized' 处理
+    schedule_mode = db.Column(db.String(20), default='materialized', nullable=True)
+
     # 创建时间（自动生成）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -345,6 +449,7 @@ class MembershipContract(db.Model):
           "day_of_week": 0,
           "start_date": "2025-01-01",
           "end_date": "2025-12-31",
+          "schedule_mode": "materialized",
           "created_at": "2025-10-18T10:30:15"
         }
         """
@@ -358,6 +463,7 @@ class MembershipContract(db.Model):
             'day_of_month': self.day_of_month,
             'start_date': self.start_date.isoformat() if self.start_date else None,
             'end_date': self.end_date.isoformat() if self.end_date else None,
+            'schedule_mode': self.schedule_mode or 'materialized',
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -391,6 +497,14 @@ class WeeklyCharge(db.Model):
 
     __tablename__ = 'weekly_charges'  # 表名
 
+    # 复合索引：
+    # - 自动结算按 status = 'pending' AND charge_date <= 今天 查找到期扣费（见 utils/settlement.py）
+    # - 合同列表按 contract_id 分组统计已付 / 待付（见 utils/schedule.py 的 load_contract_progress）
+    __table_args__ = (
+        db.Index('ix_weekly_charges_status_date', 'status', 'charge_date'),
+        db.Index('ix_weekly_charges_contract_status_date', 'contract_id', 'status', 'charge_date'),
+    )
+
     # 主键（自增整数）
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -447,3 +561,69 @@ class WeeklyCharge(db.Model):
         示例：<WeeklyCharge #1: $17 on 2025-01-06 (paid)>
         """
         return f'<WeeklyCharge #{self.id}: ${self.amount} on {self.charge_date} ({self.status})>'
+
+
+# ========================================
+# RoiAggregate 模型（ROI 合计值物化表）
+# ========================================
+class RoiAggregate(db.Model):
+    """
+    ROI 合计值物化表（只有一行，id=1）
+
+    用途：保存 ROI 计算需要的运行合计值，
+    每次写入活动/支出/合同时在同一事务里按差值（delta）更新，
+    这样 /api/roi/summary 只需读一行，不用每次全表求和。
+
+    字段说明：
+    - id: 主键（固定为 1）
+    - weighted_total: 所有活动的加权次数总和
+    - total_activities: 活动总数
+    - paid_total: 已付支出总额（全额支出 + 已付分期子支出）
+    - planned_total: 计划支出总额（全额支出 + 分期合同父支出）
+    - updated_at: 更新时间
+    """
+
+    __tablename__ = 'roi_aggregates'  # 表名
+
+    # 主键（只有一行，固定为 1）
+    id = db.Column(db.Integer, primary_key=True)
+
+    # 活动合计
+    weighted_total = db.Column(db.Float, default=0.0, nullable=False)
+    total_activities = db.Column(db.Integer, default=0, nullable=False)
+
+    # 支出合计
+    paid_total = db.Column(db.Float, default=0.0, nullable=False)
+    planned_total = db.Column(db.Float, default=0.0, nullable=False)
+
+    # 更新时间
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        """
+        将数据库记录转换为 Python 字典
+
+        返回:
+        {
+          "weighted_total": 5.66,
+          "total_activities": 4,
+          "paid_total": 204.0,
+          "planned_total": 916.0,
+          "updated_at": "2025-10-18T10:30:15"
+        }
+        """
+        return {
+            'weighted_total': self.weighted_total,
+            'total_activities': self.total_activities,
+            'paid_total': self.paid_total,
+            'planned_total': self.planned_total,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        """
+        打印对象时的显示格式
+
+        示例：<RoiAggregate paid=204.0 planned=916.0 weighted=5.66>
+        """
+        return f'<RoiAggregate paid={self.paid_total} planned={self.planned_total} weighted={self.weighted_total}>'
@@ -7,7 +7,7 @@
 - 创建/更新活动时，自动调用高斯函数计算游泳权重
 
 接口：
-- GET    /api/activities       - 获取所有活动
+- GET    /api/activities       - 获取活动列表（游标分页 + 日期/类型过滤）
 - POST   /api/activities       - 创建新活动（自动计算权重）
 - PUT    /api/activities/<id>  - 更新指定活动（重新计算权重）
 - DELETE /api/activities/<id>  - 删除指定活动
@@ -15,7 +15,10 @@
 
 from flask import Blueprint, request, jsonify
 from models import db, Activity
-from utils.gaussian import calculate_swimming_weight
+from utils.pagination import keyset_page, parse_limit, parse_date_range, is_truthy
+from utils.gaussian import get_swimming_weight
+from utils.roi import apply_roi_delta
+from utils.weight_model import get_weight_model
 from datetime import datetime
 
 # 创建蓝图
@@ -28,27 +31,63 @@ activities_bp = Blueprint('activities', __name__)
 @activities_bp.route('/api/activities', methods=['GET'])
 def get_activities():
     """
-    获取所有活动记录
+    获取活动记录（游标分页，按日期倒序）
+
+    查询参数（均可选）:
+        limit:  每页条数（默认 20，最大 200）
+        cursor: 上一页返回的 next_cursor
+        from:   开始日期（含），YYYY-MM-DD
+        to:     结束日期（含），YYYY-MM-DD
+        type:   活动类型（如 swimming）
+        all:    true 时返回旧格式（不分页的完整数组，兼容旧前端）
 
     返回:
-    [
-      {
-        "id": 1,
-        "type": "swimming",
-        "date": "2025-10-17",
-        "distance": 1500,
-        "calculated_weight": 1.64,
-        "note": "状态不错"
-      },
-      ...
-    ]
+    {
+      "items": [
+        {
+          "id": 1,
+          "type": "swimming",
+          "date": "2025-10-17",
+          "distance": 1500,
+          "calculated_weight": 1.64,
+          "note": "状态不错"
+        },
+        ...
+      ],
+      "next_cursor": "MjAyNS0xMC0xN3wx",   // 没有下一页时为 null
+      "has_more": true,
+      "limit": 20
+    }
     """
     try:
-        # 查询所有活动，按日期倒序排列
-        activities = Activity.query.order_by(Activity.date.desc()).all()
+        args = request.args
+
+        # 过滤条件
+        query = Activity.query
+        query = parse_date_range(args, query, Activity.date)
+        if args.get('type'):
+            query = query.filter(Activity.type == args['type'])
+
+        # 兼容旧接口：返回完整数组
+        if is_truthy(args.get('all')):
+            activities = query.order_by(Activity.date.desc()).all()
+            return jsonify([activity.to_dict() for activity in activities]), 200
+
+        # 游标分页（(date, id) 复合索引）
+        limit = parse_limit(args.get('limit'))
+        activities, next_cursor = keyset_page(
+            query, Activity.date, Activity.id, args.get('cursor'), limit
+        )
 
-        # 转换为字典列表
-        return jsonify([activity.to_dict() for activity in activities]), 200
+        return jsonify({
+            'items': [activity.to_dict() for activity in activities],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'limit': limit
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': f'参数错误：{str(e)}'}), 400
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -101,9 +140,11 @@ def create_activity():
         if not data.get('distance'):
             return jsonify({'error': '游泳活动缺少必填字段：distance'}), 400
 
-        # ⭐ 核心逻辑：调用高斯函数计算权重
+        # ⭐ 核心逻辑：调用高斯函数计算权重（查表，同一组参数只算一次整张表）
+        # 使用当前配置的权重模型参数，并记录参数版本
         distance = int(data['distance'])
-        calculated_weight = calculate_swimming_weight(distance)
+        model = get_weight_model()
+        calculated_weight = get_swimming_weight(distance, model['baseline'], model['sigma'])
 
         # 创建 Activity 对象
         activity = Activity(
@@ -111,11 +152,16 @@ def create_activity():
             date=datetime.fromisoformat(data['date']),
             distance=distance,
             calculated_weight=calculated_weight,  # 存储计算结果
+            weight_model_version=model['version'],
             note=data.get('note')
         )
 
         # 添加到数据库
         db.session.add(activity)
+
+        # 同一事务里更新 ROI 合计表
+        apply_roi_delta(weighted=calculated_weight, activities=1)
+
         db.session.commit()
 
         # 返回创建的对象
@@ -187,7 +233,15 @@ def update_activity(id):
 
         # ⭐ 如果距离改变，重新计算权重
         if distance_changed:
-            activity.calculated_weight = calculate_swimming_weight(activity.distance)
+            old_weight = activity.calculated_weight or 0.0
+            model = get_weight_model()
+            activity.calculated_weight = get_swimming_weight(
+                activity.distance, model['baseline'], model['sigma']
+            )
+            activity.weight_model_version = model['version']
+
+            # 同一事务里更新 ROI 合计表（只加权重差值）
+            apply_roi_delta(weighted=activity.calculated_weight - old_weight)
 
         # 提交事务
         db.session.commit()
@@ -224,8 +278,9 @@ def delete_activity(id):
         # 查询活动记录
         activity = Activity.query.get_or_404(id)
 
-        # 删除
+        # 删除，并在同一事务里扣减 ROI 合计表
         db.session.delete(activity)
+        apply_roi_delta(weighted=-(activity.calculated_weight or 0.0), activities=-1)
         db.session.commit()
 
         # 返回 204 No Content
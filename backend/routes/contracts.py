@@ -5,104 +5,44 @@
 
 接口：
 - POST /api/contracts              - 创建分期合同并生成周扣费记录
-- GET /api/contracts               - 获取所有合同
-- GET /api/contracts/:id           - 获取合同详情及扣费列表
-- PUT /api/contracts/:id           - 更新合同并重新生成扣费记录
+- POST /api/contracts/preview      - 预览扣费计划（只读）
+- GET /api/contracts               - 获取所有合同（含已付 / 待付进度）
+- GET /api/contracts/:id           - 获取合同详情及扣费列表（按状态 / 日期过滤，游标分页）
+- GET /api/contracts/totals/check  - 检查合同总金额与扣费金额之和是否一致
+- GET /api/contracts/settlement    - 后台自动结算线程的状态
+- PUT /api/contracts/:id           - 更新合同并按新规则调整扣费记录
 - PUT /api/contracts/:id/charges/:charge_id  - 更新某期扣费
+- PUT /api/contracts/:id/charges/by-date/:date  - 按日期更新某期扣费（可覆盖虚拟扣费计划中的待付期数）
+- PATCH /api/contracts/:id/charges  - 批量更新多期扣费（一个事务）
 - DELETE /api/contracts/:id        - 删除合同及所有相关记录
 - POST /api/expenses/:id/convert-to-installment  - 将全额支出转为分期
+
+扣费计划存储模式（schedule_mode，见 utils/schedule.py）：
+- materialized（默认）：每一期都存一条扣费记录
+- virtual：只存已付和被修改过的期数，其余待付期数读取时按规则生成
 """
 
 from flask import Blueprint, request, jsonify
 from models import db, Expense, MembershipContract, WeeklyCharge
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta, MO, TU, WE, TH, FR, SA, SU
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from utils.roi import apply_roi_delta
+from utils.pagination import parse_limit, is_truthy, encode_date_cursor, decode_date_cursor
+from utils.settlement import get_settlement_status
+from utils.charges import (
+    materialize_charges, reconcile_charges, plan_reconcile,
+    apply_contract_total_delta, check_contract_totals
+)
+from utils.schedule import (
+    SCHEDULE_MODES, SCHEDULE_VIRTUAL, is_virtual,
+    generate_weekly_charge_dates, contract_charge_dates, count_contract_periods,
+    list_contract_charges, load_contract_progress,
+    normalize_rule, preview_charge_dates, preview_cache_info, local_today
+)
 
 # 创建蓝图
 contracts_bp = Blueprint('contracts', __name__)
 
-# 周几映射
-WEEKDAY_MAP = {
-    0: MO,  # 周一
-    1: TU,  # 周二
-    2: WE,  # 周三
-    3: TH,  # 周四
-    4: FR,  # 周五
-    5: SA,  # 周六
-    6: SU   # 周日
-}
-
-
-def generate_weekly_charge_dates(start_date, end_date, day_of_week):
-    """
-    生成所有周扣费日期列表
-
-    参数:
-    - start_date: 开始日期（Date 对象）
-    - end_date: 结束日期（Date 对象）
-    - day_of_week: 扣费日（0-6，0=周一）
-
-    返回:
-    - 日期列表 [date1, date2, ...]
-    """
-    dates = []
-    current = start_date
-
-    # 找到第一个扣费日
-    # 使用 relativedelta 调整到指定的周几
-    weekday = WEEKDAY_MAP[day_of_week]
-    first_charge_date = current + relativedelta(weekday=weekday)
-
-    # 如果第一个扣费日在开始日期之前，跳到下一周
-    if first_charge_date < current:
-        first_charge_date += timedelta(weeks=1)
-
-    current = first_charge_date
-
-    # 生成所有扣费日期（不包含 end_date 本身，end_date 是最后一天的上限）
-    while current < end_date:
-        dates.append(current)
-        current += timedelta(weeks=1)
-
-    return dates
-
-
-def generate_monthly_charge_dates(start_date, end_date, day_of_month):
-    """
-    生成所有月扣费日期列表
-
-    参数:
-    - start_date: 开始日期（Date 对象）
-    - end_date: 结束日期（Date 对象）
-    - day_of_month: 每月扣费日（1-28）
-
-    返回:
-    - 日期列表 [date1, date2, ...]
-    """
-    dates = []
-    current = start_date
-
-    # 找到第一个扣费日期
-    # 如果开始日期的日期数 <= 扣费日，使用当月的扣费日
-    # 否则使用下个月的扣费日
-    if current.day <= day_of_month:
-        first_charge_date = current.replace(day=day_of_month)
-    else:
-        # 下个月
-        next_month = current + relativedelta(months=1)
-        first_charge_date = next_month.replace(day=day_of_month)
-
-    current = first_charge_date
-
-    # 生成所有扣费日期（不包含 end_date 本身，end_date 是最后一天的上限）
-    while current < end_date:
-        dates.append(current)
-        # 每次加一个月
-        current = current + relativedelta(months=1)
-
-    return dates
-
-
 # ========================================
 # POST /api/contracts - 创建分期合同
 # ========================================
@@ -121,6 +61,7 @@ def create_contract():
       "day_of_week": 0,            // 扣费日（0=周一, 6=周日）
       "start_date": "2025-01-01",  // 开始日期
       "end_date": "2025-12-31",    // 结束日期
+      "schedule_mode": "virtual",  // 可选：materialized（默认）或 virtual
       "note": "备注"
     }
 
@@ -155,6 +96,11 @@ def create_contract():
         else:
             return jsonify({'error': f'不支持的分期类型：{period_type}'}), 400
 
+        # 扣费计划存储模式
+        schedule_mode = data.get('schedule_mode', 'materialized')
+        if schedule_mode not in SCHEDULE_MODES:
+            return jsonify({'error': f'不支持的扣费计划模式：{schedule_mode}'}), 400
+
         # 解析日期
         start_date = datetime.fromisoformat(data['start_date']).date()
         end_date = datetime.fromisoformat(data['end_date']).date()
@@ -185,73 +131,41 @@ def create_contract():
             day_of_week=int(data['day_of_week']) if period_type == 'weekly' else None,
             day_of_month=int(data['day_of_month']) if period_type == 'monthly' else None,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            schedule_mode=schedule_mode
         )
         db.session.add(contract)
         db.session.flush()  # 获取 contract.id
 
-        # 3. 生成所有扣费日期（根据分期类型）
-        if period_type == 'weekly':
-            charge_dates = generate_weekly_charge_dates(start_date, end_date, contract.day_of_week)
-        else:  # monthly
-            charge_dates = generate_monthly_charge_dates(start_date, end_date, contract.day_of_month)
-
-        today = datetime.now().date()
-        paid_count = 0
-        pending_count = 0
-
-        # 4. 为每个扣费日生成记录
-        for charge_date in charge_dates:
-            # 判断状态：过去的日期 = 已付，未来的日期 = 待付
-            if charge_date <= today:
-                status = 'paid'
-                paid_count += 1
-
-                # 创建子支出记录（已付）
-                child_expense = Expense(
-                    type=data['type'],
-                    category=data.get('category', ''),
-                    amount=contract.period_amount,
-                    currency=data.get('currency', 'NZD'),
-                    date=charge_date,
-                    note=f"{data.get('category', '分期')} - 第 {paid_count} 期",
-                    parent_expense_id=parent_expense.id,
-                    is_installment=False
-                )
-                db.session.add(child_expense)
-                db.session.flush()
-
-                # 创建扣费记录（关联子支出）
-                weekly_charge = WeeklyCharge(
-                    contract_id=contract.id,
-                    expense_id=child_expense.id,
-                    charge_date=charge_date,
-                    amount=contract.period_amount,
-                    status=status
-                )
-            else:
-                status = 'pending'
-                pending_count += 1
-
-                # 创建扣费记录（待付，不创建子支出）
-                weekly_charge = WeeklyCharge(
-                    contract_id=contract.id,
-                    expense_id=None,  # 待付款时没有支出记录
-                    charge_date=charge_date,
-                    amount=contract.period_amount,
-                    status=status
-                )
+        # 3. 生成扣费日期（根据分期类型）
+        #    虚拟扣费计划只存已付的期数：只生成到今天为止的日期，总期数 O(1) 计算
+        if is_virtual(contract):
+            today = local_today()
+            charge_dates = contract_charge_dates(contract, until=today + timedelta(days=1))
+            charges_count = count_contract_periods(contract)
+        else:
+            charge_dates = contract_charge_dates(contract)
+            charges_count = len(charge_dates)
+
+        # 4. 批量生成扣费记录和已付子支出（过去的日期 = 已付，未来的日期 = 待付）
+        #    同时把已付子支出计入 ROI 合计表
+        paid_count, _ = materialize_charges(
+            contract, parent_expense, charge_dates,
+            note_prefix=data.get('category', '分期')
+        )
+        pending_count = charges_count - paid_count
 
-            db.session.add(weekly_charge)
+        # 5. 父支出计入 ROI 合计表（计划口径）
+        apply_roi_delta(planned=parent_expense.amount)
 
-        # 5. 提交所有事务
+        # 6. 提交所有事务
         db.session.commit()
 
-        # 6. 返回结果
+        # 7. 返回结果
         return jsonify({
             'contract': contract.to_dict(),
             'parent_expense': parent_expense.to_dict(),
-            'charges_count': len(charge_dates),
+            'charges_count': charges_count,
             'paid_count': paid_count,
             'pending_count': pending_count,
             'message': '合同创建成功'
@@ -266,13 +180,144 @@ def create_contract():
         return jsonify({'error': str(e)}), 500
 
 
+# ========================================
+# POST /api/contracts/preview - 预览扣费计划
+# ========================================
+@contracts_bp.route('/api/contracts/preview', methods=['POST'])
+def preview_contract():
+    """
+    预览创建 / 更新合同会生成的扣费计划（只读，不写数据库）
+
+    请求体（JSON）:
+    {
+      "period_amount": 17.0,
+      "period_type": "weekly",
+      "day_of_week": 0,
+      "start_date": "2025-01-01",
+      "end_date": "2025-12-31",
+      "schedule_mode": "materialized",   // 可选
+      "contract_id": 3                   // 可选：预览更新该合同，未提供的字段沿用合同当前值
+    }
+
+    返回:
+    {
+      "charge_dates": ["2025-01-06", ...],
+      "charges_count": 52,
+      "paid_count": 41,
+      "pending_count": 11,
+      "period_amount": 17.0,
+      "schedule_total": 884.0,          // 所有期数金额之和
+      "first_charge_date": "2025-01-06",
+      "last_charge_date": "2025-12-29",
+      "changes": {                      // 仅 contract_id 时返回，同 PUT /api/contracts/:id
+        "inserted": 0,
+        "updated": 52,
+        "deleted": 0,
+        "settled": 0
+      },
+      "cache": {"hits": 12, "misses": 3, "size": 3, "maxsize": 256}
+    }
+
+    扣费日期按规范化后的规则缓存（见 utils/schedule.py 的 preview_charge_dates），
+    表单每次输入都请求预览也不会重复计算。
+    """
+    try:
+        data = request.get_json()
+
+        # 更新预览：以合同当前值为默认值
+        contract = None
+        if data.get('contract_id') is not None:
+            contract = MembershipContract.query.get_or_404(int(data['contract_id']))
+            defaults = contract.to_dict()
+        else:
+            defaults = {'period_type': 'weekly', 'schedule_mode': 'materialized'}
+
+        def field(name):
+            return data[name] if name in data else defaults.get(name)
+
+        for name in ('period_amount', 'start_date', 'end_date'):
+            if field(name) is None:
+                return jsonify({'error': f'缺少必填字段：{name}'}), 400
+
+        # 更新合同不能切换存储模式，预览更新时以合同的模式为准
+        schedule_mode = defaults['schedule_mode'] if contract else field('schedule_mode')
+        if schedule_mode not in SCHEDULE_MODES:
+            return jsonify({'error': f'不支持的扣费计划模式：{schedule_mode}'}), 400
+
+        period_amount = float(field('period_amount'))
+        start_date = datetime.fromisoformat(field('start_date')).date()
+        end_date = datetime.fromisoformat(field('end_date')).date()
+        if start_date >= end_date:
+            return jsonify({'error': '开始日期必须早于结束日期'}), 400
+
+        rule = normalize_rule(
+            field('period_type'), field('day_of_week'), field('day_of_month'), start_date, end_date
+        )
+        charge_dates = preview_charge_dates(rule)
+        today = local_today()
+
+        result = {
+            'charge_dates': [d.isoformat() for d in charge_dates],
+            'charges_count': len(charge_dates),
+            'period_amount': period_amount,
+            'first_charge_date': charge_dates[0].isoformat() if charge_dates else None,
+            'last_charge_date': charge_dates[-1].isoformat() if charge_dates else None
+        }
+
+        if contract is None:
+            # 创建：日期 <= 今天的期数为已付
+            paid_count = bisect_right(charge_dates, today)
+            schedule_total = len(charge_dates) * period_amount
+        else:
+            # 更新：与 reconcile_charges 使用同一套差异计算
+            stored = db.session.execute(
+                db.select(WeeklyCharge.charge_date, WeeklyCharge.amount, WeeklyCharge.status)
+                .where(WeeklyCharge.contract_id == contract.id)
+            ).all()
+            removed, kept, repriced, added, settled = plan_reconcile(
+                stored, charge_dates, period_amount, contract.period_amount,
+                schedule_mode == SCHEDULE_VIRTUAL, today
+            )
+            repriced_dates = {row.charge_date for row in repriced}
+
+            paid_count = (
+                sum(1 for row in kept if row.status == 'paid')
+                + len(settled)
+                + sum(1 for d in added if d <= today)
+            )
+            schedule_total = (
+                sum(period_amount if row.charge_date in repriced_dates else row.amount for row in kept)
+                + (len(charge_dates) - len(kept)) * period_amount
+            )
+            result['changes'] = {
+                'inserted': len(added),
+                'updated': len(repriced),
+                'deleted': len(removed),
+                'settled': len(settled)
+            }
+
+        result.update(
+            paid_count=paid_count,
+            pending_count=len(charge_dates) - paid_count,
+            schedule_total=round(schedule_total, 2),
+            cache=preview_cache_info()
+        )
+        return jsonify(result), 200
+
+    except ValueError as e:
+        return jsonify({'error': f'数据格式错误：{str(e)}'}), 400
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ========================================
 # GET /api/contracts - 获取所有合同
 # ========================================
 @contracts_bp.route('/api/contracts', methods=['GET'])
 def get_all_contracts():
     """
-    获取所有合同列表
+    获取所有合同列表（含扣费进度，进度用一条 GROUP BY 查询批量统计）
 
     返回:
     [
@@ -281,12 +326,66 @@ def get_all_contracts():
         "total_amount": 916.0,
         "weekly_amount": 17.0,
         ...
+        "paid_count": 41,
+        "pending_count": 11,
+        "paid_amount": 697.0,
+        "remaining_amount": 187.0,
+        "next_charge_date": "2025-10-20"
       }
     ]
     """
     try:
         contracts = MembershipContract.query.all()
-        return jsonify([contract.to_dict() for contract in contracts]), 200
+        progress = load_contract_progress(contracts)
+        return jsonify([
+            dict(contract.to_dict(), **progress[contract.id]) for contract in contracts
+        ]), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# GET /api/contracts/totals/check - 合同总金额一致性检查
+# ========================================
+@contracts_bp.route('/api/contracts/totals/check', methods=['GET'])
+def check_totals():
+    """
+    对比每份合同的总金额（增量维护）与扣费金额全量 SUM
+
+    返回:
+    {
+      "consistent": true,
+      "checked": 3,
+      "mismatches": []
+    }
+    """
+    try:
+        return jsonify(check_contract_totals()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# GET /api/contracts/settlement - 后台自动结算状态
+# ========================================
+@contracts_bp.route('/api/contracts/settlement', methods=['GET'])
+def get_settlement():
+    """
+    查询后台自动结算线程的状态（见 utils/settlement.py）
+
+    返回:
+    {
+      "status": "running",       // stopped（没有设置 SETTLEMENT_INTERVAL 时）/ running
+      "interval": 3600,
+      "last_run_at": "2025-10-18T10:30:15",
+      "last_result": {"today": "2025-10-18", "settled": 1, "virtual_settled": 0, "amount": 17.0},
+      "error": null
+    }
+    """
+    try:
+        return jsonify(get_settlement_status()), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -298,23 +397,87 @@ def get_all_contracts():
 @contracts_bp.route('/api/contracts/<int:id>', methods=['GET'])
 def get_contract(id):
     """
-    获取合同详情及所有扣费记录
+    获取合同详情及扣费记录（按扣费日期升序，游标分页）
+
+    虚拟扣费计划中未存储的待付期数按规则生成（id 为 null，virtual 为 true），
+    修改这些期数请用 PUT /api/contracts/:id/charges/by-date/:date。
+
+    查询参数（均可选）:
+        status: 只返回该状态的扣费（paid / pending）
+        from:   开始日期（含），YYYY-MM-DD
+        to:     结束日期（含），YYYY-MM-DD
+        limit:  每页条数（默认 20，最大 200）
+        cursor: 上一页返回的 next_cursor
+        all:    true 时返回过滤后的全部扣费（不分页，兼容旧前端）
+
+    例：详情页只加载接下来的待付期数
+        GET /api/contracts/1?status=pending&from=2025-10-17&limit=10
 
     返回:
     {
       "contract": {...},
-      "charges": [...]
+      "charges": [...],
+      "next_cursor": "MjAyNS0xMi0yNg==",   // 没有下一页时为 null（all=true 时不返回）
+      "has_more": true,
+      "limit": 20,
+      "summary": {                         // 整个合同的统计（不受过滤条件影响，SQL 聚合）
+        "total_periods": 104,
+        "paid_count": 41,
+        "pending_count": 63,
+        "paid_amount": 410.0,
+        "remaining_amount": 630.0,
+        "next_charge_date": "2025-10-20"
+      }
     }
     """
     try:
         contract = MembershipContract.query.get_or_404(id)
-        charges = WeeklyCharge.query.filter_by(contract_id=id).order_by(WeeklyCharge.charge_date).all()
+        args = request.args
+
+        status = args.get('status') or None
+        if status and status not in ('paid', 'pending'):
+            raise ValueError(f'无效的状态：{status}')
+
+        filters = {
+            'status': status,
+            'date_from': date.fromisoformat(args['from']) if args.get('from') else None,
+            'date_to': date.fromisoformat(args['to']) if args.get('to') else None
+        }
+
+        # 整个合同的统计：一条 GROUP BY 查询
+        progress = load_contract_progress([contract])[contract.id]
+        summary = dict(total_periods=progress['paid_count'] + progress['pending_count'], **progress)
+
+        # 兼容旧接口：返回全部扣费
+        if is_truthy(args.get('all')):
+            return jsonify({
+                'contract': contract.to_dict(),
+                'charges': list_contract_charges(contract, **filters),
+                'summary': summary
+            }), 200
+
+        # 游标分页：多取一条，用来判断是否还有下一页
+        limit = parse_limit(args.get('limit'))
+        after = decode_date_cursor(args['cursor']) if args.get('cursor') else None
+        charges = list_contract_charges(contract, after=after, limit=limit + 1, **filters)
+
+        next_cursor = None
+        if len(charges) > limit:
+            charges = charges[:limit]
+            next_cursor = encode_date_cursor(date.fromisoformat(charges[-1]['charge_date']))
 
         return jsonify({
             'contract': contract.to_dict(),
-            'charges': [charge.to_dict() for charge in charges]
+            'charges': charges,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'limit': limit,
+            'summary': summary
         }), 200
 
+    except ValueError as e:
+        return jsonify({'error': f'参数错误：{str(e)}'}), 400
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -346,71 +509,79 @@ def update_charge(id, charge_id):
         if charge.contract_id != id:
             return jsonify({'error': '扣费记录不属于该合同'}), 400
 
-        data = request.get_json()
+        paid_delta, total_delta = _apply_charge_update(charge, request.get_json())
+        apply_roi_delta(paid=paid_delta)
 
-        # 更新金额
-        if 'amount' in data:
-            new_amount = float(data['amount'])
-            charge.amount = new_amount
+        # 🔄 合同总金额和父支出金额按差值增量更新
+        apply_contract_total_delta(charge.contract, total_delta)
 
-            # 🔄 同步更新相关记录
-            # 如果该期已付，需要同步更新对应的子支出
-            if charge.status == 'paid' and charge.expense_id:
-                child_expense = Expense.query.get(charge.expense_id)
-                if child_expense:
-                    child_expense.amount = new_amount
-
-            # 🔄 重新计算合同总金额（已付 + 待付）
-            contract = MembershipContract.query.get(charge.contract_id)
-            if contract:
-                all_charges = WeeklyCharge.query.filter_by(contract_id=contract.id).all()
-                new_total = sum(c.amount for c in all_charges)
-                contract.total_amount = new_total
-
-                # 🔄 同步更新父 expense 的金额
-                parent_expense = Expense.query.get(contract.expense_id)
-                if parent_expense:
-                    parent_expense.amount = new_total
-
-        # 更新状态
-        if 'status' in data:
-            new_status = data['status']
-
-            # 如果从 pending 变为 paid，需要创建子支出
-            if charge.status == 'pending' and new_status == 'paid':
-                contract = MembershipContract.query.get(charge.contract_id)
-                parent_expense = Expense.query.get(contract.expense_id)
-
-                # 创建子支出
-                child_expense = Expense(
-                    type=parent_expense.type,
-                    category=parent_expense.category,
-                    amount=charge.amount,
-                    currency=parent_expense.currency,
-                    date=charge.charge_date,
-                    note=f"{parent_expense.category} - 补录",
-                    parent_expense_id=parent_expense.id,
-                    is_installment=False
-                )
-                db.session.add(child_expense)
-                db.session.flush()
+        db.session.commit()
+
+        return jsonify({
+            'charge': charge.to_dict(),
+            'message': '更新成功'
+        }), 200
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': f'数据格式错误：{str(e)}'}), 400
 
-                charge.expense_id = child_expense.id
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
-            # 如果从 paid 变为 pending，删除子支出
-            elif charge.status == 'paid' and new_status == 'pending':
-                if charge.expense_id:
-                    child_expense = Expense.query.get(charge.expense_id)
-                    if child_expense:
-                        db.session.delete(child_expense)
-                    charge.expense_id = None
 
-            charge.status = new_status
+# ========================================
+# PUT /api/contracts/:id/charges/by-date/:date - 按日期更新扣费记录
+# ========================================
+@contracts_bp.route('/api/contracts/<int:id>/charges/by-date/<charge_date>', methods=['PUT'])
+def update_charge_by_date(id, charge_date):
+    """
+    按扣费日期更新某期扣费（请求体同 PUT /api/contracts/:id/charges/:charge_id）
+
+    虚拟扣费计划中的待付期数没有存储记录（id 为 null），
+    第一次修改时按规则生成一条覆盖记录，之后与普通扣费记录一样。
+
+    返回:
+    {
+      "charge": {...},
+      "created": true,     // 是否新建了覆盖记录
+      "message": "更新成功"
+    }
+    """
+    try:
+        contract = MembershipContract.query.get_or_404(id)
+        charge_date = datetime.fromisoformat(charge_date).date()
+
+        charge = WeeklyCharge.query.filter_by(contract_id=id, charge_date=charge_date).first()
+        created = charge is None
+
+        if created:
+            # 只有规则里存在的日期才能覆盖
+            if charge_date not in contract_charge_dates(contract):
+                return jsonify({'error': f'{charge_date.isoformat()} 不是该合同的扣费日'}), 404
+
+            charge = WeeklyCharge(
+                contract_id=id,
+                expense_id=None,
+                charge_date=charge_date,
+                amount=contract.period_amount,
+                status='pending'
+            )
+            db.session.add(charge)
+            db.session.flush()
+
+        paid_delta, total_delta = _apply_charge_update(charge, request.get_json())
+        apply_roi_delta(paid=paid_delta)
+
+        # 🔄 合同总金额和父支出金额按差值增量更新
+        apply_contract_total_delta(charge.contract, total_delta)
 
         db.session.commit()
 
         return jsonify({
             'charge': charge.to_dict(),
+            'created': created,
             'message': '更新成功'
         }), 200
 
@@ -423,13 +594,198 @@ def update_charge(id, charge_id):
         return jsonify({'error': str(e)}), 500
 
 
+# ========================================
+# PATCH /api/contracts/:id/charges - 批量更新扣费记录
+# ========================================
+@contracts_bp.route('/api/contracts/<int:id>/charges', methods=['PATCH'])
+def batch_update_charges(id):
+    """
+    批量更新多期扣费（一个事务，合同总金额只在最后按累计差值更新一次）
+
+    请求体（JSON）:
+    {
+      "charges": [
+        {"charge_id": 12, "amount": 15.0},
+        {"charge_id": 13, "status": "paid"},
+        {"charge_date": "2026-03-02", "status": "paid"}   // 虚拟扣费计划的期数没有 id，可以按日期指定
+      ]
+    }
+
+    返回:
+    {
+      "charges": [...],        // 更新后的扣费记录（按请求顺序）
+      "updated_count": 3,
+      "contract": {...},
+      "message": "批量更新成功"
+    }
+
+    任意一条不合法（不属于该合同、日期不是扣费日、状态不支持）时整批不生效。
+    """
+    try:
+        contract = MembershipContract.query.get_or_404(id)
+        data = request.get_json()
+
+        items = data.get('charges') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': '缺少必填字段：charges'}), 400
+
+        # 1. 一次查询取出所有按 id 指定的扣费记录（连同子支出）
+        charge_ids = {int(item['charge_id']) for item in items if item.get('charge_id') is not None}
+        by_id = {}
+        if charge_ids:
+            rows = WeeklyCharge.query.options(db.joinedload(WeeklyCharge.child_expense)) \
+                .filter(WeeklyCharge.id.in_(charge_ids)).all()
+            by_id = {charge.id: charge for charge in rows}
+
+        missing = sorted(charge_ids - {charge_id for charge_id, charge in by_id.items() if charge.contract_id == id})
+        if missing:
+            return jsonify({'error': f'扣费记录不属于该合同：{missing}'}), 400
+
+        # 按日期指定的期数：已存储的直接取，虚拟的先生成覆盖记录
+        by_date = {}
+        charge_dates = {
+            datetime.fromisoformat(item['charge_date']).date()
+            for item in items if item.get('charge_id') is None and item.get('charge_date')
+        }
+        if charge_dates:
+            rows = WeeklyCharge.query.options(db.joinedload(WeeklyCharge.child_expense)) \
+                .filter(WeeklyCharge.contract_id == id, WeeklyCharge.charge_date.in_(charge_dates)).all()
+            by_date = {charge.charge_date: charge for charge in rows}
+
+            schedule = set(contract_charge_dates(contract))
+            for charge_date in sorted(charge_dates - set(by_date)):
+                if charge_date not in schedule:
+                    return jsonify({'error': f'{charge_date.isoformat()} 不是该合同的扣费日'}), 400
+                by_date[charge_date] = WeeklyCharge(
+                    contract=contract,
+                    charge_date=charge_date,
+                    amount=contract.period_amount,
+                    status='pending'
+                )
+                db.session.add(by_date[charge_date])
+
+        # 2. 逐条修改（金额变化累加后只写一次 ROI 合计表和合同总金额）
+        updated = []
+        paid_delta = 0.0
+        total_delta = 0.0
+        with db.session.no_autoflush:
+            for item in items:
+                if item.get('charge_id') is not None:
+                    charge = by_id[int(item['charge_id'])]
+                elif item.get('charge_date'):
+                    charge = by_date[datetime.fromisoformat(item['charge_date']).date()]
+                else:
+                    raise ValueError('每一项都需要 charge_id 或 charge_date')
+
+                item_paid_delta, item_total_delta = _apply_charge_update(charge, item)
+                paid_delta += item_paid_delta
+                total_delta += item_total_delta
+                updated.append(charge)
+
+        apply_roi_delta(paid=paid_delta)
+
+        # 3. 合同总金额和父支出金额：按累计差值增量更新一次
+        apply_contract_total_delta(contract, total_delta)
+
+        # 提交前序列化（提交后对象会过期，逐条重新查询）
+        db.session.flush()
+        charges = [charge.to_dict() for charge in updated]
+        contract_dict = contract.to_dict()
+
+        db.session.commit()
+
+        return jsonify({
+            'charges': charges,
+            'updated_count': len(updated),
+            'contract': contract_dict,
+            'message': '批量更新成功'
+        }), 200
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': f'数据格式错误：{str(e)}'}), 400
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def _apply_charge_update(charge, data):
+    """
+    按请求体修改一条扣费记录，并同步子支出（不提交）
+
+    返回:
+        tuple: (paid_delta, total_delta)
+        - paid_delta: 已付金额的变化量（计入 ROI 合计表）
+        - total_delta: 扣费金额的变化量（计入合同总金额和父支出，见 apply_contract_total_delta）
+        由调用方统一写入，批量更新时累加后只写一次
+
+    异常:
+        ValueError: 状态不是 paid / pending
+    """
+    paid_delta = 0.0
+    total_delta = 0.0
+
+    # 更新金额
+    if 'amount' in data:
+        new_amount = float(data['amount'])
+        total_delta = new_amount - charge.amount
+        charge.amount = new_amount
+
+        # 🔄 同步更新相关记录
+        # 如果该期已付，需要同步更新对应的子支出
+        if charge.status == 'paid' and charge.child_expense:
+            paid_delta += new_amount - charge.child_expense.amount
+            charge.child_expense.amount = new_amount
+
+    # 更新状态
+    if 'status' in data:
+        new_status = data['status']
+        if new_status not in ('paid', 'pending'):
+            raise ValueError(f'不支持的扣费状态：{new_status}')
+
+        # 如果从 pending 变为 paid，需要创建子支出
+        if charge.status == 'pending' and new_status == 'paid':
+            parent_expense = charge.contract.parent_expense
+
+            # 创建子支出（通过关系关联，提交时一起写入，不需要单独 flush）
+            charge.child_expense = Expense(
+                type=parent_expense.type,
+                category=parent_expense.category,
+                amount=charge.amount,
+                currency=parent_expense.currency,
+                date=charge.charge_date,
+                note=f"{parent_expense.category} - 补录",
+                parent_expense_id=parent_expense.id,
+                is_installment=False
+            )
+            paid_delta += charge.amount
+
+        # 如果从 paid 变为 pending，删除子支出
+        elif charge.status == 'paid' and new_status == 'pending':
+            if charge.child_expense:
+                paid_delta -= charge.child_expense.amount
+                db.session.delete(charge.child_expense)
+            charge.child_expense = None
+
+        charge.status = new_status
+
+    return paid_delta, total_delta
+
+
 # ========================================
 # PUT /api/contracts/:id - 更新合同
 # ========================================
 @contracts_bp.route('/api/contracts/<int:id>', methods=['PUT'])
 def update_contract(id):
     """
-    更新合同并重新生成扣费记录
+    更新合同，并按新规则调整扣费记录
+
+    按扣费日期比较新旧计划（见 utils/charges.py 的 reconcile_charges），
+    只新增 / 修改 / 删除有变化的扣费记录，不再全部删除后重建：
+    - 保留的期数 id、已付状态、子支出都不变
+    - 单独修改过金额的期数保持原金额
+    - 已到期但还是待付的期数改为已付并生成子支出（与以前整体重建时一致）
 
     请求体（JSON）:
     {
@@ -446,12 +802,19 @@ def update_contract(id):
     {
       "contract": {...},
       "charges_count": 52,
+      "paid_count": 40,
+      "pending_count": 12,
+      "inserted": 0,        // 新增的扣费记录数
+      "updated": 52,        // 改了金额的扣费记录数
+      "deleted": 0,         // 删除的扣费记录数
+      "settled": 1,         // 已到期、从待付改为已付的扣费记录数
       "message": "合同更新成功"
     }
     """
     try:
         contract = MembershipContract.query.get_or_404(id)
         parent_expense = Expense.query.get(contract.expense_id)
+        old_period_amount = contract.period_amount
 
         if not parent_expense:
             return jsonify({'error': '未找到关联的父支出'}), 404
@@ -461,7 +824,8 @@ def update_contract(id):
         # 更新合同字段
         if 'total_amount' in data:
             contract.total_amount = float(data['total_amount'])
-            parent_expense.amount = float(data['total_amount'])
+            apply_roi_delta(planned=contract.total_amount - parent_expense.amount)
+            parent_expense.amount = contract.total_amount
 
         if 'period_amount' in data:
             contract.period_amount = float(data['period_amount'])
@@ -486,97 +850,22 @@ def update_contract(id):
         if contract.start_date >= contract.end_date:
             return jsonify({'error': '开始日期必须早于结束日期'}), 400
 
-        # 1. 保存已付款期的状态（日期 -> 是否已付）
-        old_charges = WeeklyCharge.query.filter_by(contract_id=id).all()
-        paid_dates = set()
-        for charge in old_charges:
-            if charge.status == 'paid':
-                paid_dates.add(charge.charge_date)
+        # 按扣费日期比较新旧计划，只插入 / 更新 / 删除需要改动的记录
+        # （保留原有记录的 id、已付状态和单独修改过的金额）
+        charge_dates = contract_charge_dates(contract)
+        changes = reconcile_charges(contract, parent_expense, charge_dates, old_period_amount)
 
-        # 2. 删除所有旧的子支出记录
-        for charge in old_charges:
-            if charge.expense_id:
-                child_expense = Expense.query.get(charge.expense_id)
-                if child_expense:
-                    db.session.delete(child_expense)
-
-        # 3. 删除所有旧的扣费记录
-        WeeklyCharge.query.filter_by(contract_id=id).delete()
-
-        # 4. 重新生成扣费日期（根据新的分期类型）
-        if contract.period_type == 'weekly':
-            if contract.day_of_week is None:
-                return jsonify({'error': '周扣费模式需要提供 day_of_week'}), 400
-            charge_dates = generate_weekly_charge_dates(
-                contract.start_date,
-                contract.end_date,
-                contract.day_of_week
-            )
-        elif contract.period_type == 'monthly':
-            if contract.day_of_month is None:
-                return jsonify({'error': '月扣费模式需要提供 day_of_month'}), 400
-            charge_dates = generate_monthly_charge_dates(
-                contract.start_date,
-                contract.end_date,
-                contract.day_of_month
-            )
-        else:
-            return jsonify({'error': f'不支持的分期类型：{contract.period_type}'}), 400
-
-        today = datetime.now().date()
-        paid_count = 0
-        pending_count = 0
-
-        # 5. 创建新的扣费记录
-        for charge_date in charge_dates:
-            # 如果这个日期之前已经支付过，或者日期在今天之前，标记为已付
-            if charge_date in paid_dates or charge_date <= today:
-                status = 'paid'
-                paid_count += 1
-
-                # 创建新的子支出
-                child_expense = Expense(
-                    type=parent_expense.type,
-                    category=parent_expense.category,
-                    amount=contract.period_amount,
-                    currency=parent_expense.currency,
-                    date=charge_date,
-                    note=f"{parent_expense.category} - 第 {paid_count} 期",
-                    parent_expense_id=parent_expense.id,
-                    is_installment=False
-                )
-                db.session.add(child_expense)
-                db.session.flush()
-
-                weekly_charge = WeeklyCharge(
-                    contract_id=contract.id,
-                    expense_id=child_expense.id,
-                    charge_date=charge_date,
-                    amount=contract.period_amount,
-                    status=status
-                )
-            else:
-                status = 'pending'
-                pending_count += 1
-
-                weekly_charge = WeeklyCharge(
-                    contract_id=contract.id,
-                    expense_id=None,
-                    charge_date=charge_date,
-                    amount=contract.period_amount,
-                    status=status
-                )
-
-            db.session.add(weekly_charge)
-
-        # 6. 提交所有更改
         db.session.commit()
 
         return jsonify({
             'contract': contract.to_dict(),
             'charges_count': len(charge_dates),
-            'paid_count': paid_count,
-            'pending_count': pending_count,
+            'paid_count': changes['paid_count'],
+            'pending_count': changes['pending_count'],
+            'inserted': changes['inserted'],
+            'updated': changes['updated'],
+            'deleted': changes['deleted'],
+            'settled': changes['settled'],
             'message': '合同更新成功'
         }), 200
 
@@ -607,12 +896,14 @@ def delete_contract(id):
         contract = MembershipContract.query.get_or_404(id)
         parent_expense_id = contract.expense_id
 
-        # 1. 删除所有已付的子支出
+        # 1. 删除所有已付的子支出（同时从 ROI 合计表扣除）
         charges = WeeklyCharge.query.filter_by(contract_id=id).all()
         for charge in charges:
             if charge.expense_id:
                 child_expense = Expense.query.get(charge.expense_id)
                 if child_expense:
+                    if charge.status == 'paid':
+                        apply_roi_delta(paid=-child_expense.amount)
                     db.session.delete(child_expense)
 
         # 2. 删除合同（会级联删除所有 weekly_charges）
@@ -621,6 +912,7 @@ def delete_contract(id):
         # 3. 删除父支出
         parent_expense = Expense.query.get(parent_expense_id)
         if parent_expense:
+            apply_roi_delta(planned=-parent_expense.amount)
             db.session.delete(parent_expense)
 
         db.session.commit()
@@ -673,13 +965,16 @@ def convert_to_installment(id):
         end_date = datetime.fromisoformat(data['end_date']).date()
 
         # 将原支出标记为分期合同
+        # （ROI 合计表：原来计入已付的全额，现在只计入计划）
         expense.is_installment = True
+        apply_roi_delta(paid=-expense.amount)
 
-        # 创建合同记录
+        # 创建合同记录（周扣费）
         contract = MembershipContract(
             expense_id=expense.id,
             total_amount=expense.amount,
-            weekly_amount=float(data['weekly_amount']),
+            period_amount=float(data['weekly_amount']),
+            period_type='weekly',
             day_of_week=int(data['day_of_week']),
             start_date=start_date,
             end_date=end_date
@@ -687,48 +982,9 @@ def convert_to_installment(id):
         db.session.add(contract)
         db.session.flush()
 
-        # 生成周扣费记录（逻辑同上）
+        # 批量生成周扣费记录和已付子支出（逻辑同上）
         charge_dates = generate_weekly_charge_dates(start_date, end_date, contract.day_of_week)
-
-        today = datetime.now().date()
-        paid_count = 0
-
-        for charge_date in charge_dates:
-            if charge_date <= today:
-                status = 'paid'
-                paid_count += 1
-
-                child_expense = Expense(
-                    type=expense.type,
-                    category=expense.category,
-                    amount=contract.weekly_amount,
-                    currency=expense.currency,
-                    date=charge_date,
-                    note=f"{expense.category} - 第 {paid_count} 期",
-                    parent_expense_id=expense.id,
-                    is_installment=False
-                )
-                db.session.add(child_expense)
-                db.session.flush()
-
-                weekly_charge = WeeklyCharge(
-                    contract_id=contract.id,
-                    expense_id=child_expense.id,
-                    charge_date=charge_date,
-                    amount=contract.weekly_amount,
-                    status=status
-                )
-            else:
-                status = 'pending'
-                weekly_charge = WeeklyCharge(
-                    contract_id=contract.id,
-                    expense_id=None,
-                    charge_date=charge_date,
-                    amount=contract.weekly_amount,
-                    status=status
-                )
-
-            db.session.add(weekly_charge)
+        materialize_charges(contract, expense, charge_dates)
 
         db.session.commit()
 
@@ -4,14 +4,17 @@
 提供 CRUD 操作（创建、读取、更新、删除）
 
 接口：
-- GET    /api/expenses       - 获取所有支出
+- GET    /api/expenses       - 获取支出列表（游标分页 + 日期/类型/分类过滤）
 - POST   /api/expenses       - 创建新支出
 - PUT    /api/expenses/<id>  - 更新指定支出
 - DELETE /api/expenses/<id>  - 删除指定支出
 """
 
 from flask import Blueprint, request, jsonify
-from models import db, Expense
+from models import db, Expense, WeeklyCharge
+from utils.pagination import keyset_page, parse_limit, parse_date_range, is_truthy
+from utils.roi import apply_roi_delta, expense_roi_contribution, rebuild_roi_aggregates
+from utils.charges import apply_contract_total_delta
 from datetime import datetime
 
 # 创建蓝图（Blueprint）
@@ -25,28 +28,67 @@ expenses_bp = Blueprint('expenses', __name__)
 @expenses_bp.route('/api/expenses', methods=['GET'])
 def get_expenses():
     """
-    获取所有支出记录
+    获取支出记录（游标分页，按日期倒序，最新的在前）
+
+    查询参数（均可选）:
+        limit:    每页条数（默认 20，最大 200）
+        cursor:   上一页返回的 next_cursor
+        from:     开始日期（含），YYYY-MM-DD
+        to:       结束日期（含），YYYY-MM-DD
+        type:     支出类型（如 membership）
+        category: 分类（如 年卡）
+        all:      true 时返回旧格式（不分页的完整数组，兼容旧前端）
 
     返回:
-    [
-      {
-        "id": 1,
-        "type": "membership",
-        "category": "年卡",
-        "amount": 816.0,
-        "currency": "NZD",
-        "date": "2025-10-17",
-        "note": "周扣费年卡"
-      },
-      ...
-    ]
+    {
+      "items": [
+        {
+          "id": 1,
+          "type": "membership",
+          "category": "年卡",
+          "amount": 816.0,
+          "currency": "NZD",
+          "date": "2025-10-17",
+          "note": "周扣费年卡"
+        },
+        ...
+      ],
+      "next_cursor": "MjAyNS0xMC0xN3wx",   // 没有下一页时为 null
+      "has_more": true,
+      "limit": 20
+    }
     """
     try:
-        # 查询所有支出，按日期倒序排列（最新的在前）
-        expenses = Expense.query.order_by(Expense.date.desc()).all()
+        args = request.args
+
+        # 过滤条件
+        query = Expense.query
+        query = parse_date_range(args, query, Expense.date)
+        if args.get('type'):
+            query = query.filter(Expense.type == args['type'])
+        if args.get('category'):
+            query = query.filter(Expense.category == args['category'])
+
+        # 兼容旧接口：返回完整数组
+        if is_truthy(args.get('all')):
+            expenses = query.order_by(Expense.date.desc()).all()
+            return jsonify(Expense.serialize_many(expenses)), 200
+
+        # 游标分页（(date, id) 复合索引）
+        limit = parse_limit(args.get('limit'))
+        expenses, next_cursor = keyset_page(
+            query, Expense.date, Expense.id, args.get('cursor'), limit
+        )
 
-        # 将数据库对象转换为字典列表
-        return jsonify([expense.to_dict() for expense in expenses]), 200
+        return jsonify({
+            'items': Expense.serialize_many(expenses),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'limit': limit
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': f'参数错误：{str(e)}'}), 400
 
     except Exception as e:
         # 如果发生错误，返回 500 错误
@@ -105,6 +147,10 @@ def create_expense():
         # 添加到数据库会话
         db.session.add(expense)
 
+        # 同一事务里更新 ROI 合计表（全额支出同时计入已付和计划）
+        paid, planned = expense_roi_contribution(expense)
+        apply_roi_delta(paid=paid, planned=planned)
+
         # 提交事务（真正写入数据库）
         db.session.commit()
 
@@ -160,32 +206,25 @@ def update_expense(id):
             expense.category = data['category']
         if 'amount' in data:
             new_amount = float(data['amount'])
-            expense.amount = new_amount
 
-            # 🔄 同步更新关联的 WeeklyCharge 记录
-            # 如果这是一个分期子支出（有 parent_expense_id），需要同步更新对应的 charge 记录
+            # 如果这是一个分期子支出，找到对应的 charge 记录（通过 expense_id）
+            charge = None
             if expense.parent_expense_id:
-                from models import WeeklyCharge, MembershipContract
-                # 查找关联的 charge 记录（通过 expense_id）
                 charge = WeeklyCharge.query.filter_by(expense_id=expense.id).first()
-                if charge:
-                    charge.amount = new_amount
-
-                    # 🔄 重新计算合同总金额
-                    # 查找该 charge 所属的合同
-                    contract = MembershipContract.query.get(charge.contract_id)
-                    if contract:
-                        # 获取该合同的所有扣费记录
-                        all_charges = WeeklyCharge.query.filter_by(contract_id=contract.id).all()
-                        # 重新计算总金额 = 所有期数金额之和
-                        new_total = sum(c.amount for c in all_charges)
-                        contract.total_amount = new_total
-
-                        # 🔄 同步更新父 expense 的金额
-                        # 父 expense 是分期合同的总记录，金额应该等于合同总金额
-                        parent_expense = Expense.query.get(expense.parent_expense_id)
-                        if parent_expense:
-                            parent_expense.amount = new_total
+            charge_paid = charge is not None and charge.status == 'paid'
+
+            # 📊 ROI 合计表：按修改前后的贡献差值更新
+            old_paid, old_planned = expense_roi_contribution(expense, charge_paid)
+            expense.amount = new_amount
+            new_paid, new_planned = expense_roi_contribution(expense, charge_paid)
+            apply_roi_delta(paid=new_paid - old_paid, planned=new_planned - old_planned)
+
+            # 🔄 同步更新关联的 WeeklyCharge 记录
+            if charge:
+                # 🔄 合同总金额和父支出金额按差值增量更新
+                # （父 expense 是分期合同的总记录，金额应该等于合同总金额）
+                apply_contract_total_delta(charge.contract, new_amount - charge.amount)
+                charge.amount = new_amount
 
         if 'currency' in data:
             expense.currency = data['currency']
@@ -230,9 +269,27 @@ def delete_expense(id):
         # get_or_404: 如果找不到，自动返回 404 错误
         expense = Expense.query.get_or_404(id)
 
+        # 同一事务里从 ROI 合计表中扣除这条支出的贡献
+        # （必须在 delete 之前判断：删除时 ORM 会把关联 charge 的 expense_id 置空）
+        if expense.children:
+            # 删除分期父支出时，子支出会脱离父记录变成全额支出，
+            # 贡献变化牵涉多行，删除后直接在本事务里全量重建合计表
+            rebuild_after_delete = True
+        else:
+            rebuild_after_delete = False
+            charge_paid = False
+            if expense.parent_expense_id:
+                charge_paid = WeeklyCharge.query.filter_by(expense_id=expense.id, status='paid').first() is not None
+            paid, planned = expense_roi_contribution(expense, charge_paid)
+            apply_roi_delta(paid=-paid, planned=-planned)
+
         # 删除记录
         db.session.delete(expense)
 
+        if rebuild_after_delete:
+            db.session.flush()
+            rebuild_roi_aggregates()
+
         # 提交事务
         db.session.commit()
 
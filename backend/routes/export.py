@@ -2,16 +2,19 @@
 数据导出路由
 
 提供数据导出功能，生成静态 JSON 文件供 Public 前端使用
+（导出逻辑见 utils/exporter.py）
 """
 
-from flask import Blueprint, jsonify, request
-import json
-import os
-from datetime import datetime
-from models import db, Expense, Activity, Setting, MembershipContract, WeeklyCharge
+from flask import Blueprint, current_app, jsonify, request
+from utils.export_jobs import submit_export_job, run_export_job, get_export_job
+from utils.pagination import is_truthy
 
 export_bp = Blueprint('export', __name__, url_prefix='/api/export')
 
+
+# ========================================
+# POST /api/export/json - 导出数据
+# ========================================
 @export_bp.route('/json', methods=['POST'])
 def export_to_json():
     """
@@ -22,182 +25,133 @@ def export_to_json():
     - 支出列表
     - 活动列表
     - 最后更新时间
+    - 数据版本号
+
+    同时生成分片导出（见 utils/export_shards.py）：manifest.json（ROI 摘要 + 分片列表）
+    和 shards/ 下按年分片、文件名带内容哈希的支出 / 活动文件，Public 前端按需加载。
+
+    支出和活动流式读取、边读边写，内存峰值与记录条数无关（见 utils/exporter.py）。
+
+    数据版本号（见 utils/data_version.py）和导出选项都与上次导出时相同、文件也还在时直接返回，
+    不重算也不重写；写文件时先写临时文件再原子替换，前端不会读到写了一半的文件。
+
+    导出格式见 utils/export_format.py：production 模式写紧凑 JSON，
+    并在每个文件旁边生成 .gz（装了 brotli 时还有 .br），静态服务器可以直接发送压缩版本。
+
+    请求体（JSON，可选）:
+    {
+      "force": true,             // 忽略版本号，强制重新导出
+      "mode": "production",      // development（默认，缩进 2 格）/ production（紧凑），默认取环境变量 EXPORT_MODE
+      "layout": "columnar",      // rows（默认，对象数组）/ columnar（列式，支出和活动按字段存数组）
+      "precompress": true,       // 是否生成 .gz / .br，默认 production 模式下生成
+      "async": true              // 放进后台任务队列，立即返回任务 id（也可以用 ?async=true）
+    }
+
+    导出都在 utils/export_jobs.py 的单线程导出池里依次执行（同步请求也排进去等待完成），
+    不会有两个导出同时写目录；相同选项的任务在排队或运行时合并到那个任务。
 
-    返回：
+    后台导出（async）立即返回 202：
     {
       "success": true,
+      "job_id": "3f2b...",
+      "status": "queued",        // queued / running
+      "coalesced": false,        // true 表示合并到了已有任务
+      "status_url": "/api/export/jobs/3f2b..."
+    }
+
+    同步导出返回：
+    {
+      "success": true,
+      "skipped": false,          // true 表示数据没有变化，沿用上次导出的文件
+      "data_version": 42,
       "file_path": "/data/summary.json",
-      "timestamp": "2025-10-19T10:30:00"
+      "timestamp": "2025-10-19T10:30:00",
+      "manifest": {
+        "file_path": "/data/manifest.json",
+        "shards_written": 1,     // 内容有变化、新写入的分片数
+        "shards_total": 6,
+        "shards_removed": 1
+      },
+      "sizes": {                 // 各文件的字节数（shards 为所有分片合计）
+        "summary": {"json": 182340, "gzip": 22100, "brotli": 18750},
+        "manifest": {"json": 812, "gzip": 402, "brotli": 371},
+        "shards": {"json": 180120, "gzip": 23410, "brotli": 19870}
+      }
     }
     """
     try:
-        # 1. 计算 ROI 数据（复用 roi.py 的逻辑）
-        setting = Setting.query.filter_by(key='market_reference_price').first()
-        market_reference_price = float(setting.value) if setting else 50.0
-
-        activities = Activity.query.all()
-        total_activities = len(activities)
-        weighted_total = sum(activity.calculated_weight for activity in activities)
-
-        # 已付 ROI
-        paid_expenses = Expense.query.filter(
-            db.or_(
-                db.and_(Expense.is_installment == False, Expense.parent_expense_id == None),
-                db.and_(Expense.parent_expense_id != None)
-            )
-        ).all()
-
-        paid_total = 0.0
-        for expense in paid_expenses:
-            if expense.parent_expense_id is None:
-                paid_total += expense.amount
-            else:
-                charge = WeeklyCharge.query.filter_by(expense_id=expense.id, status='paid').first()
-                if charge:
-                    paid_total += expense.amount
-
-        if weighted_total > 0:
-            paid_average_cost = paid_total / weighted_total
-            paid_money_saved = (market_reference_price - paid_average_cost) * weighted_total
-        else:
-            paid_average_cost = 0.0
-            paid_money_saved = 0.0
-
-        paid_roi_percentage = (paid_money_saved / paid_total * 100) if paid_total > 0 else 0.0
-
-        # 计划 ROI
-        all_expenses = Expense.query.filter(
-            db.or_(
-                db.and_(Expense.is_installment == True, Expense.parent_expense_id == None),
-                db.and_(Expense.is_installment == False, Expense.parent_expense_id == None)
-            )
-        ).all()
-
-        planned_total = sum(expense.amount for expense in all_expenses)
-
-        if weighted_total > 0:
-            planned_average_cost = planned_total / weighted_total
-            planned_money_saved = (market_reference_price - planned_average_cost) * weighted_total
-        else:
-            planned_average_cost = 0.0
-            planned_money_saved = 0.0
-
-        planned_roi_percentage = (planned_money_saved / planned_total * 100) if planned_total > 0 else 0.0
-
-        roi_summary = {
-            'total_activities': total_activities,
-            'weighted_total': round(weighted_total, 2),
-            'market_reference_price': market_reference_price,
-            'paid': {
-                'total_expense': round(paid_total, 2),
-                'average_cost': round(paid_average_cost, 2),
-                'money_saved': round(paid_money_saved, 2),
-                'roi_percentage': round(paid_roi_percentage, 2)
-            },
-            'planned': {
-                'total_expense': round(planned_total, 2),
-                'average_cost': round(planned_average_cost, 2),
-                'money_saved': round(planned_money_saved, 2),
-                'roi_percentage': round(planned_roi_percentage, 2)
-            }
-        }
-
-        # 2. 获取所有支出
-        expenses = Expense.query.order_by(Expense.date.desc()).all()
-        expenses_data = []
-
-        for expense in expenses:
-            expense_dict = {
-                'id': expense.id,
-                'amount': float(expense.amount),
-                'currency': expense.currency,
-                'date': expense.date.isoformat() if hasattr(expense.date, 'isoformat') else str(expense.date),
-                'type': expense.type,
-                'category': expense.category,
-                'note': expense.note,
-                'is_installment': expense.is_installment,
-                'parent_expense_id': expense.parent_expense_id
-            }
-
-            # 如果是分期合同，添加合同信息
-            if expense.is_installment and not expense.parent_expense_id:
-                contract = MembershipContract.query.filter_by(expense_id=expense.id).first()
-                if contract:
-                    charges = WeeklyCharge.query.filter_by(contract_id=contract.id).all()
-                    expense_dict['contract_info'] = {
-                        'total_periods': len(charges),
-                        'paid_periods': len([c for c in charges if c.status == 'paid'])
-                    }
-
-            # 如果是分期子支出，添加期数信息
-            if expense.parent_expense_id:
-                # 找到同父支出的所有子支出
-                siblings = Expense.query.filter_by(parent_expense_id=expense.parent_expense_id).order_by(Expense.date).all()
-                for idx, sibling in enumerate(siblings):
-                    if sibling.id == expense.id:
-                        expense_dict['installment_number'] = idx + 1
-                        break
-
-                # 找到父支出的类别
-                parent = Expense.query.get(expense.parent_expense_id)
-                if parent:
-                    expense_dict['parent_category'] = parent.category
-
-            expenses_data.append(expense_dict)
-
-        # 3. 获取所有活动
-        activities = Activity.query.order_by(Activity.date.desc()).all()
-        activities_data = [
-            {
-                'id': activity.id,
-                'distance': activity.distance,
-                'date': activity.date.isoformat() if hasattr(activity.date, 'isoformat') else str(activity.date),
-                'calculated_weight': float(activity.calculated_weight),
-                'note': activity.note
-            }
-            for activity in activities
-        ]
-
-        # 4. 组装完整数据
-        export_data = {
-            'roi': roi_summary,
-            'expenses': expenses_data,
-            'activities': activities_data,
-            'lastUpdated': datetime.now().isoformat()
-        }
-
-        # 5. 确保目录存在并写入文件
-        # 获取项目根目录（backend的上上一级）
-        # __file__ -> routes/export.py
-        # dirname -> routes/
-        # dirname -> backend/
-        # dirname -> project_root/
-        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        project_root = os.path.dirname(backend_dir)
-
-        # 6. 只导出到 public-static/data/ 目录（统一位置）
-        # - 开发环境: Vite 通过 publicDir 直接访问
-        # - 生产构建: vite-plugin-static-copy 会复制到 dist/
-        # - Git 提交: 只提交这一个文件
-        data_dir = os.path.join(project_root, 'public-static', 'data')
-        os.makedirs(data_dir, exist_ok=True)
-        file_path = os.path.join(data_dir, 'summary.json')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
-
+        data = request.get_json(silent=True) or {}
+        options = dict(
+            force=bool(data.get('force')),
+            mode=data.get('mode'),
+            layout=data.get('layout'),
+            precompress=bool(data['precompress']) if 'precompress' in data else None
+        )
+
+        if is_truthy(data.get('async')) or is_truthy(request.args.get('async')):
+            job, coalesced = submit_export_job(current_app._get_current_object(), **options)
+            return jsonify({
+                'success': True,
+                'job_id': job['id'],
+                'status': job['status'],
+                'coalesced': coalesced,
+                'status_url': f"/api/export/jobs/{job['id']}"
+            }), 202
+
+        # 同步导出也走导出线程池，不会和后台任务同时写导出目录
+        job = run_export_job(current_app._get_current_object(), **options)
+        if job['status'] == 'failed':
+            return jsonify({
+                'success': False,
+                'error': job['error']
+            }), 500
+
+        return jsonify(dict(success=True, **job['result']))
+
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'file_path': '/data/summary.json',
-            'timestamp': datetime.now().isoformat(),
-            'stats': {
-                'expenses_count': len(expenses_data),
-                'activities_count': len(activities_data),
-                'roi_percentage': roi_summary['paid']['roi_percentage']
-            }
-        })
+            'success': False,
+            'error': f'参数错误：{str(e)}'
+        }), 400
 
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+
+
+# ========================================
+# GET /api/export/jobs/<job_id> - 后台导出任务状态
+# ========================================
+@export_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_export_job_status(job_id):
+    """
+    查询后台导出任务的状态、进度、耗时和导出结果
+
+    返回:
+    {
+      "id": "3f2b...",
+      "status": "completed",     // queued / running / completed / failed
+      "options": {"force": false, "mode": "production", "layout": "rows", "precompress": true},
+      "created_at": "2025-10-18T10:30:00",
+      "started_at": "2025-10-18T10:30:00",
+      "finished_at": "2025-10-18T10:30:02",
+      "duration": 1.284,         // 秒（运行中的任务算到现在）
+      "progress": {"stage": "shards", "processed": 10400, "total": 10400, "percentage": 100.0},
+      "coalesced": 2,            // 合并进来的重复请求数
+      "result": {...},           // 同步导出的返回内容（skipped / stats / manifest / sizes 等）
+      "error": null
+    }
+
+    任务只保存在内存里（最近 50 个），不存在时返回 404。
+    """
+    try:
+        job = get_export_job(job_id)
+        if job is None:
+            return jsonify({'error': '导出任务不存在'}), 404
+
+        return jsonify(job), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -5,11 +5,26 @@ ROI 计算 API
 
 接口：
 - GET /api/roi/summary         - 获取 ROI 摘要统计
+- GET /api/roi/timeseries      - 获取累计 ROI 时间序列及回本日期
+- POST /api/roi/simulate       - 按参数网格模拟 ROI（What-if）
 - PUT /api/roi/market-price    - 更新市场参考价
+- GET /api/roi/weight-model    - 获取游泳权重模型参数及重算进度
+- PUT /api/roi/weight-model    - 更新游泳权重模型参数（后台重算所有活动权重）
+- GET /api/roi/weight-model/recompute - 查询后台重算进度
+- POST /api/roi/aggregates/rebuild - 全量重建 ROI 合计表
+- GET /api/roi/aggregates/check    - 检查 ROI 合计表与全量重算是否一致
 """
 
-from flask import Blueprint, request, jsonify
-from models import db, Expense, Activity, Setting
+from flask import Blueprint, request, jsonify, current_app
+from models import db, Setting
+from utils.roi import (
+    get_roi_summary_data, rebuild_roi_aggregates, check_roi_aggregates,
+    compute_roi_timeseries, TIMESERIES_GRANULARITIES
+)
+from utils.roi_simulator import simulate_roi
+from utils.weight_model import (
+    get_weight_model, save_weight_model, start_weight_recompute, get_recompute_progress
+)
 
 # 创建蓝图
 roi_bp = Blueprint('roi', __name__)
@@ -42,92 +57,80 @@ def get_roi_summary():
     - roi_percentage: (money_saved / total_expense) × 100
     """
     try:
-        # 1. 市场参考价（从数据库读取，默认 $50 NZD）
-        setting = Setting.query.filter_by(key='market_reference_price').first()
-        market_reference_price = float(setting.value) if setting else 50.0
+        # 读取物化合计表（一行数据），见 utils/roi.py
+        return jsonify(get_roi_summary_data()), 200
 
-        # 2. 获取所有活动并计算加权总次数
-        activities = Activity.query.all()
-        total_activities = len(activities)
-        weighted_total = sum(activity.calculated_weight for activity in activities)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # 3. 计算两种 ROI：已付 vs 计划
 
-        # 3.1 已付 ROI（仅计算非分期合同父支出 + 已付的分期子支出）
-        paid_expenses = Expense.query.filter(
-            db.or_(
-                db.and_(Expense.is_installment == False, Expense.parent_expense_id == None),  # 全额支出
-                db.and_(Expense.parent_expense_id != None)  # 分期子支出（含已付和待付，后续过滤）
-            )
-        ).all()
-
-        # 过滤出真正已付的支出（通过 WeeklyCharge 的 status）
-        from models import WeeklyCharge
-        paid_total = 0.0
-        for expense in paid_expenses:
-            if expense.parent_expense_id is None:
-                # 全额支出，直接计入
-                paid_total += expense.amount
-            else:
-                # 分期子支出，检查是否有对应的 paid 状态 charge
-                charge = WeeklyCharge.query.filter_by(expense_id=expense.id, status='paid').first()
-                if charge:
-                    paid_total += expense.amount
-
-        # 计算已付 ROI
-        if weighted_total > 0:
-            paid_average_cost = paid_total / weighted_total
-            paid_money_saved = (market_reference_price - paid_average_cost) * weighted_total
-        else:
-            paid_average_cost = 0.0
-            paid_money_saved = 0.0
+# ========================================
+# GET /api/roi/timeseries - 累计 ROI 时间序列
+# ========================================
+@roi_bp.route('/api/roi/timeseries', methods=['GET'])
+def get_roi_timeseries():
+    """
+    获取累计 ROI 时间序列（用于画回本曲线）
 
-        if paid_total > 0:
-            paid_roi_percentage = (paid_money_saved / paid_total) * 100
-        else:
-            paid_roi_percentage = 0.0
+    查询参数:
+        granularity: day | week | month（默认 month）
 
-        # 3.2 计划 ROI（包含所有支出：已付 + 待付）
-        all_expenses = Expense.query.filter(
-            db.or_(
-                db.and_(Expense.is_installment == True, Expense.parent_expense_id == None),  # 分期合同父支出
-                db.and_(Expense.is_installment == False, Expense.parent_expense_id == None)  # 全额支出
-            )
-        ).all()
+    返回:
+    {
+      "granularity": "month",
+      "market_reference_price": 50.0,
+      "points": [
+        {
+          "period_start": "2025-10-01",
+          "total_activities": 4,
+          "weighted_total": 5.66,
+          "paid": {"total_expense": 204.0, "average_cost": 36.04, "money_saved": 79.0, "roi_percentage": 38.73},
+          "planned": {...}
+        }
+      ],
+      "break_even_date": "2025-10-19"   // 已付 ROI 第一次转正的日期，未回本为 null
+    }
+    """
+    try:
+        granularity = request.args.get('granularity', 'month')
+        if granularity not in TIMESERIES_GRANULARITIES:
+            return jsonify({'error': f'granularity 只支持：{", ".join(TIMESERIES_GRANULARITIES)}'}), 400
 
-        planned_total = sum(expense.amount for expense in all_expenses)
+        return jsonify(compute_roi_timeseries(granularity)), 200
 
-        # 计算计划 ROI
-        if weighted_total > 0:
-            planned_average_cost = planned_total / weighted_total
-            planned_money_saved = (market_reference_price - planned_average_cost) * weighted_total
-        else:
-            planned_average_cost = 0.0
-            planned_money_saved = 0.0
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        if planned_total > 0:
-            planned_roi_percentage = (planned_money_saved / planned_total) * 100
-        else:
-            planned_roi_percentage = 0.0
 
-        # 返回 JSON 响应（双重数据）
-        return jsonify({
-            'total_activities': total_activities,
-            'weighted_total': round(weighted_total, 2),
-            'market_reference_price': market_reference_price,
-            'paid': {
-                'total_expense': round(paid_total, 2),
-                'average_cost': round(paid_average_cost, 2),
-                'money_saved': round(paid_money_saved, 2),
-                'roi_percentage': round(paid_roi_percentage, 2)
-            },
-            'planned': {
-                'total_expense': round(planned_total, 2),
-                'average_cost': round(planned_average_cost, 2),
-                'money_saved': round(planned_money_saved, 2),
-                'roi_percentage': round(planned_roi_percentage, 2)
-            }
-        }), 200
+# ========================================
+# POST /api/roi/simulate - What-if 模拟
+# ========================================
+@roi_bp.route('/api/roi/simulate', methods=['POST'])
+def simulate():
+    """
+    按参数网格模拟 ROI（不修改任何数据）
+
+    请求体（JSON）:
+    {
+      "market_reference_price": [40, 50, 60],   // 市场参考价网格
+      "baseline": [800, 1000, 1200],            // 基准距离网格
+      "sigma": [400, 550]                       // 标准差网格
+    }
+
+    返回:
+    {
+      "weighted_total": [[...]],     // 形状 (baseline, sigma)
+      "paid_roi": [[[...]]],         // 形状 (market_reference_price, baseline, sigma)
+      "planned_roi": [[[...]]],
+      ...
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        return jsonify(simulate_roi(data)), 200
+
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'数据格式错误：{str(e)}'}), 400
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -196,3 +199,160 @@ def update_market_price():
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# GET /api/roi/weight-model - 获取权重模型参数
+# ========================================
+@roi_bp.route('/api/roi/weight-model', methods=['GET'])
+def get_weight_model_settings():
+    """
+    获取当前的游泳权重模型参数
+
+    返回:
+    {
+      "baseline": 1000.0,
+      "sigma": 550.0,
+      "version": 1,
+      "recompute": {...}    // 后台重算进度
+    }
+    """
+    try:
+        model = get_weight_model()
+        model['recompute'] = get_recompute_progress()
+        return jsonify(model), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# PUT /api/roi/weight-model - 更新权重模型参数
+# ========================================
+@roi_bp.route('/api/roi/weight-model', methods=['PUT'])
+def update_weight_model():
+    """
+    更新游泳权重模型参数，并在后台重算所有活动的权重
+
+    请求体（JSON）:
+    {
+      "baseline": 1200,    // 基准距离（米）
+      "sigma": 500         // 标准差
+    }
+
+    返回（202 Accepted，重算在后台进行）:
+    {
+      "baseline": 1200.0,
+      "sigma": 500.0,
+      "version": 2,
+      "recompute": {"status": "running", ...},
+      "message": "权重模型参数已更新，正在后台重算"
+    }
+    """
+    try:
+        data = request.get_json()
+
+        # 验证必填字段
+        for field in ['baseline', 'sigma']:
+            if field not in data:
+                return jsonify({'error': f'缺少必填字段：{field}'}), 400
+
+        model = save_weight_model(data['baseline'], data['sigma'])
+        db.session.commit()
+
+        # 提交后再启动后台任务（后台线程要能读到新参数）
+        recompute = start_weight_recompute(current_app._get_current_object(), model)
+
+        return jsonify({
+            **model,
+            'recompute': recompute,
+            'message': '权重模型参数已更新，正在后台重算'
+        }), 202
+
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({'error': f'数据格式错误：{str(e)}'}), 400
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# GET /api/roi/weight-model/recompute - 重算进度
+# ========================================
+@roi_bp.route('/api/roi/weight-model/recompute', methods=['GET'])
+def get_weight_recompute_progress():
+    """
+    查询后台重算进度
+
+    返回:
+    {
+      "status": "running",    // idle / running / completed / superseded / failed
+      "version": 2,
+      "total": 1200,
+      "processed": 500,
+      "percentage": 41.67,
+      ...
+    }
+    """
+    try:
+        return jsonify(get_recompute_progress()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# POST /api/roi/aggregates/rebuild - 重建 ROI 合计表
+# ========================================
+@roi_bp.route('/api/roi/aggregates/rebuild', methods=['POST'])
+def rebuild_aggregates():
+    """
+    用全量重算的结果覆盖 ROI 合计表
+
+    用途：
+    - 发现合计表与实际数据不一致时修复
+    - 手动修改数据库后重新同步
+
+    返回:
+    {
+      "aggregates": {...},
+      "message": "ROI 合计表重建成功"
+    }
+    """
+    try:
+        aggregate = rebuild_roi_aggregates()
+        db.session.commit()
+
+        return jsonify({
+            'aggregates': aggregate.to_dict(),
+            'message': 'ROI 合计表重建成功'
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# ========================================
+# GET /api/roi/aggregates/check - 一致性检查
+# ========================================
+@roi_bp.route('/api/roi/aggregates/check', methods=['GET'])
+def check_aggregates():
+    """
+    对比 ROI 合计表与全量重算的结果
+
+    返回:
+    {
+      "consistent": true,
+      "stored": {...},
+      "recomputed": {...},
+      "differences": {}
+    }
+    """
+    try:
+        return jsonify(check_roi_aggregates()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -3,4 +3,17 @@
 
 包含：
 - gaussian.py: 高斯函数计算
+- roi.py: ROI 计算（路由和导出共用）
+- roi_simulator.py: ROI 假设模拟（NumPy 广播）
+- weight_model.py: 游泳权重模型参数 + 后台重算
+- pagination.py: 游标分页工具
+- query_counter.py: SQL 语句计数（发现 N+1 查询）
+- charges.py: 分期扣费记录批量生成
+- schedule.py: 分期扣费日期生成 + 虚拟扣费计划（按规则读取待付期数）
+- settlement.py: 到期扣费自动结算（后台线程 / flask settle-charges 命令）
+- data_version.py: 数据版本号（导出时跳过没有变化的数据）
+- export_shards.py: 分片导出（manifest.json + 按年分片，文件名带内容哈希）
+- export_format.py: 导出文件格式（紧凑 JSON / 列式布局 / .gz .br 预压缩 / 流式编码，临时文件 + fsync + os.replace 原子写入）
+- exporter.py: 数据导出（summary.json + 分片 + manifest，流式读取和写入）
+- export_jobs.py: 后台导出任务（进程内线程池、合并重复请求、进度查询）
 """
@@ -0,0 +1,389 @@
+"""
+分期扣费记录批量生成
+
+创建/更新/转换合同时，每个扣费日要生成：
+- 一条 WeeklyCharge（扣费记录）
+- 已付的期数再加一条子支出 Expense，并让 WeeklyCharge.expense_id 指向它
+
+以前是每期 add + flush（一次往返拿子支出 id），5 年的周合同就是几百次 flush。
+现在分两步批量插入：
+1. INSERT ... RETURNING 一次插入所有子支出，拿回 (id, date)
+2. executemany 一次插入所有扣费记录
+
+修改某期金额时，合同总金额和父支出金额按差值增量更新（apply_contract_total_delta），
+不再把合同的所有扣费记录读出来重新求和；check_contract_totals() 用全量 SUM 校验。
+
+修改合同时用 reconcile_charges() 按扣费日期比较新旧计划，只执行需要的 INSERT / UPDATE / DELETE，
+不再全部删除后重建（见该函数说明）。
+
+为什么按日期而不是按参数顺序对应 id？
+- SQLite 不保证 RETURNING 的行顺序，要求按参数顺序返回时 SQLAlchemy 会退化成逐行 INSERT
+- 同一合同内扣费日期互不相同，用日期对应就不需要顺序保证
+"""
+
+from models import db, Expense, MembershipContract, WeeklyCharge
+from utils.roi import apply_roi_delta, ROI_AGGREGATE_TOLERANCE
+from utils.schedule import is_virtual, local_today, count_contract_periods
+
+
+def insert_child_expenses(parent_expense, charges, note_prefix=None):
+    """
+    批量插入已付期数的子支出（一条 INSERT ... RETURNING）
+
+    参数:
+        parent_expense (Expense): 父支出（提供类型、分类、货币）
+        charges (list): [(扣费日期, 金额, 期数), ...]，日期互不相同
+        note_prefix (str): 备注前缀，默认用父支出的分类
+
+    返回:
+        dict: {扣费日期: 子支出 id}
+    """
+    if not charges:
+        return {}
+
+    if note_prefix is None:
+        note_prefix = parent_expense.category
+
+    rows = [
+        {
+            'type': parent_expense.type,
+            'category': parent_expense.category,
+            'amount': amount,
+            'currency': parent_expense.currency,
+            'date': charge_date,
+            'note': f"{note_prefix} - 第 {number} 期",
+            'parent_expense_id': parent_expense.id,
+            'is_installment': False
+        }
+        for charge_date, amount, number in charges
+    ]
+
+    result = db.session.execute(
+        db.insert(Expense).returning(Expense.id, Expense.date),
+        rows
+    )
+    return {row.date: row.id for row in result}
+
+
+def materialize_charges(contract, parent_expense, charge_dates, paid_dates=frozenset(),
+                        today=None, note_prefix=None, period_numbers=None):
+    """
+    为合同批量生成扣费记录和已付子支出（不提交，由调用方 commit）
+
+    参数:
+        contract (MembershipContract): 合同（需要已有 id）
+        parent_expense (Expense): 父支出（需要已有 id）
+        charge_dates (list): 扣费日期列表（升序）
+        paid_dates (set): 之前已经付过的日期（更新合同时保留已付状态）
+        today (date): 今天，默认为 local_today()
+        note_prefix (str): 子支出备注前缀，默认用父支出的分类
+        period_numbers (dict): {扣费日期: 期数}，用于子支出备注；默认按已付日期顺序从 1 编号
+
+    返回:
+        tuple: (paid_count, pending_count)
+
+    规则：
+    - 日期 <= 今天，或之前已付过 → paid，生成子支出
+    - 其他 → pending，不生成子支出
+    """
+    if today is None:
+        today = local_today()
+
+    amount = contract.period_amount
+
+    paid = [d for d in charge_dates if d in paid_dates or d <= today]
+    pending = [d for d in charge_dates if not (d in paid_dates or d <= today)]
+
+    # 1. 已付期数的子支出：一条 INSERT ... RETURNING
+    if period_numbers is None:
+        period_numbers = {charge_date: number for number, charge_date in enumerate(paid, start=1)}
+
+    child_ids = insert_child_expenses(
+        parent_expense,
+        [(charge_date, amount, period_numbers[charge_date]) for charge_date in paid],
+        note_prefix
+    )
+
+    # 2. 所有扣费记录：一次 executemany
+    charge_rows = [
+        {
+            'contract_id': contract.id,
+            'expense_id': child_ids[charge_date],
+            'charge_date': charge_date,
+            'amount': amount,
+            'status': 'paid'
+        }
+        for charge_date in paid
+    ] + [
+        {
+            'contract_id': contract.id,
+            'expense_id': None,  # 待付款时没有支出记录
+            'charge_date': charge_date,
+            'amount': amount,
+            'status': 'pending'
+        }
+        for charge_date in pending
+    ]
+
+    if charge_rows:
+        db.session.execute(db.insert(WeeklyCharge), charge_rows)
+
+    # 3. 新生成的已付子支出计入 ROI 合计表
+    apply_roi_delta(paid=len(paid) * amount)
+
+    return len(paid), len(pending)
+
+
+def reconcile_charges(contract, parent_expense, charge_dates, old_period_amount, today=None):
+    """
+    合同规则修改后，按扣费日期比较新旧计划，只改动需要改的记录（不提交）
+
+    参数:
+        contract (MembershipContract): 已经改好字段的合同
+        parent_expense (Expense): 父支出
+        charge_dates (list): 新规则下的全部扣费日期（升序）
+        old_period_amount (float): 修改前的每期金额
+        today (date): 今天，默认为 local_today()
+
+    返回:
+    {
+      "paid_count": 40,
+      "pending_count": 12,
+      "inserted": 4,      // 新增的扣费记录数
+      "updated": 30,      // 改了金额的扣费记录数
+      "deleted": 2,       // 删除的扣费记录数
+      "settled": 1        // 已到期、从待付改为已付的扣费记录数
+    }
+
+    规则：
+    - 只在旧计划里的日期 → DELETE 扣费记录及其子支出（已付的从 ROI 合计表扣除）
+    - 新旧都有的日期 → 保留原记录（id、子支出不变）
+        - 金额等于旧的每期金额（没单独改过）且每期金额变了 → UPDATE 为新金额，已付的同步子支出
+        - 单独改过金额的期数保持原金额
+        - 已到期（日期 <= 今天）但还是待付的 → 改为已付并生成子支出
+          （与以前整体删除重建时一致：修改合同时到期的期数都算已付）
+    - 只在新计划里的日期 → INSERT（日期 <= 今天为已付并生成子支出，否则为待付）
+        - 虚拟扣费计划（见 utils/schedule.py）只插入已到期的日期，待付期数不存储
+    """
+    if today is None:
+        today = local_today()
+
+    new_amount = contract.period_amount
+
+    # 1. 一次查询取出旧记录（连同子支出金额）
+    stored = db.session.execute(
+        db.select(
+            WeeklyCharge.id,
+            WeeklyCharge.charge_date,
+            WeeklyCharge.amount,
+            WeeklyCharge.status,
+            WeeklyCharge.expense_id,
+            Expense.amount.label('child_amount')
+        )
+        .outerjoin(Expense, Expense.id == WeeklyCharge.expense_id)
+        .where(WeeklyCharge.contract_id == contract.id)
+    ).all()
+
+    removed, kept, repriced, added, settled = plan_reconcile(
+        stored, charge_dates, new_amount, old_period_amount, is_virtual(contract), today
+    )
+
+    # 2. DELETE：不在新计划里的扣费记录和子支出
+    if removed:
+        db.session.execute(
+            db.delete(WeeklyCharge).where(WeeklyCharge.id.in_([row.id for row in removed])),
+            execution_options={'synchronize_session': False}
+        )
+        child_ids = [row.expense_id for row in removed if row.expense_id]
+        if child_ids:
+            db.session.execute(
+                db.delete(Expense).where(Expense.id.in_(child_ids)),
+                execution_options={'synchronize_session': False}
+            )
+        apply_roi_delta(paid=-sum(
+            row.child_amount or 0.0 for row in removed
+            if row.status == 'paid' and row.expense_id
+        ))
+
+    # 3. UPDATE：没单独改过金额的期数跟随新的每期金额
+    if repriced:
+        db.session.execute(
+            db.update(WeeklyCharge.__table__)
+            .where(WeeklyCharge.__table__.c.id == db.bindparam('row_id'))
+            .values(amount=new_amount),
+            [{'row_id': row.id} for row in repriced]
+        )
+        paid_children = [row for row in repriced if row.status == 'paid' and row.expense_id]
+        if paid_children:
+            db.session.execute(
+                db.update(Expense.__table__)
+                .where(Expense.__table__.c.id == db.bindparam('row_id'))
+                .values(amount=new_amount),
+                [{'row_id': row.expense_id} for row in paid_children]
+            )
+            apply_roi_delta(paid=sum(new_amount - (row.child_amount or 0.0) for row in paid_children))
+
+    period_numbers = {charge_date: number for number, charge_date in enumerate(charge_dates, start=1)}
+
+    # 4. 结算：保留的待付期数中已到期的改为已付，一条 INSERT ... RETURNING 生成子支出
+    if settled:
+        repriced_ids = {row.id for row in repriced}
+        amounts = {
+            row.charge_date: new_amount if row.id in repriced_ids else row.amount
+            for row in settled
+        }
+        child_ids = insert_child_expenses(
+            parent_expense,
+            [(charge_date, amount, period_numbers[charge_date]) for charge_date, amount in amounts.items()]
+        )
+        db.session.execute(
+            db.update(WeeklyCharge.__table__)
+            .where(WeeklyCharge.__table__.c.id == db.bindparam('row_id'))
+            .values(status='paid', expense_id=db.bindparam('child_id')),
+            [{'row_id': row.id, 'child_id': child_ids[row.charge_date]} for row in settled]
+        )
+        apply_roi_delta(paid=sum(amounts.values()))
+
+    # 5. INSERT：新计划里新增的日期
+    added_paid, _ = materialize_charges(
+        contract, parent_expense, added, today=today, period_numbers=period_numbers
+    )
+
+    paid_count = added_paid + len(settled) + sum(1 for row in kept if row.status == 'paid')
+
+    return {
+        'paid_count': paid_count,
+        'pending_count': len(charge_dates) - paid_count,
+        'inserted': len(added),
+        'updated': len(repriced),
+        'deleted': len(removed),
+        'settled': len(settled)
+    }
+
+
+def plan_reconcile(stored, charge_dates, new_amount, old_period_amount, virtual, today):
+    """
+    计算新旧计划的差异（纯计算，不访问数据库；reconcile_charges 和预览接口共用）
+
+    参数:
+        stored (list): 已存储的扣费记录（需要 charge_date / amount / status 属性）
+        charge_dates (list): 新规则下的全部扣费日期（升序）
+        new_amount / old_period_amount (float): 修改后 / 修改前的每期金额
+        virtual (bool): 是否为虚拟扣费计划
+        today (date): 今天
+
+    返回:
+        tuple: (removed, kept, repriced, added, settled)
+        - removed: 要删除的存储记录
+        - kept: 保留的存储记录
+        - repriced: 保留的记录中要改成新金额的
+        - added: 要插入的扣费日期
+        - settled: 保留的记录中已到期、要从待付改为已付的
+    """
+    schedule = set(charge_dates)
+
+    removed = [row for row in stored if row.charge_date not in schedule]
+    kept = [row for row in stored if row.charge_date in schedule]
+
+    repriced = []
+    if new_amount != old_period_amount:
+        repriced = [row for row in kept if row.amount == old_period_amount]
+
+    kept_dates = {row.charge_date for row in kept}
+    added = [d for d in charge_dates if d not in kept_dates]
+    if virtual:
+        added = [d for d in added if d <= today]
+
+    settled = [row for row in kept if row.status == 'pending' and row.charge_date <= today]
+
+    return removed, kept, repriced, added, settled
+
+
+def apply_contract_total_delta(contract, delta):
+    """
+    把扣费金额的变化量计入合同总金额、父支出金额和 ROI 合计表（不提交）
+
+    参数:
+        contract (MembershipContract): 合同
+        delta (float): 扣费金额之和的变化量（新金额 - 旧金额）
+    """
+    if not contract or not delta:
+        return
+
+    contract.total_amount += delta
+
+    # 🔄 父支出是分期合同的总记录，金额与合同总金额同步
+    parent_expense = contract.parent_expense
+    if parent_expense:
+        parent_expense.amount += delta
+        apply_roi_delta(planned=delta)
+
+
+def check_contract_totals(tolerance=ROI_AGGREGATE_TOLERANCE):
+    """
+    一致性检查：对比每份合同的总金额与扣费金额全量 SUM（一条 GROUP BY 查询）
+
+    - charges_total: 存储的扣费金额之和 + 虚拟扣费计划中未存储的期数 × 每期金额
+    - 合同总金额、父支出金额任一与 charges_total 相差超过误差即列出
+
+    注意：创建 / 修改合同时手动填写的 total_amount 可以与扣费之和不同，
+    这类合同也会列出，是否需要修正由使用者判断。
+
+    返回:
+    {
+      "consistent": true,
+      "checked": 3,
+      "mismatches": [
+        {
+          "contract_id": 1,
+          "total_amount": 916.0,
+          "parent_amount": 916.0,
+          "charges_total": 884.0,
+          "difference": 32.0        // total_amount - charges_total
+        }
+      ]
+    }
+    """
+    charge_sums = (
+        db.select(
+            WeeklyCharge.contract_id,
+            db.func.sum(WeeklyCharge.amount).label('stored_total'),
+            db.func.count(WeeklyCharge.id).label('stored_count')
+        )
+        .group_by(WeeklyCharge.contract_id)
+        .subquery()
+    )
+
+    rows = db.session.execute(
+        db.select(
+            MembershipContract,
+            Expense.amount.label('parent_amount'),
+            db.func.coalesce(charge_sums.c.stored_total, 0.0),
+            db.func.coalesce(charge_sums.c.stored_count, 0)
+        )
+        .outerjoin(Expense, Expense.id == MembershipContract.expense_id)
+        .outerjoin(charge_sums, charge_sums.c.contract_id == MembershipContract.id)
+        .order_by(MembershipContract.id)
+    ).all()
+
+    mismatches = []
+    for contract, parent_amount, stored_total, stored_count in rows:
+        charges_total = float(stored_total)
+        if is_virtual(contract):
+            charges_total += (count_contract_periods(contract) - stored_count) * contract.period_amount
+
+        parent_off = parent_amount is not None and abs(parent_amount - charges_total) > tolerance
+        if abs(contract.total_amount - charges_total) > tolerance or parent_off:
+            mismatches.append({
+                'contract_id': contract.id,
+                'total_amount': contract.total_amount,
+                'parent_amount': parent_amount,
+                'charges_total': round(charges_total, 2),
+                'difference': round(contract.total_amount - charges_total, 4)
+            })
+
+    return {
+        'consistent': not mismatches,
+        'checked': len(rows),
+        'mismatches': mismatches
+    }
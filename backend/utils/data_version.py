@@ -0,0 +1,143 @@
+"""
+数据版本号（导出时判断数据有没有变化）
+
+问题：POST /api/export/json 每次都全量重算并重写 summary.json，
+即使上次导出之后没有任何写入。
+
+做法：settings 表里存一个写入计数器（key = data_version），
+任何提交了写操作的事务都在同一事务里把它加 1：
+- ORM 的增删改（after_flush 时 session.new / dirty / deleted 不为空）
+- session.execute() 执行的 INSERT / UPDATE / DELETE（批量写入、ROI 合计表增量更新等）
+
+计数器和数据一起提交、一起回滚；命令行（flask settle-charges）和后台线程
+也走同一个 Session，所以跨进程的写入同样会被记录。
+
+导出成功后把当时的版本号（连同导出选项）记到 exported_data_version，
+下次导出时版本号和选项都相同就可以直接跳过。
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Setting
+
+DATA_VERSION_KEY = 'data_version'
+EXPORTED_VERSION_KEY = 'exported_data_version'
+
+SETTING_DESCRIPTIONS = {
+    DATA_VERSION_KEY: '数据版本号（每次提交写操作加 1，导出时用来判断数据是否变化）',
+    EXPORTED_VERSION_KEY: '上次导出时的数据版本号和导出选项（如 42|production|columnar|gz）'
+}
+
+
+def _mark_changed(session):
+    session.info['data_changed'] = True
+
+
+def _after_flush(session, flush_context):
+    """
+    ORM 写入：flush 时有新增 / 删除 / 真正修改过的对象
+    """
+    if session.new or session.deleted or any(session.is_modified(obj) for obj in session.dirty):
+        _mark_changed(session)
+
+
+def _do_orm_execute(orm_execute_state):
+    """
+    session.execute() 执行的 INSERT / UPDATE / DELETE
+    """
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_changed(orm_execute_state.session)
+
+
+def _before_commit(session):
+    """
+    提交前：有写入就在同一事务里把版本号加 1
+
+    commit() 先触发 before_commit 再做最后一次 flush，
+    所以这里先 flush，保证最后一批改动也被记录。
+    """
+    session.flush()
+    if session.info.pop('data_changed', False):
+        # 直接用连接执行，不经过 session.execute，不会再次触发 _do_orm_execute
+        session.connection().execute(
+            db.update(Setting.__table__)
+            .where(Setting.__table__.c.key == DATA_VERSION_KEY)
+            .values(
+                value=db.cast(db.cast(Setting.__table__.c.value, db.Integer) + 1, db.String),
+                updated_at=datetime.utcnow()
+            )
+        )
+
+
+def _after_rollback(session):
+    session.info.pop('data_changed', None)
+
+
+def install_data_version_tracking():
+    """
+    注册 Session 事件（应用启动时调用一次）
+    """
+    for name, listener in (
+        ('after_flush', _after_flush),
+        ('do_orm_execute', _do_orm_execute),
+        ('before_commit', _before_commit),
+        ('after_rollback', _after_rollback),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
+
+def init_data_version():
+    """
+    创建版本号设置项（如果不存在，在 app.py 初始化时调用）
+    """
+    for key, description in SETTING_DESCRIPTIONS.items():
+        if not Setting.query.filter_by(key=key).first():
+            db.session.add(Setting(key=key, value='0', description=description))
+    db.session.commit()
+
+
+def _read_setting(key):
+    return db.session.execute(
+        db.select(Setting.value).where(Setting.key == key)
+    ).scalar()
+
+
+def get_data_version():
+    """
+    当前数据版本号（设置项不存在时返回 None）
+    """
+    value = _read_setting(DATA_VERSION_KEY)
+    return int(value) if value is not None else None
+
+
+def export_marker(version, *options):
+    """
+    导出标记：版本号 + 导出选项（选项变了也要重新导出）
+    """
+    return '|'.join(str(part) for part in (version, *options))
+
+
+def get_export_marker():
+    """
+    上次导出时记下的标记（没有导出过时返回 None）
+    """
+    value = _read_setting(EXPORTED_VERSION_KEY)
+    return value if value != '0' else None
+
+
+def mark_exported(marker):
+    """
+    记录本次导出的标记并提交
+
+    记录导出本身不是数据变化，所以直接用连接执行，不让版本号再加 1。
+    """
+    db.session.connection().execute(
+        db.update(Setting.__table__)
+        .where(Setting.__table__.c.key == EXPORTED_VERSION_KEY)
+        .values(value=marker, updated_at=datetime.utcnow())
+    )
+    db.session.commit()
@@ -0,0 +1,508 @@
+"""
+导出文件格式（紧凑 JSON / 列式布局 / 预压缩 / 流式写入）
+
+两种模式：
+- development（默认）：缩进 2 格，方便直接查看和 diff
+- production：无缩进、最短分隔符（',' 和 ':'），体积更小
+
+列式布局（columnar）：把「对象数组」转成「数组对象」
+    [{"id": 1, "date": "2025-10-17"}, {"id": 2, "date": "2025-10-18"}]
+    → {"columns": ["id", "date"], "data": {"id": [1, 2], "date": ["2025-10-17", "2025-10-18"]}, "length": 2}
+每个字段名只出现一次，体积更小，浏览器解析也更快；前端读取时还原成对象数组。
+某些记录没有的字段（如 installment_number）在列里用 null 补齐。
+
+预压缩：每个导出文件旁边再写一份 .gz（以及装了 brotli 时的 .br），
+静态服务器（nginx gzip_static / brotli_static 等）可以直接发送压缩好的文件。
+
+流式写入（内存占用与记录条数无关）：
+- iter_json 把数据逐段编码成 JSON 文本；其中的 JsonArray / JsonColumns 包着迭代器，
+  边读数据库边输出，不先拼成完整的列表（输出与 json.dumps 逐字节相同）
+- JsonColumns 先把每一列写到各自的临时文件，最后按列依次拼接
+- ArtifactWriter 一边写原文件，一边计算 SHA-256、写 .gz / .br，最后原子替换
+
+原子替换：先写到同目录下的临时文件，fsync 落盘后用 os.replace 替换，
+前端（或静态服务器）要么读到旧文件，要么读到完整的新文件，不会读到写了一半的文件。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：没装就只生成 .gz
+    brotli = None
+
+EXPORT_MODE_DEVELOPMENT = 'development'
+EXPORT_MODE_PRODUCTION = 'production'
+EXPORT_MODES = (EXPORT_MODE_DEVELOPMENT, EXPORT_MODE_PRODUCTION)
+
+LAYOUT_ROWS = 'rows'
+LAYOUT_COLUMNAR = 'columnar'
+LAYOUTS = (LAYOUT_ROWS, LAYOUT_COLUMNAR)
+
+# 压缩后缀（清理过期文件时用）
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+# 写缓冲：攒够这么多字节再写文件 / 压缩（避免每条记录都调用一次 gzip）
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def default_export_mode():
+    """
+    默认导出模式（环境变量 EXPORT_MODE，未设置时为 development）
+
+    异常:
+        ValueError: 模式不支持
+    """
+    return validate_export_mode(os.getenv('EXPORT_MODE') or EXPORT_MODE_DEVELOPMENT)
+
+
+def validate_export_mode(mode):
+    """
+    检查导出模式
+
+    异常:
+        ValueError: 模式不支持
+    """
+    if mode not in EXPORT_MODES:
+        raise ValueError(f'不支持的导出模式：{mode}（可选：{"、".join(EXPORT_MODES)}）')
+    return mode
+
+
+def validate_layout(layout):
+    """
+    检查布局
+
+    异常:
+        ValueError: 布局不支持
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f'不支持的布局：{layout}（可选：{"、".join(LAYOUTS)}）')
+    return layout
+
+
+def dump_options(mode):
+    """
+    json.dump / json.dumps 的参数
+    """
+    if mode == EXPORT_MODE_PRODUCTION:
+        return {'ensure_ascii': False, 'separators': (',', ':')}
+    return {'ensure_ascii': False, 'indent': 2}
+
+
+def dumps(data, mode):
+    """
+    按导出模式序列化，返回 UTF-8 字节
+    """
+    return json.dumps(data, **dump_options(mode)).encode('utf-8')
+
+
+def to_columnar(rows):
+    """
+    对象数组 → 列式布局（字段顺序按第一次出现的顺序）
+    """
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    return {
+        'columns': columns,
+        'data': {key: [row.get(key) for row in rows] for key in columns},
+        'length': len(rows)
+    }
+
+
+def from_columnar(table):
+    """
+    列式布局 → 对象数组（to_columnar 的逆操作，补齐的 null 会保留）
+    """
+    data = table['data']
+    return [
+        {key: data[key][index] for key in table['columns']}
+        for index in range(table['length'])
+    ]
+
+
+# ========================================
+# 流式 JSON 编码
+# ========================================
+class JsonArray:
+    """
+    惰性数组：iter_json 输出时才迭代（每个元素是普通的 JSON 值）
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+
+class JsonColumns:
+    """
+    惰性列式表：iter_json 输出时才迭代记录，编码结果与 json.dumps(to_columnar(rows)) 相同
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class CountingIterator:
+    """
+    包一层迭代器，记下已经输出的条数（流式导出时统计记录数）
+    """
+
+    def __init__(self, items):
+        self._items = iter(items)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._items)
+        self.count += 1
+        return item
+
+
+def lazy_rows(rows, layout):
+    """
+    按布局包装记录迭代器（rows → JsonArray，columnar → JsonColumns）
+    """
+    return JsonColumns(rows) if validate_layout(layout) == LAYOUT_COLUMNAR else JsonArray(rows)
+
+
+class _Encoder:
+    """
+    与 json.dumps 格式一致的分段编码器（支持 JsonArray / JsonColumns）
+    """
+
+    def __init__(self, mode):
+        self.options = dump_options(mode)
+        self.indent = self.options.get('indent')
+        # json.dumps 指定 indent 时的默认分隔符是 (',', ': ')
+        self.key_separator = ': ' if self.indent is not None else ':'
+
+    def newline(self, level):
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * level)
+
+    def dumps(self, value, level):
+        """
+        普通值：json.dumps 之后把换行补上当前层级的缩进
+        （JSON 字符串里的换行都被转义了，直接替换是安全的）
+        """
+        text = json.dumps(value, **self.options)
+        if self.indent is not None and level:
+            text = text.replace('\n', self.newline(level))
+        return text
+
+    def key(self, name, level, first):
+        return ('' if first else ',') + self.newline(level) + json.dumps(name, ensure_ascii=False) + self.key_separator
+
+    def encode(self, value, level=0):
+        if isinstance(value, JsonArray):
+            yield from self.encode_array(value.items, level)
+        elif isinstance(value, JsonColumns):
+            yield from self.encode_columns(value.rows, level)
+        elif isinstance(value, dict) and any(isinstance(item, (JsonArray, JsonColumns)) for item in value.values()):
+            yield from self.encode_object(value, level)
+        else:
+            yield self.dumps(value, level)
+
+    def encode_object(self, value, level):
+        yield '{'
+        for index, (name, item) in enumerate(value.items()):
+            yield self.key(name, level + 1, index == 0)
+            yield from self.encode(item, level + 1)
+        yield self.newline(level) + '}'
+
+    def encode_array(self, items, level):
+        empty = True
+        for item in items:
+            yield ('[' if empty else ',') + self.newline(level + 1)
+            yield from self.encode(item, level + 1)
+            empty = False
+        yield '[]' if empty else self.newline(level) + ']'
+
+    def encode_columns(self, rows, level):
+        """
+        列式表：每列的值先写到自己的临时文件（补齐前面记录的 null），再依次拼接输出
+        """
+        item_level = level + 3
+        spools = {}
+        length = 0
+
+        try:
+            for row in rows:
+                for name in row:
+                    if name not in spools:
+                        spools[name] = tempfile.TemporaryFile('w+', encoding='utf-8')
+                        for index in range(length):
+                            spools[name].write(self._column_item(None, index, item_level))
+                for name, spool in spools.items():
+                    spool.write(self._column_item(row.get(name), length, item_level))
+                length += 1
+
+            columns = list(spools)
+            yield '{' + self.key('columns', level + 1, True) + self.dumps(columns, level + 1)
+            yield self.key('data', level + 1, False)
+            if not columns:
+                yield '{}'
+            else:
+                yield '{'
+                for index, name in enumerate(columns):
+                    yield self.key(name, level + 2, index == 0)
+                    if length == 0:
+                        yield '[]'
+                        continue
+                    yield '['
+                    spool = spools[name]
+                    spool.seek(0)
+                    while True:
+                        chunk = spool.read(WRITE_BUFFER_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+                    yield self.newline(level + 2) + ']'
+                yield self.newline(level + 1) + '}'
+            yield self.key('length', level + 1, False) + str(length) + self.newline(level) + '}'
+        finally:
+            for spool in spools.values():
+                spool.close()
+
+    def _column_item(self, value, index, level):
+        return ('' if index == 0 else ',') + self.newline(level) + self.dumps(value, level)
+
+
+def iter_json(value, mode):
+    """
+    分段输出 JSON 文本（JsonArray / JsonColumns 按需迭代）
+
+    对普通数据，''.join(iter_json(data, mode)) == json.dumps(data, **dump_options(mode))
+    """
+    return _Encoder(mode).encode(value)
+
+
+# ========================================
+# 导出文件写入
+# ========================================
+def fsync_directory(directory):
+    """
+    把目录项（重命名）也落盘；Windows 不支持打开目录，跳过
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ArtifactWriter:
+    """
+    流式写一个导出文件：原文件、.gz、.br 同时写到临时文件，边写边算 SHA-256
+
+        with ArtifactWriter(directory, precompress=True) as writer:
+            for chunk in iter_json(data, mode):
+                writer.write(chunk)
+            sizes = writer.commit(path)
+        # 不调用 commit 就退出 with 块（或中途出错）时，临时文件全部删除
+
+    commit 时先替换压缩版本、最后替换原文件：原文件存在时压缩版本一定已经写好
+    （分片按原文件是否存在判断要不要重写）。
+    """
+
+    def __init__(self, directory, precompress=False):
+        self.directory = directory
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._buffer = []
+        self._buffered = 0
+        self._files = {}     # 后缀 → (临时路径, 文件对象)
+        self._gzip = None
+        self._brotli = None
+
+        self._open('')
+        if precompress:
+            # filename=''、mtime=0：内容相同时 .gz 也逐字节相同
+            self._gzip = gzip.GzipFile(filename='', mode='wb', compresslevel=9,
+                                       fileobj=self._open('.gz'), mtime=0)
+            if brotli is not None:
+                self._open('.br')
+                self._brotli = brotli.Compressor()
+
+    def _open(self, suffix):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.export.', suffix=suffix + '.tmp')
+        f = os.fdopen(fd, 'wb')
+        self._files[suffix] = (tmp_path, f)
+        return f
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.discard()
+        return False
+
+    def write(self, data):
+        """
+        写入一段内容（str 按 UTF-8 编码）
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= WRITE_BUFFER_SIZE:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+
+        self.size += len(data)
+        self._sha256.update(data)
+        self._files[''][1].write(data)
+        if self._gzip is not None:
+            self._gzip.write(data)
+        if self._brotli is not None:
+            self._files['.br'][1].write(self._brotli.process(data))
+
+    def hexdigest(self):
+        """
+        原文件内容的 SHA-256（写完之后调用）
+        """
+        self._flush_buffer()
+        return self._sha256.hexdigest()
+
+    def commit(self, path):
+        """
+        落盘并原子替换到 path（压缩版本为 path.gz / path.br）
+
+        这次没有生成的压缩版本（如之前预压缩、这次没有）会被删除，
+        静态服务器（nginx gzip_static 等）不会再发送旧内容。
+
+        返回:
+        {
+          "json": 18234,     // 原文件字节数
+          "gzip": 2210,
+          "brotli": 1874     // 没装 brotli 时没有这一项
+        }
+        """
+        self._flush_buffer()
+        if self._gzip is not None:
+            self._gzip.close()
+        if self._brotli is not None:
+            self._files['.br'][1].write(self._brotli.finish())
+
+        sizes = {'json': self.size}
+        names = {'.gz': 'gzip', '.br': 'brotli'}
+        # 原文件（后缀 ''）最后替换
+        for suffix in sorted(self._files, key=lambda suffix: suffix == ''):
+            if suffix == '':
+                # 替换原文件之前删除过时的压缩版本
+                for stale in COMPRESSED_SUFFIXES:
+                    if stale not in self._files and os.path.exists(path + stale):
+                        os.remove(path + stale)
+            tmp_path, f = self._files[suffix]
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            # mkstemp 创建的文件权限是 0600，改成普通文件的权限，静态服务器才能读
+            os.chmod(tmp_path, 0o644)
+            if suffix:
+                sizes[names[suffix]] = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path + suffix)
+        self._files = {}
+
+        fsync_directory(self.directory)
+        return sizes
+
+    def discard(self):
+        """
+        放弃写入，删除所有临时文件（commit 之后调用没有影响）
+        """
+        if self._gzip is not None and not self._gzip.closed and self._files:
+            self._gzip.close()
+        for tmp_path, f in self._files.values():
+            f.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._files = {}
+
+
+def write_artifact(path, content, precompress=True):
+    """
+    原子写入导出文件（整段内容），并在旁边写 .gz / .br 压缩版本
+
+    返回:
+        dict: 各格式字节数（同 ArtifactWriter.commit）
+    """
+    with ArtifactWriter(os.path.dirname(os.path.abspath(path)), precompress) as writer:
+        writer.write(content)
+        return writer.commit(path)
+
+
+def artifact_sizes(path):
+    """
+    已存在的导出文件及其压缩版本的字节数（格式同 write_artifact 的返回值）
+    """
+    sizes = {'json': os.path.getsize(path)}
+    for suffix, name in (('.gz', 'gzip'), ('.br', 'brotli')):
+        if os.path.exists(path + suffix):
+            sizes[name] = os.path.getsize(path + suffix)
+    return sizes
+
+
+def add_sizes(total, sizes):
+    """
+    累加字节数（多个分片合计）
+    """
+    for key, value in sizes.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+if __name__ == '__main__':
+    # 自检：流式编码与 json.dumps 逐字节相同（python -m utils.export_format）
+    import random
+
+    random.seed(0)
+    optional = ['installment_number', 'parent_category', 'contract_info']
+    for case in range(300):
+        rows = []
+        for index in range(random.randint(0, 8)):
+            row = {'id': index, 'date': f'2025-01-{index + 1:02d}', 'note': random.choice([None, '晨泳', 'a"b\n'])}
+            for name in random.sample(optional, random.randint(0, 3)):
+                row[name] = {'total_periods': 52, 'paid_periods': 3} if name == 'contract_info' else index
+            rows.append(row)
+        for mode in EXPORT_MODES:
+            for layout in LAYOUTS:
+                plain = to_columnar(rows) if layout == LAYOUT_COLUMNAR else rows
+                expected = json.dumps({'roi': {'a': 1}, 'items': plain, 'n': None}, **dump_options(mode))
+                streamed = ''.join(iter_json({'roi': {'a': 1}, 'items': lazy_rows(iter(rows), layout), 'n': None}, mode))
+                assert streamed == expected, (mode, layout, rows)
+                assert ''.join(iter_json(lazy_rows(iter(rows), layout), mode)) == json.dumps(plain, **dump_options(mode))
+
+                # 列式布局能还原成对象数组（缺少的字段补成 null）
+                if layout == LAYOUT_COLUMNAR:
+                    table = json.loads(''.join(iter_json(lazy_rows(iter(rows), layout), mode)))
+                    columns = table['columns']
+                    assert from_columnar(table) == [{key: row.get(key) for key in columns} for row in rows]
+    print('[OK] 流式编码与 json.dumps 一致，列式布局可以还原')
+
+    # 自检：不再预压缩时删除旧的 .gz / .br
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, 'summary.json')
+        write_artifact(target, '{"v": 1}', precompress=True)
+        open(target + '.br', 'wb').close()
+        write_artifact(target, '{"v": 2}', precompress=False)
+        assert sorted(os.listdir(tmp)) == ['summary.json'], os.listdir(tmp)
+    print('[OK] 过时的压缩版本已删除')
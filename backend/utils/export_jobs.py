@@ -0,0 +1,224 @@
+"""
+后台导出任务（进程内任务队列 + 进度查询）
+
+问题：POST /api/export/json 在请求里同步导出，数据多时一直占着一个 worker 线程，
+客户端也可能等到超时。
+
+做法：
+1. submit_export_job() 把导出放进进程内的线程池（ThreadPoolExecutor），立即返回任务
+2. 线程池只有 1 个线程：所有导出写同一个目录
+   （manifest.json、分片清理），排队依次执行，不会互相覆盖
+3. 合并重复请求：已有相同选项的任务在排队或运行时，直接返回那个任务，不再排新任务
+   （force 的任务也能满足不带 force 的请求，反过来不行）
+4. get_export_job() 查询任务状态、进度、耗时和导出结果（export_json 的返回值）
+5. 同步导出（run_export_job）也排进同一个线程池再等待完成，
+   不会和后台任务同时写导出目录（分片清理和 manifest 写入互相干扰）
+
+任务只保存在内存里，最多保留最近 MAX_FINISHED_JOBS 个已结束的任务，进程重启后清空。
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import db
+from utils.exporter import export_json, normalize_export_options
+
+# 内存里最多保留多少个已结束的任务
+MAX_FINISHED_JOBS = 50
+
+# 任务表（进程内共享）
+_jobs_lock = threading.Lock()
+_jobs = OrderedDict()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+    return _executor
+
+
+def _job_snapshot(job):
+    """
+    任务的可序列化副本（加上百分比和耗时）
+    """
+    snapshot = {key: value for key, value in job.items() if not key.startswith('_')}
+    snapshot['options'] = dict(job['options'])
+    snapshot['progress'] = progress = dict(job['progress'])
+
+    if progress['total']:
+        progress['percentage'] = round(progress['processed'] / progress['total'] * 100, 2)
+    else:
+        progress['percentage'] = 100.0 if job['status'] == 'completed' else 0.0
+
+    # 耗时：运行中的任务算到现在
+    if job['_started'] is not None:
+        finished = job['_finished'] if job['_finished'] is not None else time.perf_counter()
+        snapshot['duration'] = round(finished - job['_started'], 3)
+    else:
+        snapshot['duration'] = None
+
+    return snapshot
+
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+
+def _prune_jobs():
+    """
+    只保留最近 MAX_FINISHED_JOBS 个已结束的任务（调用方持有 _jobs_lock）
+    """
+    finished = [job_id for job_id, job in _jobs.items() if job['status'] in ('completed', 'failed')]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def _find_active_job(options):
+    """
+    排队或运行中、能满足这些选项的任务（调用方持有 _jobs_lock）
+    """
+    for job in _jobs.values():
+        if job['status'] not in ('queued', 'running'):
+            continue
+        same = all(job['options'][key] == options[key] for key in ('mode', 'layout', 'precompress'))
+        if same and (job['options']['force'] or not options['force']):
+            return job
+    return None
+
+
+def _run_job(app, job_id, options):
+    """
+    线程池里执行一个导出任务
+    """
+    def report(stage, processed, total):
+        _update_job(job_id, progress={'stage': stage, 'processed': processed, 'total': total})
+
+    _update_job(job_id, status='running', started_at=datetime.now().isoformat(), _started=time.perf_counter())
+
+    with app.app_context():
+        try:
+            result = export_json(progress=report, **options)
+            _update_job(
+                job_id, status='completed', result=result,
+                finished_at=datetime.now().isoformat(), _finished=time.perf_counter()
+            )
+
+        except Exception as e:
+            db.session.rollback()
+            _update_job(
+                job_id, status='failed', error=str(e),
+                finished_at=datetime.now().isoformat(), _finished=time.perf_counter()
+            )
+
+        finally:
+            db.session.remove()
+
+
+def _enqueue_job(app, force, mode, layout, precompress):
+    """
+    排进线程池或合并到已有任务
+
+    返回:
+        tuple: (任务 dict, 结束前的状态副本, 是否合并到了已有任务)
+    """
+    mode, layout, precompress = normalize_export_options(mode, layout, precompress)
+    options = {'force': bool(force), 'mode': mode, 'layout': layout, 'precompress': precompress}
+
+    with _jobs_lock:
+        job = _find_active_job(options)
+        if job is not None:
+            job['coalesced'] += 1
+            return job, _job_snapshot(job), True
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'status': 'queued',       # queued / running / completed / failed
+            'options': options,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'progress': {'stage': None, 'processed': 0, 'total': 0},
+            'coalesced': 0,           # 合并进来的重复请求数
+            'result': None,
+            'error': None,
+            '_started': None,
+            '_finished': None,
+            '_future': None
+        }
+        _jobs[job_id] = job
+        _prune_jobs()
+        # 在锁里提交：合并进来的请求一定能拿到 _future
+        job['_future'] = _get_executor().submit(_run_job, app, job_id, options)
+        return job, _job_snapshot(job), False
+
+
+def submit_export_job(app, force=False, mode=None, layout=None, precompress=None):
+    """
+    提交后台导出任务（立即返回；相同选项的任务在排队或运行时直接返回那个任务）
+
+    参数:
+        app: Flask 应用对象（线程里需要自己的 app context）
+        force / mode / layout / precompress: 同 export_json
+
+    返回:
+        tuple: (任务状态 dict, 是否合并到了已有任务)
+
+    异常:
+        ValueError: 导出选项不合法（提交前就校验，不会排进队列）
+    """
+    _, snapshot, coalesced = _enqueue_job(app, force, mode, layout, precompress)
+    return snapshot, coalesced
+
+
+def run_export_job(app, force=False, mode=None, layout=None, precompress=None):
+    """
+    同步导出：同样排进线程池（或合并到进行中的相同任务），等待完成后返回
+
+    参数:
+        app: Flask 应用对象
+        force / mode / layout / precompress: 同 export_json
+
+    返回:
+        dict: 结束时的任务状态（同 get_export_job）
+
+    异常:
+        ValueError: 导出选项不合法
+    """
+    job, _, _ = _enqueue_job(app, force, mode, layout, precompress)
+    job['_future'].result()
+    with _jobs_lock:
+        return _job_snapshot(job)
+
+
+def get_export_job(job_id):
+    """
+    查询导出任务
+
+    返回（任务不存在或已被清理时返回 None）:
+    {
+      "id": "3f2b...",
+      "status": "running",
+      "options": {"force": false, "mode": "production", "layout": "rows", "precompress": true},
+      "created_at": "2025-10-18T10:30:00",
+      "started_at": "2025-10-18T10:30:00",
+      "finished_at": null,
+      "duration": 1.284,        // 秒（运行中的任务算到现在）
+      "progress": {"stage": "summary", "processed": 3000, "total": 10400, "percentage": 28.85},
+      "coalesced": 2,
+      "result": null,           // 完成后为 export_json 的返回值（stats / manifest / sizes 等）
+      "error": null
+    }
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return _job_snapshot(job) if job is not None else None
@@ -0,0 +1,174 @@
+"""
+分片导出（manifest.json + 按年分片）
+
+问题：Public 前端每次都下载一个包含全部支出和活动的 summary.json，文件越来越大。
+
+做法：
+- manifest.json：很小，包含 ROI 摘要和分片列表（每片的文件名、内容哈希、条数）
+- shards/expenses-2025.<哈希>.json、shards/activities-2025.<哈希>.json：按年分片
+  文件名带内容哈希，内容不变的分片文件名也不变，浏览器 / CDN 可以一直缓存；
+  前端先读 manifest，只下载最近几年的分片
+
+记录按日期倒序流式读取，同一年的记录是连续的（itertools.groupby 直接分组），
+每个分片边读边写，内存占用与记录条数无关。
+
+清理：删除新 manifest 和上一版 manifest 都没有引用的分片文件（连同 .gz / .br）
+（保留上一版，正在用旧 manifest 加载的页面不会 404）。
+
+分片和 manifest 的序列化方式（紧凑 / 列式 / 预压缩）见 utils/export_format.py，
+manifest 的 layout 字段告诉前端分片是哪种布局。
+"""
+
+import json
+import os
+from itertools import groupby
+
+from utils.export_format import (
+    EXPORT_MODE_DEVELOPMENT, LAYOUT_ROWS, COMPRESSED_SUFFIXES,
+    ArtifactWriter, CountingIterator, dumps, iter_json, lazy_rows,
+    write_artifact, artifact_sizes, add_sizes
+)
+
+MANIFEST_FILE = 'manifest.json'
+SHARD_DIR = 'shards'
+MANIFEST_FORMAT_VERSION = 1
+
+# 文件名里的哈希长度（十六进制位数）
+HASH_PREFIX_LENGTH = 12
+
+
+def shard_key(row):
+    """
+    记录所属的分片（按年：date 的前 4 位）
+    """
+    return row['date'][:4]
+
+
+def _write_shard(data_dir, kind, key, rows, mode, layout, precompress):
+    """
+    流式写一个分片（内容寻址：同名文件已存在说明内容相同，丢弃临时文件）
+
+    返回:
+        tuple: (manifest 里的分片信息, 各格式字节数, 是否新写入)
+    """
+    shard_dir = os.path.join(data_dir, SHARD_DIR)
+    counted = CountingIterator(rows)
+
+    with ArtifactWriter(shard_dir, precompress) as writer:
+        for chunk in iter_json(lazy_rows(counted, layout), mode):
+            writer.write(chunk)
+
+        digest = writer.hexdigest()
+        file_name = f'{kind}-{key}.{digest[:HASH_PREFIX_LENGTH]}.json'
+        path = os.path.join(shard_dir, file_name)
+
+        # 压缩版本也要在（之前导出时可能没开预压缩）
+        written = not os.path.exists(path) or (precompress and not os.path.exists(path + '.gz'))
+        sizes = writer.commit(path) if written else artifact_sizes(path)
+        content_size = writer.size
+
+    shard = {
+        'key': key,
+        'file': f'{SHARD_DIR}/{file_name}',
+        'hash': f'sha256-{digest}',
+        'count': counted.count,
+        'bytes': content_size
+    }
+    return shard, sizes, written
+
+
+def _referenced_files(manifest):
+    return {
+        shard['file']
+        for shards in manifest.get('shards', {}).values()
+        for shard in shards
+    }
+
+
+def _read_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_sharded_export(data_dir, roi, expenses, activities, data_version, last_updated,
+                         mode=EXPORT_MODE_DEVELOPMENT, layout=LAYOUT_ROWS, precompress=False):
+    """
+    写入分片和 manifest.json（先写分片，最后原子替换 manifest）
+
+    参数:
+        data_dir (str): 导出目录（public-static/data）
+        roi (dict): ROI 摘要
+        expenses / activities (iterable): 已序列化的记录（按日期倒序，可以是流式迭代器）
+        data_version (int): 数据版本号
+        last_updated (str): 导出时间
+        mode (str): development / production（见 utils/export_format.py）
+        layout (str): rows / columnar
+        precompress (bool): 是否生成 .gz / .br
+
+    返回:
+    {
+      "file_path": "/data/manifest.json",
+      "shards_written": 1,      // 本次新写入的分片数（其余内容没变，沿用原文件）
+      "shards_total": 6,
+      "shards_removed": 2,
+      "sizes": {
+        "manifest": {"json": 812, "gzip": 402},
+        "shards": {"json": 182340, "gzip": 22100}   // 所有分片合计
+      }
+    }
+    """
+    os.makedirs(os.path.join(data_dir, SHARD_DIR), exist_ok=True)
+    manifest_path = os.path.join(data_dir, MANIFEST_FILE)
+    previous = _read_manifest(manifest_path)
+
+    shards = {}
+    shard_sizes = {}
+    written = 0
+    counts = {}
+    for kind, rows in (('expenses', expenses), ('activities', activities)):
+        shards[kind] = []
+        for key, shard_rows in groupby(rows, key=shard_key):
+            shard, sizes, shard_written = _write_shard(
+                data_dir, kind, key, shard_rows, mode, layout, precompress
+            )
+            shards[kind].append(shard)
+            add_sizes(shard_sizes, sizes)
+            written += shard_written
+        counts[kind] = sum(shard['count'] for shard in shards[kind])
+
+    manifest = {
+        'format': MANIFEST_FORMAT_VERSION,
+        'shardBy': 'year',
+        'layout': layout,
+        'roi': roi,
+        'lastUpdated': last_updated,
+        'dataVersion': data_version,
+        'counts': counts,
+        'shards': shards
+    }
+    manifest_sizes = write_artifact(manifest_path, dumps(manifest, mode), precompress)
+
+    # 清理两版 manifest 都不再引用的分片（.gz / .br 跟着原文件走，只按原文件计数）
+    keep = _referenced_files(manifest) | _referenced_files(previous)
+    removed = 0
+    shard_dir = os.path.join(data_dir, SHARD_DIR)
+    for file_name in os.listdir(shard_dir):
+        base_name = file_name
+        for suffix in COMPRESSED_SUFFIXES:
+            if base_name.endswith(suffix):
+                base_name = base_name[:-len(suffix)]
+        if base_name.endswith('.json') and f'{SHARD_DIR}/{base_name}' not in keep:
+            os.remove(os.path.join(shard_dir, file_name))
+            removed += base_name == file_name
+
+    return {
+        'file_path': f'/data/{MANIFEST_FILE}',
+        'shards_written': written,
+        'shards_total': sum(len(entries) for entries in shards.values()),
+        'shards_removed': removed,
+        'counts': counts,
+        'sizes': {'manifest': manifest_sizes, 'shards': shard_sizes}
+    }
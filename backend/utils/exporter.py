@@ -0,0 +1,309 @@
+"""
+数据导出（summary.json + 分片 + manifest.json）
+
+路由 POST /api/export/json 和基准测试共用这里的 export_json。
+
+流式导出：支出和活动都用 yield_per 分批从数据库读取（只取需要的列，不建 ORM 对象），
+逐条编码写入文件（见 utils/export_format.py 的 iter_json / ArtifactWriter），
+不会先拼成完整的列表，内存峰值与记录条数无关。
+summary.json 和分片各读一遍数据库（查询次数固定）。
+
+进度：传入 progress 回调时先 COUNT 一次记录条数，
+之后每读 EXPORT_BATCH_SIZE 条回调一次（后台导出任务用，见 utils/export_jobs.py）。
+"""
+
+import os
+from datetime import datetime
+
+from models import db, Expense, Activity, MembershipContract
+from utils.roi import get_roi_summary_data
+from utils.schedule import load_contract_progress
+from utils.export_shards import MANIFEST_FILE, write_sharded_export
+from utils.export_format import (
+    EXPORT_MODE_PRODUCTION, LAYOUT_ROWS,
+    ArtifactWriter, CountingIterator, default_export_mode, validate_export_mode, validate_layout,
+    iter_json, lazy_rows, artifact_sizes
+)
+from utils.data_version import get_data_version, export_marker, get_export_marker, mark_exported
+
+SUMMARY_FILE = 'summary.json'
+
+# 每批从数据库读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_data_dir():
+    """
+    导出目录：项目根目录下的 public-static/data/（不存在时创建）
+
+    只导出到这一个目录（统一位置）：
+    - 开发环境: Vite 通过 publicDir 直接访问
+    - 生产构建: vite-plugin-static-copy 会复制到 dist/
+    - Git 提交: 只提交这一个文件
+    """
+    # __file__ -> utils/exporter.py -> backend/ -> project_root/
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    project_root = os.path.dirname(backend_dir)
+
+    data_dir = os.path.join(project_root, 'public-static', 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def normalize_export_options(mode=None, layout=None, precompress=None):
+    """
+    校验导出选项并补上默认值（后台任务按规范化后的选项合并重复请求）
+
+    返回:
+        tuple: (mode, layout, precompress)
+
+    异常:
+        ValueError: 导出选项不合法
+    """
+    mode = validate_export_mode(mode) if mode else default_export_mode()
+    layout = validate_layout(layout or LAYOUT_ROWS)
+    if precompress is None:
+        precompress = mode == EXPORT_MODE_PRODUCTION
+    return mode, layout, bool(precompress)
+
+
+class _ProgressTracker:
+    """
+    导出进度：summary.json 和分片各读一遍数据，processed / total 按两遍合计
+    """
+
+    def __init__(self, callback, total):
+        self.callback = callback
+        self.total = total
+        self.processed = 0
+
+    def report(self, stage):
+        self.callback(stage, self.processed, self.total)
+
+    def track(self, rows, stage):
+        for row in rows:
+            yield row
+            self.processed += 1
+            if self.processed % EXPORT_BATCH_SIZE == 0:
+                self.report(stage)
+
+
+def _count_rows():
+    """
+    支出和活动的总条数（只在需要报告进度时查询）
+    """
+    return db.session.execute(
+        db.select(
+            db.select(db.func.count(Expense.id)).scalar_subquery(),
+            db.select(db.func.count(Activity.id)).scalar_subquery()
+        )
+    ).one()
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def load_contract_info():
+    """
+    所有分期合同父支出的期数信息（合同一条查询 + 进度一条 GROUP BY 查询）
+
+    返回:
+        dict: {父支出 id: {"total_periods": 52, "paid_periods": 20}}
+    """
+    contracts = MembershipContract.query.order_by(MembershipContract.id).all()
+    progress = load_contract_progress(contracts)
+
+    # 同一父支出有多份合同时取 id 最小的一份（与以前的 .first() 一致）
+    info = {}
+    for contract in contracts:
+        if contract.expense_id in info:
+            continue
+        stats = progress[contract.id]
+        info[contract.expense_id] = {
+            'total_periods': stats['paid_count'] + stats['pending_count'],
+            'paid_periods': stats['paid_count']
+        }
+    return info
+
+
+def iter_expense_rows(contract_info_map):
+    """
+    流式读取所有支出（按日期倒序，同一天按 id 倒序），逐条生成导出用的字典
+
+    期数：ROW_NUMBER() OVER (PARTITION BY parent_expense_id ORDER BY date)，
+    同一父支出下的子支出按日期排第几就是第几期（日期相同时按 id）；
+    父支出类别：自连接一次，不再逐条 get。
+    """
+    parent = db.aliased(Expense)
+    installment_number = db.func.row_number().over(
+        partition_by=Expense.parent_expense_id,
+        order_by=(Expense.date, Expense.id)
+    )
+
+    rows = db.session.execute(
+        db.select(
+            Expense.id, Expense.amount, Expense.currency, Expense.date, Expense.type,
+            Expense.category, Expense.note, Expense.is_installment, Expense.parent_expense_id,
+            db.case((Expense.parent_expense_id.isnot(None), installment_number)).label('installment_number'),
+            parent.category.label('parent_category')
+        )
+        .outerjoin(parent, parent.id == Expense.parent_expense_id)
+        .order_by(Expense.date.desc(), Expense.id.desc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    for row in rows:
+        expense_dict = {
+            'id': row.id,
+            'amount': float(row.amount),
+            'currency': row.currency,
+            'date': _isoformat(row.date),
+            'type': row.type,
+            'category': row.category,
+            'note': row.note,
+            'is_installment': row.is_installment,
+            'parent_expense_id': row.parent_expense_id
+        }
+
+        # 如果是分期合同，添加合同信息
+        if row.is_installment and not row.parent_expense_id and row.id in contract_info_map:
+            expense_dict['contract_info'] = contract_info_map[row.id]
+
+        # 如果是分期子支出，添加期数信息和父支出的类别
+        if row.parent_expense_id:
+            expense_dict['installment_number'] = row.installment_number
+            if row.parent_category is not None:
+                expense_dict['parent_category'] = row.parent_category
+
+        yield expense_dict
+
+
+def iter_activity_rows():
+    """
+    流式读取所有活动（按日期倒序，同一天按 id 倒序），逐条生成导出用的字典
+    """
+    rows = db.session.execute(
+        db.select(Activity.id, Activity.distance, Activity.date, Activity.calculated_weight, Activity.note)
+        .order_by(Activity.date.desc(), Activity.id.desc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    for row in rows:
+        yield {
+            'id': row.id,
+            'distance': row.distance,
+            'date': _isoformat(row.date),
+            'calculated_weight': float(row.calculated_weight),
+            'note': row.note
+        }
+
+
+def export_json(force=False, mode=None, layout=LAYOUT_ROWS, precompress=None, data_dir=None, progress=None):
+    """
+    导出 summary.json、分片和 manifest.json
+
+    参数:
+        force (bool): 忽略版本号，强制重新导出
+        mode (str): development / production，默认取环境变量 EXPORT_MODE
+        layout (str): rows / columnar
+        precompress (bool): 是否生成 .gz / .br，默认 production 模式下生成
+        data_dir (str): 导出目录，默认 public-static/data
+        progress (callable): 进度回调 progress(stage, processed, total)，
+            stage 为 summary / shards，total 为两遍读取的记录总数
+
+    返回:
+        dict: POST /api/export/json 的响应内容（不含 success）
+
+    异常:
+        ValueError: 导出选项不合法
+    """
+    mode, layout, precompress = normalize_export_options(mode, layout, precompress)
+
+    data_dir = data_dir or export_data_dir()
+    file_path = os.path.join(data_dir, SUMMARY_FILE)
+    manifest_path = os.path.join(data_dir, MANIFEST_FILE)
+
+    # 0. 数据和导出选项都没有变化：直接返回
+    #    版本号在查询数据之前读取；导出期间有新的写入时记下的是旧版本号，下次导出会重新生成
+    data_version = get_data_version()
+    marker = export_marker(data_version, mode, layout, 'gz' if precompress else 'plain')
+    if (
+        not force
+        and data_version is not None
+        and marker == get_export_marker()
+        and os.path.exists(file_path)
+        and os.path.exists(manifest_path)
+    ):
+        return {
+            'skipped': True,
+            'data_version': data_version,
+            'file_path': f'/data/{SUMMARY_FILE}',
+            'timestamp': datetime.now().isoformat(),
+            'sizes': {
+                'summary': artifact_sizes(file_path),
+                'manifest': artifact_sizes(manifest_path)
+            }
+        }
+
+    # 1. 计算 ROI 数据（与 /api/roi/summary 共用 utils/roi.py）和合同进度（都很小）
+    roi_summary = get_roi_summary_data()
+    contract_info_map = load_contract_info()
+    last_updated = datetime.now().isoformat()
+
+    tracker = None
+    if progress is not None:
+        tracker = _ProgressTracker(progress, sum(_count_rows()) * 2)
+        tracker.report('summary')
+
+    def read_rows(stage):
+        expense_rows, activity_rows = iter_expense_rows(contract_info_map), iter_activity_rows()
+        if tracker is None:
+            return expense_rows, activity_rows
+        return tracker.track(expense_rows, stage), tracker.track(activity_rows, stage)
+
+    # 2. summary.json：支出和活动边读边写
+    expense_rows, activity_rows = read_rows('summary')
+    expenses = CountingIterator(expense_rows)
+    activities = CountingIterator(activity_rows)
+    export_data = {
+        'roi': roi_summary,
+        'layout': layout,
+        'expenses': lazy_rows(expenses, layout),
+        'activities': lazy_rows(activities, layout),
+        'lastUpdated': last_updated,
+        'dataVersion': data_version
+    }
+    with ArtifactWriter(data_dir, precompress) as writer:
+        for chunk in iter_json(export_data, mode):
+            writer.write(chunk)
+        summary_sizes = writer.commit(file_path)
+
+    # 3. 分片导出：manifest.json + 按年分片（再流式读一遍）
+    manifest_result = write_sharded_export(
+        data_dir, roi_summary, *read_rows('shards'),
+        data_version, last_updated,
+        mode=mode, layout=layout, precompress=precompress
+    )
+    sizes = dict(summary=summary_sizes, **manifest_result.pop('sizes'))
+    manifest_result.pop('counts')
+
+    # 4. 记下导出时的版本号和选项
+    if data_version is not None:
+        mark_exported(marker)
+    if tracker is not None:
+        tracker.report('shards')
+
+    return {
+        'skipped': False,
+        'data_version': data_version,
+        'file_path': f'/data/{SUMMARY_FILE}',
+        'timestamp': datetime.now().isoformat(),
+        'stats': {
+            'expenses_count': expenses.count,
+            'activities_count': activities.count,
+            'roi_percentage': roi_summary['paid']['roi_percentage']
+        },
+        'manifest': manifest_result,
+        'sizes': sizes
+    }
@@ -21,9 +21,22 @@
     1100m → 1.10 (多游100m，线性增长)
     1500m → 1.41 (多游500m，对数增长)
     2000m → 1.69 (多游1000m，边际收益递减)
+
+三个入口：
+    calculate_swimming_weight()  - 单个距离（Python 标量）
+    calculate_swimming_weights() - 批量距离（NumPy 数组），结果与标量版逐个相同
+    get_swimming_weight()        - 查表版本（按 (baseline, sigma) 缓存整张权重表）
 """
 
 import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 批量计算时，离 0.005 舍入边界太近的值交给标量版本重新计算
+# （NumPy 与 math 的 exp/log 可能差 1 ulp，只在边界附近会影响舍入结果）
+_ROUNDING_TIE_TOLERANCE = 1e-6
 
 
 def calculate_swimming_weight(distance, baseline=1000, sigma=550):
@@ -83,6 +96,188 @@ def calculate_swimming_weight(distance, baseline=1000, sigma=550):
     return round(final_weight, 2)
 
 
+def calculate_swimming_weights(distances, baseline=1000, sigma=550):
+    """
+    批量计算游泳距离的动态权重（calculate_swimming_weight 的数组版本）
+
+    参数:
+        distances (array_like): 游泳距离数组（列表、NumPy 数组或支持 buffer 协议的对象）
+        baseline (float 或 array_like): 基准距离，默认 1000m（可与 distances 广播）
+        sigma (float 或 array_like): 标准差，默认 550（可与 distances 广播）
+
+    返回:
+        numpy.ndarray: 权重数组（float64，保留2位小数），每个元素与标量版本完全相同
+
+    异常:
+        ValueError: 如果任何 distance < 0
+
+    示例:
+        >>> calculate_swimming_weights([0, 500, 1000, 1500])
+        array([0.  , 0.66, 1.  , 1.41])
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    baseline = np.asarray(baseline, dtype=np.float64)
+    sigma = np.asarray(sigma, dtype=np.float64)
+
+    # 边界条件：距离必须 >= 0（报错信息与标量版本一致）
+    negative = distances < 0
+    if np.any(negative):
+        first_negative = distances[negative].flat[0]
+        raise ValueError(f"游泳距离不能为负数：{first_negative:g}m")
+
+    # 计算偏离值（deviation）
+    deviation = distances - baseline
+
+    # 计算高斯权重
+    gaussian_weight = np.exp(-(deviation ** 2) / (2 * sigma ** 2))
+
+    # 非对称奖励机制：少于等于基准用高斯惩罚，多于基准用对数奖励
+    # （只对 deviation > 0 的部分取对数，clip 避免无意义的计算）
+    extra_ratio = np.clip(deviation, 0, None) / baseline
+    bonus = np.log(1 + extra_ratio)
+    weights = np.where(distances <= baseline, gaussian_weight, 1.0 + bonus)
+
+    # 距离为 0 时，权重为 0
+    weights = np.where(distances == 0, 0.0, weights)
+
+    # 保留2位小数
+    rounded = np.round(weights, 2)
+
+    # 离舍入边界太近的元素用标量版本重算，保证与 round(x, 2) 逐个一致
+    scaled = weights * 100
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < _ROUNDING_TIE_TOLERANCE
+    if np.any(near_tie):
+        d_full, b_full, s_full = np.broadcast_arrays(distances, baseline, sigma)
+        for index in zip(*np.nonzero(near_tie)):
+            rounded[index] = calculate_swimming_weight(
+                d_full[index], b_full[index], s_full[index]
+            )
+
+    return rounded
+
+
+# ========================================
+# 权重查找表（按参数缓存）
+# ========================================
+
+# 查找表覆盖的最大距离（米），超出范围的距离直接用公式计算
+WEIGHT_TABLE_MAX_DISTANCE = 20000
+
+# 最多缓存多少组 (baseline, sigma) 的查找表（LRU 淘汰）
+WEIGHT_TABLE_CACHE_SIZE = 8
+
+
+class WeightTableCache:
+    """
+    游泳权重查找表缓存
+
+    游泳距离几乎都是 25/50m 的倍数，而同一组参数下权重只取决于距离。
+    所以第一次用到某组 (baseline, sigma) 时，用批量函数一次算好
+    0 ~ max_distance 每个整数距离的权重，之后每次查询只是一次数组下标访问。
+
+    - 键：(baseline, sigma)
+    - 值：长度 max_distance + 1 的权重数组，下标就是距离
+    - 容量上限：maxsize 组，超出时淘汰最久未使用的一组（LRU）
+    - 统计：hits（命中已有的表）、misses（需要新建表）、fallbacks（表外距离，直接用公式）
+    """
+
+    def __init__(self, maxsize=WEIGHT_TABLE_CACHE_SIZE, max_distance=WEIGHT_TABLE_MAX_DISTANCE):
+        self.maxsize = maxsize
+        self.max_distance = max_distance
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def _get_table(self, baseline, sigma):
+        """
+        取出 (baseline, sigma) 对应的查找表，没有就新建（调用方持有锁）
+        """
+        key = (float(baseline), float(sigma))
+        table = self._tables.get(key)
+
+        if table is not None:
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return table
+
+        self.misses += 1
+        table = calculate_swimming_weights(np.arange(self.max_distance + 1), baseline, sigma)
+        self._tables[key] = table
+        if len(self._tables) > self.maxsize:
+            self._tables.popitem(last=False)
+        return table
+
+    def weight(self, distance, baseline=1000, sigma=550):
+        """
+        查表得到权重（结果与 calculate_swimming_weight 完全相同）
+        """
+        # 非整数、负数或超出表范围的距离：直接用公式（负数会在公式里报错）
+        if distance != int(distance) or not 0 <= distance <= self.max_distance:
+            with self._lock:
+                self.fallbacks += 1
+            return calculate_swimming_weight(distance, baseline, sigma)
+
+        with self._lock:
+            table = self._get_table(baseline, sigma)
+        return float(table[int(distance)])
+
+    def info(self):
+        """
+        缓存统计信息
+
+        返回:
+        {
+          "hits": 120,
+          "misses": 1,
+          "fallbacks": 0,
+          "size": 1,
+          "maxsize": 8,
+          "max_distance": 20000
+        }
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fallbacks': self.fallbacks,
+                'size': len(self._tables),
+                'maxsize': self.maxsize,
+                'max_distance': self.max_distance
+            }
+
+    def clear(self):
+        """
+        清空所有查找表和统计
+        """
+        with self._lock:
+            self._tables.clear()
+            self.hits = 0
+            self.misses = 0
+            self.fallbacks = 0
+
+
+# 进程内共享的查找表缓存
+_weight_table_cache = WeightTableCache()
+
+
+def get_swimming_weight(distance, baseline=1000, sigma=550):
+    """
+    计算游泳距离的动态权重（查表版本，创建/更新活动时使用）
+
+    参数、返回值、异常与 calculate_swimming_weight 相同。
+    """
+    return _weight_table_cache.weight(distance, baseline, sigma)
+
+
+def weight_cache_info():
+    """
+    查找表缓存的命中/未命中统计（见 WeightTableCache.info）
+    """
+    return _weight_table_cache.info()
+
+
 # ========================================
 # 测试函数（可选）
 # ========================================
@@ -115,4 +310,31 @@ if __name__ == '__main__':
         status = "✅ PASS" if abs(actual - expected) < 0.01 else "❌ FAIL"
         print(f"{distance:<12} {expected:<12} {actual:<12} {status:<10} {description}")
 
+    # 批量版本与标量版本逐个对比（0 ~ 20000m 的每个整数距离）
+    print("\n批量计算一致性测试\n" + "=" * 50)
+
+    all_distances = np.arange(0, 20001)
+    for baseline, sigma in [(1000, 550), (1000, 400), (800, 300), (1500, 700)]:
+        batch = calculate_swimming_weights(all_distances, baseline, sigma)
+        mismatches = [
+            int(d) for d, w in zip(all_distances, batch)
+            if w != calculate_swimming_weight(int(d), baseline, sigma)
+        ]
+        status = "✅ PASS" if not mismatches else f"❌ FAIL {mismatches[:5]}"
+        print(f"baseline={baseline:<6} sigma={sigma:<6} {status}")
+
+    # 查表版本与标量版本一致
+    table_ok = all(
+        get_swimming_weight(d) == calculate_swimming_weight(d)
+        for d in list(range(0, 20001, 25)) + [20001, 1234.5]
+    )
+    print(f"查表版本 {'✅ PASS' if table_ok else '❌ FAIL'} {weight_cache_info()}")
+
+    # 负数距离必须报错
+    try:
+        calculate_swimming_weights([100, -1])
+        print("负数距离 ❌ FAIL（没有报错）")
+    except ValueError as e:
+        print(f"负数距离 ✅ PASS（{e}）")
+
     print("\n测试完成！")
@@ -0,0 +1,133 @@
+"""
+游标分页（Keyset Pagination）工具
+
+为什么不用 OFFSET？
+- OFFSET n 需要数据库先扫过前 n 行，越往后翻越慢
+- 游标分页记住上一页最后一行的 (date, id)，下一页直接从索引里的这个位置往后读，
+  第 N 页和第 1 页成本一样
+
+排序：date 倒序、id 倒序（最新的在前），需要 (date, id) 复合索引配合。
+
+游标格式：base64url("2025-10-17|123")，对前端来说是不透明字符串。
+
+合同扣费列表按扣费日期升序分页，同一合同内日期唯一，游标只需要日期
+（encode_date_cursor / decode_date_cursor，格式 base64url("2025-10-17")）。
+"""
+
+import base64
+from datetime import date
+
+from models import db
+
+# 默认每页条数 / 最大每页条数
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row_date, row_id):
+    """
+    把 (date, id) 编码成游标字符串
+    """
+    raw = f'{row_date.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    把游标字符串解码成 (date, id)
+
+    异常:
+        ValueError: 游标格式不正确
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        row_date, row_id = raw.split('|')
+        return date.fromisoformat(row_date), int(row_id)
+    except Exception:
+        raise ValueError(f'无效的游标：{cursor}')
+
+
+def encode_date_cursor(row_date):
+    """
+    把日期编码成游标字符串（用于日期唯一的列表，如合同扣费）
+    """
+    return base64.urlsafe_b64encode(row_date.isoformat().encode('utf-8')).decode('ascii')
+
+
+def decode_date_cursor(cursor):
+    """
+    把游标字符串解码成日期
+
+    异常:
+        ValueError: 游标格式不正确
+    """
+    try:
+        return date.fromisoformat(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError(f'无效的游标：{cursor}')
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    """
+    解析 limit 参数（1 ~ MAX_PAGE_SIZE）
+
+    异常:
+        ValueError: 不是正整数
+    """
+    if value is None:
+        return default
+
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError('limit 必须大于 0')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_date_range(args, query, date_column):
+    """
+    按查询参数 from / to（闭区间，YYYY-MM-DD）过滤日期
+
+    异常:
+        ValueError: 日期格式不正确
+    """
+    if args.get('from'):
+        query = query.filter(date_column >= date.fromisoformat(args['from']))
+    if args.get('to'):
+        query = query.filter(date_column <= date.fromisoformat(args['to']))
+    return query
+
+
+def keyset_page(query, date_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    按 (date, id) 倒序取一页
+
+    参数:
+        query: 已经加好过滤条件的查询
+        date_column / id_column: 排序列（需要有 (date, id) 复合索引）
+        cursor (str): 上一页返回的 next_cursor，第一页为 None
+        limit (int): 每页条数
+
+    返回:
+        tuple: (本页记录列表, next_cursor 或 None)
+    """
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        # 行值比较：(date, id) < (cursor_date, cursor_id)，可以直接利用复合索引
+        query = query.filter(db.tuple_(date_column, id_column) < (cursor_date, cursor_id))
+
+    # 多取一条，用来判断是否还有下一页
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_cursor(last.date, last.id)
+
+    return rows, None
+
+
+def is_truthy(value):
+    """
+    解析布尔型查询参数（true / 1 / yes）
+    """
+    return str(value).lower() in ('1', 'true', 'yes')
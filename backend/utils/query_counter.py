@@ -0,0 +1,90 @@
+"""
+SQL 语句计数（用于发现 N+1 查询）
+
+两种用法：
+1. 代码里断言：
+       with count_queries() as counter:
+           client.get('/api/expenses?all=true')
+       assert counter.count <= 3
+
+2. 开发模式下每个响应都带 X-Query-Count 头（见 install_query_count_header），
+   在浏览器开发者工具里就能看到每个接口执行了几条 SQL。
+"""
+
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+# 当前线程正在进行的计数器（支持嵌套）
+_local = threading.local()
+
+
+class QueryCounter:
+    """
+    统计一段代码里执行的 SQL 语句条数
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __repr__(self):
+        return f'<QueryCounter count={self.count}>'
+
+
+def _counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    引擎事件：每执行一条 SQL 调用一次
+    """
+    for counter in _counters():
+        counter.count += 1
+        counter.statements.append(statement)
+
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+
+
+def install_query_counter(engine):
+    """
+    在引擎上注册计数事件（应用启动时调用一次）
+    """
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+@contextmanager
+def count_queries():
+    """
+    统计 with 块内执行的 SQL 条数（需要先调用 install_query_counter）
+    """
+    counter = QueryCounter()
+    _counters().append(counter)
+    try:
+        yield counter
+    finally:
+        _counters().remove(counter)
+
+
+def install_query_count_header(app):
+    """
+    给每个响应加上 X-Query-Count 头（只在调试模式下启用）
+    """
+
+    @app.before_request
+    def _start_query_count():
+        if app.debug:
+            g.query_count = 0
+
+    @app.after_request
+    def _add_query_count_header(response):
+        if app.debug and 'query_count' in g:
+            response.headers['X-Query-Count'] = str(g.query_count)
+        return response
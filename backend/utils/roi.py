@@ -0,0 +1,468 @@
+"""
+ROI 计算（共享模块）
+
+/api/roi/summary 和 /api/export/json 共用这里的逻辑，避免两份代码各算各的。
+
+计算规则：
+- planned_total: 所有顶层支出（全额支出 + 分期合同父支出）
+- paid_total:    全额支出 + 已付的分期子支出（WeeklyCharge.status='paid'）
+- weighted_total / total_activities: 所有活动的加权次数 / 活动数
+
+为什么用一条聚合 SQL？
+- 以前每个分期子支出都要单独查一次 WeeklyCharge（N+1 查询）
+- 现在用 EXISTS 子查询，一次往返就拿到全部合计值
+
+物化合计表（roi_aggregates）：
+- 写入活动/支出/合同时，调用 apply_roi_delta() 在同一事务里按差值更新
+- 读取 ROI 摘要时只读这一行（O(1)），不再全表求和
+- rebuild_roi_aggregates() 用全量重算结果覆盖，check_roi_aggregates() 对比两者
+
+累计时间序列（compute_roi_timeseries）：
+- 一条 UNION ALL + GROUP BY date 的有序查询，Python 单次扫描累加分桶
+"""
+
+from datetime import timedelta
+from models import db, Expense, Activity, Setting, WeeklyCharge, RoiAggregate
+
+# 市场参考价默认值（数据库里没有设置时使用）
+DEFAULT_MARKET_REFERENCE_PRICE = 50.0
+
+
+def _paid_expense_filter():
+    """
+    已付支出的过滤条件：全额支出 + 已付的分期子支出
+    """
+    # 已付的分期子支出：存在一条 status='paid' 的扣费记录指向它
+    paid_charge_exists = db.exists().where(
+        WeeklyCharge.expense_id == Expense.id,
+        WeeklyCharge.status == 'paid'
+    )
+
+    return db.or_(
+        db.and_(Expense.is_installment == False, Expense.parent_expense_id == None),  # 全额支出
+        db.and_(Expense.parent_expense_id != None, paid_charge_exists)  # 已付的分期子支出
+    )
+
+
+def _roi_totals_statement():
+    """
+    构造一条 SELECT，同时返回市场参考价和四个合计值
+
+    每个值都是一个标量子查询，整条语句只需一次数据库往返。
+    """
+    paid_total = db.select(db.func.coalesce(db.func.sum(Expense.amount), 0.0)).where(
+        _paid_expense_filter()
+    ).scalar_subquery()
+
+    planned_total = db.select(db.func.coalesce(db.func.sum(Expense.amount), 0.0)).where(
+        Expense.parent_expense_id == None  # 全额支出 + 分期合同父支出
+    ).scalar_subquery()
+
+    weighted_total = db.select(
+        db.func.coalesce(db.func.sum(Activity.calculated_weight), 0.0)
+    ).scalar_subquery()
+
+    total_activities = db.select(db.func.count(Activity.id)).scalar_subquery()
+
+    market_price = db.select(Setting.value).where(
+        Setting.key == 'market_reference_price'
+    ).scalar_subquery()
+
+    return db.select(
+        market_price.label('market_reference_price'),
+        paid_total.label('paid_total'),
+        planned_total.label('planned_total'),
+        weighted_total.label('weighted_total'),
+        total_activities.label('total_activities')
+    )
+
+
+def compute_market_reference_price():
+    """
+    读取市场参考价（未设置时返回默认值）
+    """
+    value = db.session.execute(
+        db.select(Setting.value).where(Setting.key == 'market_reference_price')
+    ).scalar()
+    return float(value) if value is not None else DEFAULT_MARKET_REFERENCE_PRICE
+
+
+def compute_roi_totals():
+    """
+    一次查询得到 ROI 所需的全部原始合计值
+
+    返回:
+        dict: {
+          "market_reference_price": 50.0,
+          "paid_total": 204.0,
+          "planned_total": 916.0,
+          "weighted_total": 5.66,
+          "total_activities": 4
+        }
+    """
+    row = db.session.execute(_roi_totals_statement()).one()
+
+    return {
+        'market_reference_price': (
+            float(row.market_reference_price)
+            if row.market_reference_price is not None
+            else DEFAULT_MARKET_REFERENCE_PRICE
+        ),
+        'paid_total': float(row.paid_total),
+        'planned_total': float(row.planned_total),
+        'weighted_total': float(row.weighted_total),
+        'total_activities': int(row.total_activities)
+    }
+
+
+def _roi_block(total_expense, weighted_total, market_reference_price):
+    """
+    根据某一口径的总支出计算 ROI 指标（已付 / 计划 共用）
+
+    - average_cost: total_expense ÷ weighted_total
+    - money_saved: (market_price - average_cost) × weighted_total
+    - roi_percentage: (money_saved / total_expense) × 100
+    """
+    if weighted_total > 0:
+        average_cost = total_expense / weighted_total
+        money_saved = (market_reference_price - average_cost) * weighted_total
+    else:
+        average_cost = 0.0
+        money_saved = 0.0
+
+    if total_expense > 0:
+        roi_percentage = (money_saved / total_expense) * 100
+    else:
+        roi_percentage = 0.0
+
+    return {
+        'total_expense': round(total_expense, 2),
+        'average_cost': round(average_cost, 2),
+        'money_saved': round(money_saved, 2),
+        'roi_percentage': round(roi_percentage, 2)
+    }
+
+
+def build_roi_summary(totals):
+    """
+    把原始合计值组装成 API 返回的 ROI 摘要格式（已付 vs 计划）
+    """
+    weighted_total = totals['weighted_total']
+    market_reference_price = totals['market_reference_price']
+
+    return {
+        'total_activities': totals['total_activities'],
+        'weighted_total': round(weighted_total, 2),
+        'market_reference_price': market_reference_price,
+        'paid': _roi_block(totals['paid_total'], weighted_total, market_reference_price),
+        'planned': _roi_block(totals['planned_total'], weighted_total, market_reference_price)
+    }
+
+
+def get_roi_summary_data():
+    """
+    获取完整的 ROI 摘要（供路由和导出直接使用）
+
+    优先读取物化合计表（一行数据 + 市场参考价）；
+    如果合计表还没初始化，退回到全量聚合查询。
+    """
+    totals = read_roi_aggregates()
+    if totals is None:
+        totals = compute_roi_totals()
+    return build_roi_summary(totals)
+
+
+# ========================================
+# 物化合计表（roi_aggregates）维护
+# ========================================
+
+# 合计表只有一行，固定 id
+ROI_AGGREGATE_ID = 1
+
+# 一致性检查的允许误差（浮点累加会有微小偏差）
+ROI_AGGREGATE_TOLERANCE = 0.01
+
+
+def read_roi_aggregates():
+    """
+    读取物化合计表（一次查询，同时带出市场参考价）
+
+    返回:
+        dict: 与 compute_roi_totals() 相同的格式
+        None: 合计表还没有初始化
+    """
+    market_price = db.select(Setting.value).where(
+        Setting.key == 'market_reference_price'
+    ).scalar_subquery()
+
+    row = db.session.execute(
+        db.select(RoiAggregate, market_price.label('market_reference_price'))
+        .where(RoiAggregate.id == ROI_AGGREGATE_ID)
+    ).first()
+
+    if row is None:
+        return None
+
+    aggregate = row.RoiAggregate
+    return {
+        'market_reference_price': (
+            float(row.market_reference_price)
+            if row.market_reference_price is not None
+            else DEFAULT_MARKET_REFERENCE_PRICE
+        ),
+        'paid_total': aggregate.paid_total,
+        'planned_total': aggregate.planned_total,
+        'weighted_total': aggregate.weighted_total,
+        'total_activities': aggregate.total_activities
+    }
+
+
+def expense_roi_contribution(expense, charge_paid=False):
+    """
+    计算一条支出对 (paid_total, planned_total) 的贡献
+
+    参数:
+        expense (Expense): 支出记录
+        charge_paid (bool): 分期子支出对应的扣费是否已付
+
+    返回:
+        tuple: (paid, planned)
+
+    规则（与 compute_roi_totals 一致）：
+    - 全额支出：计入已付和计划
+    - 分期合同父支出：只计入计划
+    - 分期子支出：已付时计入已付
+    """
+    amount = expense.amount or 0.0
+
+    if expense.parent_expense_id is None:
+        if expense.is_installment:
+            return 0.0, amount
+        return amount, amount
+
+    return (amount if charge_paid else 0.0), 0.0
+
+
+def apply_roi_delta(weighted=0.0, activities=0, paid=0.0, planned=0.0):
+    """
+    按差值更新物化合计表（不提交，由调用方在同一事务里 commit）
+
+    参数:
+        weighted (float): 加权次数变化量
+        activities (int): 活动数变化量
+        paid (float): 已付总额变化量
+        planned (float): 计划总额变化量
+
+    使用 UPDATE ... SET x = x + delta，避免读-改-写的并发问题。
+    合计表不存在时不做任何事（读取时会退回全量计算）。
+    """
+    if not (weighted or activities or paid or planned):
+        return
+
+    db.session.execute(
+        db.update(RoiAggregate)
+        .where(RoiAggregate.id == ROI_AGGREGATE_ID)
+        .values(
+            weighted_total=RoiAggregate.weighted_total + weighted,
+            total_activities=RoiAggregate.total_activities + activities,
+            paid_total=RoiAggregate.paid_total + paid,
+            planned_total=RoiAggregate.planned_total + planned
+        )
+    )
+
+
+def rebuild_roi_aggregates():
+    """
+    用全量重算的结果覆盖物化合计表（不存在则创建）
+
+    不提交事务，由调用方 commit。
+
+    返回:
+        RoiAggregate: 重建后的合计记录
+    """
+    totals = compute_roi_totals()
+
+    aggregate = db.session.get(RoiAggregate, ROI_AGGREGATE_ID)
+    if aggregate is None:
+        aggregate = RoiAggregate(id=ROI_AGGREGATE_ID)
+        db.session.add(aggregate)
+
+    aggregate.weighted_total = totals['weighted_total']
+    aggregate.total_activities = totals['total_activities']
+    aggregate.paid_total = totals['paid_total']
+    aggregate.planned_total = totals['planned_total']
+
+    return aggregate
+
+
+def check_roi_aggregates(tolerance=ROI_AGGREGATE_TOLERANCE):
+    """
+    一致性检查：对比物化合计表与全量重算结果
+
+    返回:
+    {
+      "consistent": true,
+      "stored": {...},       // 合计表中的值（未初始化时为 null）
+      "recomputed": {...},   // 全量重算的值
+      "differences": {...}   // 超出误差的字段：stored - recomputed
+    }
+    """
+    stored = read_roi_aggregates()
+    recomputed = compute_roi_totals()
+
+    fields = ['weighted_total', 'total_activities', 'paid_total', 'planned_total']
+    differences = {}
+
+    if stored is not None:
+        for field in fields:
+            diff = stored[field] - recomputed[field]
+            if abs(diff) > tolerance:
+                differences[field] = round(diff, 4)
+
+    return {
+        'consistent': stored is not None and not differences,
+        'stored': {field: stored[field] for field in fields} if stored else None,
+        'recomputed': {field: recomputed[field] for field in fields},
+        'differences': differences
+    }
+
+
+# ========================================
+# 累计 ROI 时间序列
+# ========================================
+
+# 支持的分桶粒度
+TIMESERIES_GRANULARITIES = ('day', 'week', 'month')
+
+
+def _bucket_start(day, granularity):
+    """
+    计算日期所在分桶的起始日
+
+    - day:   当天
+    - week:  当周周一
+    - month: 当月 1 号
+    """
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _daily_events_statement():
+    """
+    构造按日期汇总的事件流（UNION ALL 后 GROUP BY date，按日期升序）
+
+    每行：date, weighted, activities, paid, planned
+    """
+    zero = db.literal(0.0)
+
+    activity_events = db.select(
+        Activity.date.label('date'),
+        db.func.coalesce(Activity.calculated_weight, 0.0).label('weighted'),
+        db.literal(1).label('activities'),
+        zero.label('paid'),
+        zero.label('planned')
+    )
+
+    paid_events = db.select(
+        Expense.date.label('date'),
+        zero.label('weighted'),
+        db.literal(0).label('activities'),
+        Expense.amount.label('paid'),
+        zero.label('planned')
+    ).where(_paid_expense_filter())
+
+    planned_events = db.select(
+        Expense.date.label('date'),
+        zero.label('weighted'),
+        db.literal(0).label('activities'),
+        zero.label('paid'),
+        Expense.amount.label('planned')
+    ).where(Expense.parent_expense_id == None)
+
+    events = db.union_all(activity_events, paid_events, planned_events).subquery()
+
+    return db.select(
+        events.c.date,
+        db.func.sum(events.c.weighted).label('weighted'),
+        db.func.sum(events.c.activities).label('activities'),
+        db.func.sum(events.c.paid).label('paid'),
+        db.func.sum(events.c.planned).label('planned')
+    ).group_by(events.c.date).order_by(events.c.date)
+
+
+def compute_roi_timeseries(granularity='month'):
+    """
+    计算累计 ROI 时间序列和回本日期
+
+    参数:
+        granularity (str): 分桶粒度（day / week / month）
+
+    返回:
+    {
+      "granularity": "month",
+      "market_reference_price": 50.0,
+      "points": [
+        {
+          "period_start": "2025-01-01",
+          "total_activities": 4,       // 截至该桶末的累计值
+          "weighted_total": 5.66,
+          "paid": {...},               // 与 ROI 摘要相同的结构
+          "planned": {...}
+        },
+        ...
+      ],
+      "break_even_date": "2025-06-12"  // 已付 ROI 第一次转正的日期（未回本为 null）
+    }
+
+    实现：一次有序扫描按日汇总的事件流，逐日累加，
+    同一分桶内后面的日期覆盖前面的结果，所以每个点就是该桶末的累计值。
+    """
+    if granularity not in TIMESERIES_GRANULARITIES:
+        raise ValueError(f"不支持的粒度：{granularity}")
+
+    market_reference_price = compute_market_reference_price()
+
+    weighted_total = 0.0
+    total_activities = 0
+    paid_total = 0.0
+    planned_total = 0.0
+    break_even_date = None
+
+    points = []
+    current_bucket = None
+
+    for row in db.session.execute(_daily_events_statement()):
+        weighted_total += float(row.weighted or 0.0)
+        total_activities += int(row.activities or 0)
+        paid_total += float(row.paid or 0.0)
+        planned_total += float(row.planned or 0.0)
+
+        # 已付 ROI 转正：节省金额 = 市场价 × 加权次数 - 已付总额 > 0
+        if (break_even_date is None and paid_total > 0
+                and market_reference_price * weighted_total > paid_total):
+            break_even_date = row.date
+
+        point = {
+            'period_start': _bucket_start(row.date, granularity).isoformat(),
+            'total_activities': total_activities,
+            'weighted_total': round(weighted_total, 2),
+            'paid': _roi_block(paid_total, weighted_total, market_reference_price),
+            'planned': _roi_block(planned_total, weighted_total, market_reference_price)
+        }
+
+        bucket = point['period_start']
+        if bucket == current_bucket:
+            points[-1] = point
+        else:
+            points.append(point)
+            current_bucket = bucket
+
+    return {
+        'granularity': granularity,
+        'market_reference_price': market_reference_price,
+        'points': points,
+        'break_even_date': break_even_date.isoformat() if break_even_date else None
+    }
@@ -0,0 +1,160 @@
+"""
+ROI 假设模拟（What-if）
+
+问题：如果市场参考价、基准距离、标准差换一组值，ROI 会变成多少？
+
+做法（NumPy 广播）：
+1. 一次查询取出所有活动距离，按距离去重计数（游泳距离大多是 25/50m 的倍数，去重后很少）
+2. 对 baseline × sigma × 距离 三个维度一次性计算权重矩阵
+3. 权重矩阵 @ 计数 → 每组 (baseline, sigma) 的加权总次数
+4. 再与市场参考价网格广播，得到已付 / 计划 ROI 矩阵
+
+结果矩阵形状：(市场价个数, baseline 个数, sigma 个数)
+"""
+
+import time
+
+import numpy as np
+
+from models import db, Activity
+from utils.gaussian import calculate_swimming_weights
+from utils.roi import compute_roi_totals
+
+# 每个参数网格最多允许的取值个数（防止请求过大）
+MAX_GRID_SIZE = 200
+
+
+def load_distance_histogram():
+    """
+    读取活动距离的直方图（一次 GROUP BY 查询）
+
+    返回:
+        tuple: (distances, counts) 两个一维 NumPy 数组
+    """
+    rows = db.session.execute(
+        db.select(
+            db.func.coalesce(Activity.distance, 0),
+            db.func.count(Activity.id)
+        ).group_by(db.func.coalesce(Activity.distance, 0))
+    ).all()
+
+    distances = np.array([row[0] for row in rows], dtype=np.float64)
+    counts = np.array([row[1] for row in rows], dtype=np.float64)
+    return distances, counts
+
+
+def _swimming_weight_grid(distances, baselines, sigmas):
+    """
+    对 baseline × sigma × 距离 一次性计算权重（广播调用 calculate_swimming_weights）
+
+    参数:
+        distances: 形状 (U,)
+        baselines: 形状 (B,)
+        sigmas:    形状 (S,)
+
+    返回:
+        形状 (B, S, U) 的权重数组（保留2位小数，与入库的 calculated_weight 一致）
+    """
+    return calculate_swimming_weights(
+        distances[np.newaxis, np.newaxis, :],
+        baselines[:, np.newaxis, np.newaxis],
+        sigmas[np.newaxis, :, np.newaxis]
+    )
+
+
+def _roi_percentage(money_saved, total_expense):
+    """
+    ROI 百分比（总支出为 0 时为 0，与 utils/roi.py 一致）
+    """
+    if total_expense > 0:
+        return money_saved / total_expense * 100
+    return np.zeros_like(money_saved)
+
+
+def _parse_grid(data, key):
+    """
+    解析并校验参数网格（有限正数列表）
+    """
+    values = data.get(key)
+    if values is None:
+        raise ValueError(f"缺少必填字段：{key}")
+    if not isinstance(values, list):
+        values = [values]
+    if not values:
+        raise ValueError(f"{key} 不能为空")
+    if len(values) > MAX_GRID_SIZE:
+        raise ValueError(f"{key} 最多 {MAX_GRID_SIZE} 个取值")
+
+    grid = np.array([float(v) for v in values], dtype=np.float64)
+    # NaN / inf 会让结果里出现 NaN / Infinity（不是合法的 JSON）
+    if not np.all(np.isfinite(grid)) or np.any(grid <= 0):
+        raise ValueError(f"{key} 的取值必须是大于 0 的有限数")
+    return grid
+
+
+def simulate_roi(data):
+    """
+    根据参数网格模拟 ROI 矩阵
+
+    参数:
+        data (dict): {
+          "market_reference_price": [40, 50, 60],
+          "baseline": [800, 1000, 1200],
+          "sigma": [400, 550]
+        }
+
+    返回:
+    {
+      "market_reference_price": [...],
+      "baseline": [...],
+      "sigma": [...],
+      "total_activities": 120,
+      "paid_total": 204.0,
+      "planned_total": 916.0,
+      "weighted_total": [[...]],       // 形状 (baseline, sigma)
+      "paid_roi": [[[...]]],           // 形状 (market_reference_price, baseline, sigma)
+      "planned_roi": [[[...]]],
+      "elapsed_ms": 12.3
+    }
+
+    异常:
+        ValueError: 参数缺失或不合法
+    """
+    started = time.perf_counter()
+
+    prices = _parse_grid(data, 'market_reference_price')
+    baselines = _parse_grid(data, 'baseline')
+    sigmas = _parse_grid(data, 'sigma')
+
+    totals = compute_roi_totals()
+    paid_total = totals['paid_total']
+    planned_total = totals['planned_total']
+
+    distances, counts = load_distance_histogram()
+
+    # (B, S, U) @ (U,) → (B, S)
+    if distances.size:
+        weighted = _swimming_weight_grid(distances, baselines, sigmas) @ counts
+    else:
+        weighted = np.zeros((baselines.size, sigmas.size))
+
+    # money_saved = (price - total / weighted) × weighted = price × weighted - total
+    # 加权次数为 0 时节省金额记为 0（与 utils/roi.py 一致）
+    price_grid = prices[:, np.newaxis, np.newaxis]
+    has_weight = weighted[np.newaxis, :, :] > 0
+
+    paid_saved = np.where(has_weight, price_grid * weighted - paid_total, 0.0)
+    planned_saved = np.where(has_weight, price_grid * weighted - planned_total, 0.0)
+
+    return {
+        'market_reference_price': prices.tolist(),
+        'baseline': baselines.tolist(),
+        'sigma': sigmas.tolist(),
+        'total_activities': totals['total_activities'],
+        'paid_total': round(paid_total, 2),
+        'planned_total': round(planned_total, 2),
+        'weighted_total': np.round(weighted, 2).tolist(),
+        'paid_roi': np.round(_roi_percentage(paid_saved, paid_total), 2).tolist(),
+        'planned_roi': np.round(_roi_percentage(planned_saved, planned_total), 2).tolist(),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
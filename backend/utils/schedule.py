@@ -0,0 +1,610 @@
+"""
+分期合同扣费计划（Schedule）
+
+扣费日期完全由合同规则决定：start_date、end_date、period_type、day_of_week / day_of_month。
+
+两种存储模式（MembershipContract.schedule_mode）：
+- materialized（默认）：每一期都写一条 weekly_charges 记录
+- virtual：只存规则 + 稀疏的覆盖记录
+    - 已付的期数（有子支出，必须落库）
+    - 改过金额或状态的待付期数
+  其余待付期数在读取时按规则临时生成（id 为 null，virtual 为 true）
+
+本模块负责：
+- 生成扣费日期（闭式计算：周用 NumPy datetime64 等差序列，月用月份算术）
+- O(1) 计算总期数（count_periods），不需要生成日期列表
+- 预览：按规范化后的规则缓存扣费日期（preview_charge_dates）
+- 合并「存储的记录」和「按规则生成的虚拟记录」
+- 合同列表的进度统计（一条 GROUP BY 查询，load_contract_progress）
+- 按两种模式统一计算期数
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+from dateutil import tz
+from dateutil.relativedelta import relativedelta, MO, TU, WE, TH, FR, SA, SU
+
+from models import db, WeeklyCharge
+
+# 存储模式
+SCHEDULE_MATERIALIZED = 'materialized'
+SCHEDULE_VIRTUAL = 'virtual'
+SCHEDULE_MODES = (SCHEDULE_MATERIALIZED, SCHEDULE_VIRTUAL)
+
+# 预览接口缓存的规则个数（表单每次输入都会请求预览）
+PREVIEW_CACHE_SIZE = 256
+
+# 周几映射
+WEEKDAY_MAP = {
+    0: MO,  # 周一
+    1: TU,  # 周二
+    2: WE,  # 周三
+    3: TH,  # 周四
+    4: FR,  # 周五
+    5: SA,  # 周六
+    6: SU   # 周日
+}
+
+
+def local_today():
+    """
+    今天的日期（按环境变量 TIMEZONE 指定的时区，如 Pacific/Auckland；未设置则用系统时区）
+
+    判断某期扣费是否到期（已付）都以它为准。
+
+    异常:
+        ValueError: 时区名称无效
+    """
+    tz_name = os.getenv('TIMEZONE')
+    if not tz_name:
+        return datetime.now().date()
+
+    zone = tz.gettz(tz_name)
+    if zone is None:
+        raise ValueError(f'无效的时区：{tz_name}')
+    return datetime.now(zone).date()
+
+
+def _first_weekly_charge_date(start_date, day_of_week):
+    """
+    第一个扣费日：start_date 当天或之后的第一个 day_of_week
+    """
+    if day_of_week not in WEEKDAY_MAP:
+        raise ValueError(f'day_of_week 必须是 0-6：{day_of_week}')
+    return start_date + timedelta(days=(day_of_week - start_date.weekday()) % 7)
+
+
+def _first_monthly_charge_month(start_date, day_of_month):
+    """
+    第一个扣费日所在的月份（NumPy datetime64[M]）
+
+    开始日期的日期数 <= 扣费日，用当月的扣费日；否则用下个月的扣费日。
+    """
+    if not 1 <= day_of_month <= 31:
+        raise ValueError(f'day_of_month 必须是 1-31：{day_of_month}')
+    month = np.datetime64(start_date, 'M')
+    if start_date.day > day_of_month:
+        month += np.timedelta64(1, 'M')
+    return month
+
+
+def generate_weekly_charge_dates(start_date, end_date, day_of_week):
+    """
+    生成所有周扣费日期列表（闭式计算，不逐周循环）
+
+    参数:
+    - start_date: 开始日期（Date 对象）
+    - end_date: 结束日期（Date 对象）
+    - day_of_week: 扣费日（0-6，0=周一）
+
+    返回:
+    - 日期列表 [date1, date2, ...]（不包含 end_date 本身，end_date 是最后一天的上限）
+    """
+    first_charge_date = _first_weekly_charge_date(start_date, day_of_week)
+    if first_charge_date >= end_date:
+        return []
+
+    # 一次生成 [第一个扣费日, end_date) 之间步长 7 天的所有日期
+    return np.arange(
+        np.datetime64(first_charge_date, 'D'),
+        np.datetime64(end_date, 'D'),
+        np.timedelta64(7, 'D')
+    ).tolist()
+
+
+def _month_lengths(months):
+    """
+    每个月的天数（months 为 NumPy datetime64[M] 数组）
+    """
+    return ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(int)
+
+
+# 任意连续 25 个月至少包含两个 2 月（其中至少一个是平年，28 天）
+_MONTHS_TO_SHORTEST = 25
+
+
+def _check_first_monthly_charge_day(first_month, day_of_month):
+    """
+    第一个扣费月必须有这一天（与逐月循环的原始实现一致，如 2 月 30 号抛出 ValueError）
+    """
+    first_month.astype('datetime64[D]').item().replace(day=day_of_month)
+
+
+def generate_monthly_charge_dates(start_date, end_date, day_of_month):
+    """
+    生成所有月扣费日期列表（按月份算术闭式计算，不逐月循环）
+
+    参数:
+    - start_date: 开始日期（Date 对象）
+    - end_date: 结束日期（Date 对象）
+    - day_of_month: 每月扣费日（1-31）
+
+    返回:
+    - 日期列表 [date1, date2, ...]（不包含 end_date 本身，end_date 是最后一天的上限）
+
+    29-31 号与原来的逐月推算（每次 relativedelta(months=1)）一致：
+    遇到较短的月份被压到月底后，之后各期都沿用压缩后的日期，
+    即第 k 期的日期 = min(扣费日, 前 k 个月里最短的月份天数)，用累计最小值一次算出。
+    """
+    count = count_periods(start_date, end_date, 'monthly', day_of_month=day_of_month)
+    if count == 0:
+        return []
+
+    # 第 k 期 = 第一个月份 + k 个月，再加上 (扣费日 - 1) 天
+    months = _first_monthly_charge_month(start_date, day_of_month) + np.arange(count)
+    days = np.full(count, day_of_month)
+    if day_of_month > 28:
+        days = np.minimum.accumulate(np.minimum(_month_lengths(months), day_of_month))
+    return (months.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')).tolist()
+
+
+def count_periods(start_date, end_date, period_type, day_of_week=None, day_of_month=None):
+    """
+    计算总期数（O(1)，不生成日期列表）
+
+    与 len(generate_*_charge_dates(...)) 结果相同。
+
+    参数:
+    - start_date / end_date: 开始 / 结束日期（Date 对象）
+    - period_type: 'weekly' 或 'monthly'
+    - day_of_week: 周扣费日（weekly 模式）
+    - day_of_month: 月扣费日（monthly 模式）
+
+    异常:
+        ValueError: 分期类型不支持，或缺少对应的扣费日
+    """
+    if period_type == 'weekly':
+        if day_of_week is None:
+            raise ValueError('周扣费模式需要提供 day_of_week')
+        first_charge_date = _first_weekly_charge_date(start_date, day_of_week)
+        if first_charge_date >= end_date:
+            return 0
+        # 向上取整：[first, end) 区间内步长 7 天的日期个数
+        return ((end_date - first_charge_date).days + 6) // 7
+
+    if period_type == 'monthly':
+        if day_of_month is None:
+            raise ValueError('月扣费模式需要提供 day_of_month')
+        first_month = _first_monthly_charge_month(start_date, day_of_month)
+        if day_of_month > 28:
+            _check_first_monthly_charge_day(first_month, day_of_month)
+        months = int(np.datetime64(end_date, 'M') - first_month)
+        if months < 0:
+            return 0
+
+        # 结束月当月的扣费日（29-31 号：被之前最短的月份压缩过，最多看 25 个月）
+        charge_day = day_of_month
+        if day_of_month > 28:
+            span = first_month + np.arange(min(months + 1, _MONTHS_TO_SHORTEST))
+            charge_day = min(day_of_month, int(_month_lengths(span).min()))
+
+        # 第一个扣费月到结束月之间的月数；结束月当月的扣费日早于 end_date 时再算一期
+        return months + (1 if charge_day < end_date.day else 0)
+
+    raise ValueError(f'不支持的分期类型：{period_type}')
+
+
+def _generate_weekly_charge_dates_loop(start_date, end_date, day_of_week):
+    """
+    逐周循环的原始实现（参照实现，用于校验闭式版本）
+    """
+    dates = []
+    current = start_date
+
+    # 找到第一个扣费日
+    # 使用 relativedelta 调整到指定的周几
+    weekday = WEEKDAY_MAP[day_of_week]
+    first_charge_date = current + relativedelta(weekday=weekday)
+
+    # 如果第一个扣费日在开始日期之前，跳到下一周
+    if first_charge_date < current:
+        first_charge_date += timedelta(weeks=1)
+
+    current = first_charge_date
+
+    # 生成所有扣费日期（不包含 end_date 本身，end_date 是最后一天的上限）
+    while current < end_date:
+        dates.append(current)
+        current += timedelta(weeks=1)
+
+    return dates
+
+
+def _generate_monthly_charge_dates_loop(start_date, end_date, day_of_month):
+    """
+    逐月循环的原始实现（参照实现，用于校验闭式版本）
+    """
+    dates = []
+    current = start_date
+
+    # 找到第一个扣费日期
+    # 如果开始日期的日期数 <= 扣费日，使用当月的扣费日
+    # 否则使用下个月的扣费日
+    if current.day <= day_of_month:
+        first_charge_date = current.replace(day=day_of_month)
+    else:
+        # 下个月
+        next_month = current + relativedelta(months=1)
+        first_charge_date = next_month.replace(day=day_of_month)
+
+    current = first_charge_date
+
+    # 生成所有扣费日期（不包含 end_date 本身，end_date 是最后一天的上限）
+    while current < end_date:
+        dates.append(current)
+        # 每次加一个月
+        current = current + relativedelta(months=1)
+
+    return dates
+
+
+def contract_charge_dates(contract, until=None):
+    """
+    按合同当前的规则生成扣费日期
+
+    参数:
+        until (date): 只生成早于该日期的扣费日（不传则到合同结束日期）
+
+    异常:
+        ValueError: 分期类型不支持，或缺少对应的扣费日
+    """
+    end_date = contract.end_date if until is None else min(contract.end_date, until)
+
+    if contract.period_type == 'weekly':
+        if contract.day_of_week is None:
+            raise ValueError('周扣费模式需要提供 day_of_week')
+        return generate_weekly_charge_dates(contract.start_date, end_date, contract.day_of_week)
+
+    if contract.period_type == 'monthly':
+        if contract.day_of_month is None:
+            raise ValueError('月扣费模式需要提供 day_of_month')
+        return generate_monthly_charge_dates(contract.start_date, end_date, contract.day_of_month)
+
+    raise ValueError(f'不支持的分期类型：{contract.period_type}')
+
+
+def normalize_rule(period_type, day_of_week, day_of_month, start_date, end_date):
+    """
+    把扣费规则规范化为可哈希的元组（作为预览缓存的键）
+
+    只保留与分期类型相关的扣费日，例如周扣费忽略 day_of_month，
+    这样表单里无关字段的变化不会让缓存失效。
+
+    返回:
+        tuple: (period_type, day, start_date, end_date)
+
+    异常:
+        ValueError: 分期类型不支持，或缺少对应的扣费日
+    """
+    if period_type == 'weekly':
+        if day_of_week is None:
+            raise ValueError('周扣费模式需要提供 day_of_week')
+        return ('weekly', int(day_of_week), start_date, end_date)
+
+    if period_type == 'monthly':
+        if day_of_month is None:
+            raise ValueError('月扣费模式需要提供 day_of_month')
+        return ('monthly', int(day_of_month), start_date, end_date)
+
+    raise ValueError(f'不支持的分期类型：{period_type}')
+
+
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def preview_charge_dates(rule):
+    """
+    按规范化后的规则生成扣费日期（带 LRU 缓存，供预览接口使用）
+
+    参数:
+        rule (tuple): normalize_rule() 的返回值
+
+    返回:
+        tuple: 扣费日期（不可变，缓存结果不会被调用方修改）
+    """
+    period_type, day, start_date, end_date = rule
+    if period_type == 'weekly':
+        return tuple(generate_weekly_charge_dates(start_date, end_date, day))
+    return tuple(generate_monthly_charge_dates(start_date, end_date, day))
+
+
+def preview_cache_info():
+    """
+    预览缓存的命中情况
+
+    返回:
+    {
+      "hits": 120,
+      "misses": 8,
+      "size": 8,
+      "maxsize": 256
+    }
+    """
+    info = preview_charge_dates.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize
+    }
+
+
+def is_virtual(contract):
+    """
+    合同是否使用虚拟扣费计划（旧数据 schedule_mode 为空，按 materialized 处理）
+    """
+    return contract.schedule_mode == SCHEDULE_VIRTUAL
+
+
+def count_contract_periods(contract, stored_count=0):
+    """
+    合同的总期数
+
+    参数:
+        stored_count (int): 已存储的扣费记录数（materialized 模式下就是总期数）
+    """
+    if is_virtual(contract):
+        return count_periods(
+            contract.start_date, contract.end_date, contract.period_type,
+            day_of_week=contract.day_of_week, day_of_month=contract.day_of_month
+        )
+    return stored_count
+
+
+def virtual_charge_dict(contract, charge_date):
+    """
+    按规则生成的一条虚拟扣费记录（格式与 WeeklyCharge.to_dict 相同）
+    """
+    return {
+        'id': None,
+        'contract_id': contract.id,
+        'expense_id': None,
+        'charge_date': charge_date.isoformat(),
+        'amount': contract.period_amount,
+        'status': 'pending',
+        'created_at': None,
+        'virtual': True
+    }
+
+
+def list_contract_charges(contract, status=None, date_from=None, date_to=None, after=None, limit=None):
+    """
+    获取合同的扣费记录（按日期升序）
+
+    - materialized：直接返回存储的记录
+    - virtual：存储的记录 + 按规则补齐的虚拟待付记录
+
+    参数:
+        status (str): 只返回该状态（paid / pending），默认全部
+        date_from / date_to (date): 扣费日期范围（闭区间）
+        after (date): 只返回该日期之后的记录（游标分页）
+        limit (int): 最多返回条数，默认不限
+
+    同一合同内扣费日期互不相同，所以只按日期排序就是稳定的顺序；
+    过滤条件和 LIMIT 都在 SQL 里完成，走 (contract_id, status, charge_date) 索引。
+    """
+    query = WeeklyCharge.query.filter(WeeklyCharge.contract_id == contract.id)
+    if status:
+        query = query.filter(WeeklyCharge.status == status)
+    if date_from:
+        query = query.filter(WeeklyCharge.charge_date >= date_from)
+    if date_to:
+        query = query.filter(WeeklyCharge.charge_date <= date_to)
+    if after:
+        query = query.filter(WeeklyCharge.charge_date > after)
+
+    query = query.order_by(WeeklyCharge.charge_date)
+    if limit is not None:
+        query = query.limit(limit)
+
+    charges = [dict(charge.to_dict(), virtual=False) for charge in query.all()]
+
+    # 虚拟扣费一定是待付
+    if is_virtual(contract) and status in (None, 'pending'):
+        lower = date_from
+        if after and (lower is None or after >= lower):
+            lower = after + timedelta(days=1)
+        until = date_to + timedelta(days=1) if date_to else None
+
+        # 窗口内已存储的日期（不分状态，被覆盖的期数不再生成虚拟记录）
+        stored_query = db.select(WeeklyCharge.charge_date).where(WeeklyCharge.contract_id == contract.id)
+        if lower:
+            stored_query = stored_query.where(WeeklyCharge.charge_date >= lower)
+        if until:
+            stored_query = stored_query.where(WeeklyCharge.charge_date < until)
+        stored_dates = set(db.session.execute(stored_query).scalars())
+
+        virtual = []
+        for charge_date in contract_charge_dates(contract, until=until):
+            if lower and charge_date < lower:
+                continue
+            if charge_date in stored_dates:
+                continue
+            virtual.append(virtual_charge_dict(contract, charge_date))
+            if limit is not None and len(virtual) >= limit:
+                break
+
+        charges += virtual
+        charges.sort(key=lambda charge: charge['charge_date'])
+        if limit is not None:
+            charges = charges[:limit]
+
+    return charges
+
+
+def load_contract_progress(contracts):
+    """
+    批量统计合同的扣费进度（一条 GROUP BY contract_id 查询，走 (contract_id, status, charge_date) 索引）
+
+    虚拟扣费计划中未存储的期数按待付、每期金额计入；
+    有虚拟合同时再加一条查询取它们已存储的日期，用来找下一个扣费日。
+
+    参数:
+        contracts (list): MembershipContract 列表
+
+    返回:
+    {
+      合同 id: {
+        "paid_count": 41,
+        "pending_count": 63,
+        "paid_amount": 410.0,
+        "remaining_amount": 630.0,         // 待付金额之和
+        "next_charge_date": "2026-10-19"   // 最早的待付扣费日（没有则为 null）
+      }
+    }
+    """
+    if not contracts:
+        return {}
+
+    is_paid = WeeklyCharge.status == 'paid'
+    is_pending = WeeklyCharge.status == 'pending'
+
+    rows = db.session.execute(
+        db.select(
+            WeeklyCharge.contract_id,
+            db.func.count(WeeklyCharge.id).label('stored_count'),
+            db.func.sum(db.case((is_paid, 1), else_=0)).label('paid_count'),
+            db.func.sum(db.case((is_pending, 1), else_=0)).label('pending_count'),
+            db.func.sum(db.case((is_paid, WeeklyCharge.amount), else_=0.0)).label('paid_amount'),
+            db.func.sum(db.case((is_pending, WeeklyCharge.amount), else_=0.0)).label('pending_amount'),
+            db.func.min(db.case((is_pending, WeeklyCharge.charge_date))).label('next_charge_date')
+        )
+        .where(WeeklyCharge.contract_id.in_([contract.id for contract in contracts]))
+        .group_by(WeeklyCharge.contract_id)
+    ).all()
+    stats = {row.contract_id: row for row in rows}
+
+    # 虚拟合同已存储的日期（找第一个没有存储的扣费日）
+    virtual_ids = [contract.id for contract in contracts if is_virtual(contract)]
+    stored_dates = {}
+    if virtual_ids:
+        for contract_id, charge_date in db.session.execute(
+            db.select(WeeklyCharge.contract_id, WeeklyCharge.charge_date)
+            .where(WeeklyCharge.contract_id.in_(virtual_ids))
+        ):
+            stored_dates.setdefault(contract_id, set()).add(charge_date)
+
+    progress = {}
+    for contract in contracts:
+        row = stats.get(contract.id)
+        stored_count = row.stored_count if row else 0
+        paid_count = int(row.paid_count or 0) if row else 0
+        pending_count = int(row.pending_count or 0) if row else 0
+        paid_amount = float(row.paid_amount or 0.0) if row else 0.0
+        remaining_amount = float(row.pending_amount or 0.0) if row else 0.0
+        next_charge_date = _as_date(row.next_charge_date) if row else None
+
+        if is_virtual(contract):
+            virtual_count = count_contract_periods(contract) - stored_count
+            pending_count += virtual_count
+            remaining_amount += virtual_count * contract.period_amount
+
+            existing = stored_dates.get(contract.id, set())
+            first_virtual = next(
+                (d for d in contract_charge_dates(contract) if d not in existing), None
+            )
+            if first_virtual and (next_charge_date is None or first_virtual < next_charge_date):
+                next_charge_date = first_virtual
+
+        progress[contract.id] = {
+            'paid_count': paid_count,
+            'pending_count': pending_count,
+            'paid_amount': round(paid_amount, 2),
+            'remaining_amount': round(remaining_amount, 2),
+            'next_charge_date': next_charge_date.isoformat() if next_charge_date else None
+        }
+
+    return progress
+
+
+def _as_date(value):
+    """
+    MIN(CASE ...) 在 SQLite 上可能返回 ISO 字符串，统一转成 date
+    """
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).date()
+    return value
+
+
+if __name__ == '__main__':
+    """
+    直接运行此文件时，执行测试：闭式版本与逐期循环的原始实现逐个对比
+
+    运行方法：
+        python -m utils.schedule（在 backend 目录下）
+    """
+    import random
+    from datetime import date
+
+    print("扣费日期生成一致性测试\n" + "=" * 50)
+
+    rng = random.Random(20251017)
+    base = date(2000, 1, 1)
+    cases = 5000
+
+    def random_range():
+        start = base + timedelta(days=rng.randrange(0, 365 * 40))
+        # 覆盖：结束早于开始、同一天、几天、几十年
+        end = start + timedelta(days=rng.choice([
+            rng.randrange(-40, 1), rng.randrange(1, 70), rng.randrange(1, 365 * 12)
+        ]))
+        return start, end
+
+    weekly_failures = []
+    for _ in range(cases):
+        start, end = random_range()
+        dow = rng.randrange(0, 7)
+        expected = _generate_weekly_charge_dates_loop(start, end, dow)
+        if (generate_weekly_charge_dates(start, end, dow) != expected
+                or count_periods(start, end, 'weekly', day_of_week=dow) != len(expected)):
+            weekly_failures.append((start, end, dow))
+
+    monthly_failures = []
+    for _ in range(cases):
+        start, end = random_range()
+        dom = rng.randrange(-3, 33)
+        try:
+            expected = _generate_monthly_charge_dates_loop(start, end, dom)
+        except ValueError:
+            # 第一个扣费月没有这一天（如 2 月 30 号）：闭式版本同样抛出 ValueError
+            expected = ValueError
+        try:
+            actual = (
+                generate_monthly_charge_dates(start, end, dom),
+                count_periods(start, end, 'monthly', day_of_month=dom)
+            )
+        except ValueError:
+            actual = ValueError
+        if actual != (ValueError if expected is ValueError else (expected, len(expected))):
+            monthly_failures.append((start, end, dom))
+
+    for name, failures in [('周扣费', weekly_failures), ('月扣费', monthly_failures)]:
+        status = "✅ PASS" if not failures else f"❌ FAIL {failures[:3]}"
+        print(f"{name} {cases} 组随机区间 {status}")
+
+    # 返回值必须是 datetime.date（调用方会和数据库里的 Date 比较）
+    sample = generate_weekly_charge_dates(date(2025, 1, 1), date(2025, 3, 1), 0)
+    print(f"返回类型 {'✅ PASS' if type(sample[0]) is date else '❌ FAIL'} {type(sample[0]).__name__}")
+
+    print("\n测试完成！")
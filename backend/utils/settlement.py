@@ -0,0 +1,261 @@
+"""
+到期扣费自动结算
+
+问题：扣费状态只在创建 / 更新合同时按「日期 <= 今天」设置一次，
+之后日期到了的待付扣费一直是 pending，已付 ROI 会偏低。
+
+settle_due_charges() 一次完成结算（一个事务）：
+1. 一条查询找出所有到期的待付扣费（status = 'pending' AND charge_date <= 今天，
+   走 ix_weekly_charges_status_date 索引）
+2. 虚拟扣费计划（见 utils/schedule.py）中已到期但还没有存储的期数，按规则补上
+3. 一条 INSERT ... RETURNING 批量生成所有子支出
+4. executemany 批量把扣费改为 paid（虚拟期数直接插入已付记录）
+5. 已付金额计入 ROI 合计表
+
+「今天」按环境变量 TIMEZONE 的时区计算（见 utils/schedule.py 的 local_today）。
+
+两种运行方式：
+- 后台线程：设置环境变量 SETTLEMENT_INTERVAL（秒），python app.py 启动时自动运行，
+  状态见 GET /api/contracts/settlement
+- 命令行：flask --app app settle-charges [--today 2025-10-17]（可以配合 cron）
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from models import db, Expense, MembershipContract, WeeklyCharge
+from utils.roi import apply_roi_delta
+from utils.schedule import SCHEDULE_VIRTUAL, contract_charge_dates, count_periods, local_today
+
+# 后台线程状态（进程内共享）
+_state_lock = threading.Lock()
+_stop_event = threading.Event()
+_thread = None
+_state = {
+    'status': 'stopped',     # stopped / running
+    'interval': None,
+    'last_run_at': None,
+    'last_result': None,
+    'error': None
+}
+
+
+def _period_number(contract, charge_date):
+    """
+    某个扣费日是合同的第几期（O(1)，用于子支出备注）
+    """
+    return count_periods(
+        contract.start_date, charge_date + timedelta(days=1), contract.period_type,
+        day_of_week=contract.day_of_week, day_of_month=contract.day_of_month
+    )
+
+
+def _find_due_charges(today):
+    """
+    找出所有到期的待付扣费
+
+    返回:
+        list: [(合同, 父支出, 扣费 id 或 None, 扣费日期, 金额), ...]
+        扣费 id 为 None 表示虚拟扣费计划中还没有存储的期数
+    """
+    # 1. 已存储的待付扣费：一条索引查询（连同合同和父支出）
+    stored = db.session.execute(
+        db.select(MembershipContract, Expense, WeeklyCharge.id, WeeklyCharge.charge_date, WeeklyCharge.amount)
+        .join(WeeklyCharge, WeeklyCharge.contract_id == MembershipContract.id)
+        .join(Expense, Expense.id == MembershipContract.expense_id)
+        .where(WeeklyCharge.status == 'pending', WeeklyCharge.charge_date <= today)
+        .order_by(WeeklyCharge.charge_date)
+    ).all()
+    due = [tuple(row) for row in stored]
+
+    # 2. 虚拟扣费计划：已到期但没有存储记录的期数
+    virtual = db.session.execute(
+        db.select(MembershipContract, Expense)
+        .join(Expense, Expense.id == MembershipContract.expense_id)
+        .where(MembershipContract.schedule_mode == SCHEDULE_VIRTUAL, MembershipContract.start_date <= today)
+    ).all()
+
+    if virtual:
+        stored_dates = {}
+        rows = db.session.execute(
+            db.select(WeeklyCharge.contract_id, WeeklyCharge.charge_date)
+            .where(WeeklyCharge.contract_id.in_([contract.id for contract, _ in virtual]))
+        ).all()
+        for contract_id, charge_date in rows:
+            stored_dates.setdefault(contract_id, set()).add(charge_date)
+
+        for contract, parent_expense in virtual:
+            existing = stored_dates.get(contract.id, set())
+            for charge_date in contract_charge_dates(contract, until=today + timedelta(days=1)):
+                if charge_date not in existing:
+                    due.append((contract, parent_expense, None, charge_date, contract.period_amount))
+
+    return due
+
+
+def settle_due_charges(today=None):
+    """
+    把所有到期的待付扣费结算为已付（一个事务，函数内提交）
+
+    参数:
+        today (date): 今天，默认为 local_today()
+
+    返回:
+    {
+      "today": "2025-10-17",
+      "settled": 12,            // 已存储的待付扣费 → 已付
+      "virtual_settled": 3,     // 虚拟扣费计划补上的已付期数
+      "amount": 204.0           // 本次结算的总金额
+    }
+    """
+    if today is None:
+        today = local_today()
+
+    try:
+        due = _find_due_charges(today)
+
+        if due:
+            # 1. 一条 INSERT ... RETURNING 生成所有子支出
+            #    同一父支出内扣费日期互不相同，用 (父支出 id, 日期) 对应子支出 id
+            result = db.session.execute(
+                db.insert(Expense).returning(Expense.id, Expense.parent_expense_id, Expense.date),
+                [
+                    {
+                        'type': parent_expense.type,
+                        'category': parent_expense.category,
+                        'amount': amount,
+                        'currency': parent_expense.currency,
+                        'date': charge_date,
+                        'note': f"{parent_expense.category} - 第 {_period_number(contract, charge_date)} 期",
+                        'parent_expense_id': parent_expense.id,
+                        'is_installment': False
+                    }
+                    for contract, parent_expense, _, charge_date, amount in due
+                ]
+            )
+            child_ids = {(row.parent_expense_id, row.date): row.id for row in result}
+
+            # 2. 已存储的扣费：executemany 改为已付
+            updates = [
+                {'row_id': charge_id, 'expense_id': child_ids[(parent_expense.id, charge_date)]}
+                for contract, parent_expense, charge_id, charge_date, _ in due
+                if charge_id is not None
+            ]
+            if updates:
+                db.session.execute(
+                    db.update(WeeklyCharge.__table__)
+                    .where(WeeklyCharge.__table__.c.id == db.bindparam('row_id'))
+                    .values(status='paid', expense_id=db.bindparam('expense_id')),
+                    updates
+                )
+
+            # 3. 虚拟期数：直接插入已付记录
+            inserts = [
+                {
+                    'contract_id': contract.id,
+                    'expense_id': child_ids[(parent_expense.id, charge_date)],
+                    'charge_date': charge_date,
+                    'amount': amount,
+                    'status': 'paid'
+                }
+                for contract, parent_expense, charge_id, charge_date, amount in due
+                if charge_id is None
+            ]
+            if inserts:
+                db.session.execute(db.insert(WeeklyCharge), inserts)
+
+            # 4. 已付金额计入 ROI 合计表
+            apply_roi_delta(paid=sum(amount for *_, amount in due))
+
+        db.session.commit()
+
+        settled = sum(1 for row in due if row[2] is not None)
+        return {
+            'today': today.isoformat(),
+            'settled': settled,
+            'virtual_settled': len(due) - settled,
+            'amount': round(sum(amount for *_, amount in due), 2)
+        }
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def get_settlement_status():
+    """
+    查询后台结算线程的状态
+
+    返回:
+    {
+      "status": "running",
+      "interval": 3600,
+      "last_run_at": "2025-10-18T10:30:15",
+      "last_result": {...},     // settle_due_charges 的返回值
+      "error": null
+    }
+    """
+    with _state_lock:
+        return dict(_state)
+
+
+def _run_worker(app, interval):
+    """
+    后台线程：每隔 interval 秒结算一次，直到 stop_settlement_worker()
+    """
+    while not _stop_event.is_set():
+        with app.app_context():
+            try:
+                result = settle_due_charges()
+                with _state_lock:
+                    _state.update(last_run_at=datetime.now().isoformat(), last_result=result, error=None)
+            except Exception as e:
+                with _state_lock:
+                    _state.update(last_run_at=datetime.now().isoformat(), error=str(e))
+            finally:
+                db.session.remove()
+
+        _stop_event.wait(interval)
+
+    with _state_lock:
+        _state['status'] = 'stopped'
+
+
+def start_settlement_worker(app, interval):
+    """
+    启动后台结算线程（立即返回；已经在运行时不重复启动）
+
+    参数:
+        app: Flask 应用对象（线程里需要自己的 app context）
+        interval (float): 结算间隔（秒，必须 > 0）
+
+    异常:
+        ValueError: 间隔不合法
+    """
+    interval = float(interval)
+    if interval <= 0:
+        raise ValueError('结算间隔必须大于 0')
+
+    with _state_lock:
+        if _state['status'] == 'running':
+            return dict(_state)
+        _state.update(status='running', interval=interval, error=None)
+
+    global _thread
+    _stop_event.clear()
+    _thread = threading.Thread(target=_run_worker, args=(app, interval), daemon=True)
+    _thread.start()
+
+    return get_settlement_status()
+
+
+def stop_settlement_worker(timeout=None):
+    """
+    停止后台结算线程（当前这一轮结算完成后退出；app.py 在进程退出时调用）
+
+    参数:
+        timeout (float): 最多等待线程退出的秒数，None 表示不等待
+    """
+    _stop_event.set()
+    if timeout is not None and _thread is not None and _thread.is_alive():
+        _thread.join(timeout)
@@ -0,0 +1,311 @@
+"""
+游泳权重模型参数（可配置）+ 后台重算
+
+参数存放在 Setting 表：
+- swimming_baseline:    基准距离（默认 1000m）
+- swimming_sigma:       标准差（默认 550）
+- weight_model_version: 参数版本号，每次修改参数 +1
+
+修改参数后：
+1. 新建/更新的活动立即使用新参数，并记录 weight_model_version
+2. 启动一个后台线程，分块（每块 CHUNK_SIZE 行）批量 UPDATE 所有旧版本活动的权重
+   - 每块一个事务，API 在重算期间照常服务
+   - 每块同时把权重差值计入 ROI 合计表，合计表始终与数据一致
+   - 参数再次被修改时，旧任务在下一块开始前自动停止
+3. 通过 get_recompute_progress() 查询进度
+4. 进度只保存在内存里；进程在重算中途重启时，启动时调用 resume_weight_recompute()
+   检查还有没有旧版本的活动，有就重新启动重算（已重算的行不会再处理）
+"""
+
+import math
+import threading
+from datetime import datetime
+
+from models import db, Activity, Setting
+from utils.gaussian import calculate_swimming_weights
+from utils.roi import apply_roi_delta
+
+# 默认参数（与 utils/gaussian.py 的默认值一致）
+DEFAULT_BASELINE = 1000.0
+DEFAULT_SIGMA = 550.0
+DEFAULT_VERSION = 1
+
+# 每块重算的活动数
+CHUNK_SIZE = 500
+
+# Setting 表中的键及说明
+SETTING_KEYS = {
+    'swimming_baseline': '游泳权重基准距离（米）',
+    'swimming_sigma': '游泳权重标准差',
+    'weight_model_version': '游泳权重参数版本号'
+}
+
+# 后台重算进度（进程内共享）
+_progress_lock = threading.Lock()
+_progress = {
+    'status': 'idle',        # idle / running / completed / superseded / failed
+    'version': None,
+    'total': 0,
+    'processed': 0,
+    'started_at': None,
+    'finished_at': None,
+    'error': None
+}
+
+
+def get_weight_model():
+    """
+    读取当前的权重模型参数（一次查询）
+
+    返回:
+    {
+      "baseline": 1000.0,
+      "sigma": 550.0,
+      "version": 1
+    }
+    """
+    rows = db.session.execute(
+        db.select(Setting.key, Setting.value).where(Setting.key.in_(SETTING_KEYS))
+    ).all()
+    values = {row.key: row.value for row in rows}
+
+    return {
+        'baseline': float(values.get('swimming_baseline', DEFAULT_BASELINE)),
+        'sigma': float(values.get('swimming_sigma', DEFAULT_SIGMA)),
+        'version': int(values.get('weight_model_version', DEFAULT_VERSION))
+    }
+
+
+def _set_setting(key, value):
+    """
+    写入一个设置项（不存在则创建）
+    """
+    setting = Setting.query.filter_by(key=key).first()
+    if setting:
+        setting.value = str(value)
+    else:
+        db.session.add(Setting(key=key, value=str(value), description=SETTING_KEYS[key]))
+
+
+def save_weight_model(baseline, sigma):
+    """
+    保存新的权重模型参数，版本号 +1（不提交，由调用方 commit）
+
+    参数:
+        baseline (float): 基准距离（必须是 > 0 的有限数）
+        sigma (float): 标准差（必须是 > 0 的有限数）
+
+    返回:
+        dict: 新的参数（同 get_weight_model）
+
+    异常:
+        ValueError: 参数不合法
+    """
+    baseline = float(baseline)
+    sigma = float(sigma)
+    # NaN / inf 会让所有权重变成 NaN，ROI 合计表写入失败
+    if not (math.isfinite(baseline) and math.isfinite(sigma) and baseline > 0 and sigma > 0):
+        raise ValueError('baseline 和 sigma 必须是大于 0 的有限数')
+
+    version = get_weight_model()['version'] + 1
+
+    _set_setting('swimming_baseline', baseline)
+    _set_setting('swimming_sigma', sigma)
+    _set_setting('weight_model_version', version)
+
+    return {'baseline': baseline, 'sigma': sigma, 'version': version}
+
+
+def get_recompute_progress():
+    """
+    查询后台重算进度
+
+    返回:
+    {
+      "status": "running",
+      "version": 2,
+      "total": 1200,
+      "processed": 500,
+      "percentage": 41.67,
+      "started_at": "2025-10-18T10:30:15",
+      "finished_at": null,
+      "error": null
+    }
+    """
+    with _progress_lock:
+        progress = dict(_progress)
+
+    total = progress['total']
+    if total:
+        progress['percentage'] = round(progress['processed'] / total * 100, 2)
+    else:
+        progress['percentage'] = 100.0 if progress['status'] == 'completed' else 0.0
+    return progress
+
+
+def _update_progress(version, **fields):
+    """
+    更新进度（线程安全）
+
+    只有进度属于该版本的任务时才更新，避免被取代的旧任务覆盖新任务的进度。
+    """
+    with _progress_lock:
+        if _progress['version'] == version:
+            _progress.update(fields)
+
+
+def _outdated_filter(version):
+    """
+    需要重算的活动：版本号为空或不等于目标版本
+    """
+    return db.or_(
+        Activity.weight_model_version == None,
+        Activity.weight_model_version != version
+    )
+
+
+def _recompute_chunk(model, after_id):
+    """
+    重算一块活动（id > after_id 的前 CHUNK_SIZE 行），并在同一事务里提交
+
+    读取和写入之间，某些行可能已被并发修改（update_activity 或更新版本的重算任务）。
+    所以 UPDATE 只匹配版本号和权重都还是读取时的值的行。
+    只有真正被改写的行才计入 ROI 合计表，权重差值不会重复计入。
+
+    返回:
+        tuple: (本块行数, 本块最大 id)
+    """
+    rows = db.session.execute(
+        db.select(Activity.id, Activity.distance, Activity.calculated_weight, Activity.weight_model_version)
+        .where(Activity.id > after_id, _outdated_filter(model['version']))
+        .order_by(Activity.id)
+        .limit(CHUNK_SIZE)
+    ).all()
+
+    if not rows:
+        return 0, after_id
+
+    # 批量计算新权重（距离为空按 0 处理）
+    weights = calculate_swimming_weights(
+        [row.distance or 0 for row in rows], model['baseline'], model['sigma']
+    )
+    params = [
+        {
+            'row_id': row.id,
+            'old_version': row.weight_model_version,
+            'old_weight': row.calculated_weight,
+            'weight': float(weight)
+        }
+        for row, weight in zip(rows, weights)
+    ]
+
+    # executemany：一条 UPDATE 语句 + 多组参数（IS 比较，NULL 也能匹配）
+    table = Activity.__table__
+    statement = (
+        db.update(table)
+        .where(
+            table.c.id == db.bindparam('row_id'),
+            table.c.weight_model_version.is_(db.bindparam('old_version')),
+            table.c.calculated_weight.is_(db.bindparam('old_weight'))
+        )
+        .values(
+            calculated_weight=db.bindparam('weight'),
+            weight_model_version=model['version']
+        )
+    )
+    changed = params
+    if db.session.execute(statement, params).rowcount != len(params):
+        # 有行在读取之后被修改过：撤销这一块，逐行更新，只保留真正改写的行
+        db.session.rollback()
+        changed = [param for param in params if db.session.execute(statement, param).rowcount == 1]
+
+    # 同一事务里把权重差值计入 ROI 合计表
+    apply_roi_delta(weighted=sum(param['weight'] - (param['old_weight'] or 0.0) for param in changed))
+
+    db.session.commit()
+    return len(rows), rows[-1].id
+
+
+def _run_recompute(app, model):
+    """
+    后台线程：分块重算所有旧版本活动的权重
+    """
+    with app.app_context():
+        try:
+            total = db.session.execute(
+                db.select(db.func.count(Activity.id)).where(_outdated_filter(model['version']))
+            ).scalar()
+            _update_progress(model['version'], total=total)
+
+            processed = 0
+            last_id = 0
+            while True:
+                # 参数又被修改了：停止旧任务，由新任务接手
+                if get_weight_model()['version'] != model['version']:
+                    _update_progress(model['version'], status='superseded', finished_at=datetime.now().isoformat())
+                    return
+
+                count, last_id = _recompute_chunk(model, last_id)
+                if count == 0:
+                    break
+
+                processed += count
+                _update_progress(model['version'], processed=processed)
+
+            _update_progress(model['version'], status='completed', finished_at=datetime.now().isoformat())
+
+        except Exception as e:
+            db.session.rollback()
+            _update_progress(model['version'], status='failed', error=str(e), finished_at=datetime.now().isoformat())
+
+        finally:
+            db.session.remove()
+
+
+def start_weight_recompute(app, model):
+    """
+    启动后台重算线程（立即返回）
+
+    参数:
+        app: Flask 应用对象（线程里需要自己的 app context）
+        model (dict): 目标参数（save_weight_model 的返回值）
+
+    返回:
+        dict: 初始进度
+    """
+    with _progress_lock:
+        _progress.update(
+            status='running',
+            version=model['version'],
+            total=0,
+            processed=0,
+            started_at=datetime.now().isoformat(),
+            finished_at=None,
+            error=None
+        )
+
+    thread = threading.Thread(target=_run_recompute, args=(app, model), daemon=True)
+    thread.start()
+
+    return get_recompute_progress()
+
+
+def resume_weight_recompute(app):
+    """
+    应用启动时调用：还有旧版本的活动（上次重算被重启打断）就重新启动后台重算
+
+    返回:
+        dict: 初始进度（没有需要重算的活动时返回 None）
+    """
+    with app.app_context():
+        try:
+            model = get_weight_model()
+            outdated = db.session.execute(
+                db.select(db.exists().where(_outdated_filter(model['version'])))
+            ).scalar()
+        finally:
+            db.session.remove()
+
+    if not outdated:
+        return None
+    return start_weight_recompute(app, model)
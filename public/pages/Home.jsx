@@ -1,33 +1,122 @@
 /**
  * Public 展示页面
  * 只读模式,从静态 JSON 数据展示健身房回本进度
+ *
+ * 数据加载:
+ * - 先读 manifest.json(ROI 摘要 + 按年分片列表),只下载最近一年的分片
+ * - 点击"加载更早的数据"再按年往前加载
+ * - 分片文件名带内容哈希,内容不变时浏览器直接用缓存
+ * - 没有 manifest.json 时(旧版导出)退回到读取完整的 summary.json
+ * - layout 为 columnar 时(列式导出)先还原成对象数组
  */
 import { useState, useEffect } from 'react';
 import ROICardReadOnly from '../components/ROICardReadOnly';
 import ExpenseListReadOnly from '../components/ExpenseListReadOnly';
 import ActivityListReadOnly from '../components/ActivityListReadOnly';
 
+// 首次加载的年份数
+const INITIAL_YEARS = 1;
+
+// 列式布局 { columns, data, length } → 对象数组
+function fromColumnar(table) {
+  const rows = [];
+  for (let i = 0; i < table.length; i++) {
+    const row = {};
+    table.columns.forEach((column) => {
+      row[column] = table.data[column][i];
+    });
+    rows.push(row);
+  }
+  return rows;
+}
+
+// 按导出布局读取记录列表
+function readRows(value, layout) {
+  return layout === 'columnar' ? fromColumnar(value) : value;
+}
+
+// 分片列表里的所有年份(倒序)
+function shardYears(manifest) {
+  const years = new Set();
+  Object.values(manifest.shards).forEach((shards) => {
+    shards.forEach((shard) => years.add(shard.key));
+  });
+  return [...years].sort().reverse();
+}
+
 export default function Home() {
   const [data, setData] = useState(null);
+  const [manifest, setManifest] = useState(null);
+  const [loadedYears, setLoadedYears] = useState(0);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
+  // 使用 import.meta.env.BASE_URL 来适配不同环境的 base path
+  const baseUrl = import.meta.env.BASE_URL;
+
   useEffect(() => {
     loadData();
   }, []);
 
+  /**
+   * 下载某几年的分片,返回 { expenses, activities }(保持按日期倒序)
+   */
+  const fetchShards = async (manifestData, years) => {
+    const result = {};
+    await Promise.all(
+      Object.entries(manifestData.shards).map(async ([kind, shards]) => {
+        const selected = shards.filter((shard) => years.includes(shard.key));
+        const rows = await Promise.all(
+          selected.map(async (shard) => {
+            const response = await fetch(`${baseUrl}data/${shard.file}`);
+            if (!response.ok) {
+              throw new Error('数据加载失败');
+            }
+            return readRows(await response.json(), manifestData.layout);
+          })
+        );
+        result[kind] = rows.flat();
+      })
+    );
+    return result;
+  };
+
   const loadData = async () => {
     try {
       setLoading(true);
       setError(null);
-      // 使用 import.meta.env.BASE_URL 来适配不同环境的 base path
-      const baseUrl = import.meta.env.BASE_URL;
-      const response = await fetch(`${baseUrl}data/summary.json`);
-      if (!response.ok) {
-        throw new Error('数据加载失败');
+
+      // manifest 每次都要拿最新的,分片按文件名缓存
+      const manifestResponse = await fetch(`${baseUrl}data/manifest.json`, { cache: 'no-cache' });
+      if (!manifestResponse.ok) {
+        // 旧版导出:读取完整的 summary.json
+        const response = await fetch(`${baseUrl}data/summary.json`);
+        if (!response.ok) {
+          throw new Error('数据加载失败');
+        }
+        const jsonData = await response.json();
+        setManifest(null);
+        setData({
+          ...jsonData,
+          expenses: readRows(jsonData.expenses, jsonData.layout),
+          activities: readRows(jsonData.activities, jsonData.layout),
+        });
+        return;
       }
-      const jsonData = await response.json();
-      setData(jsonData);
+
+      const manifestData = await manifestResponse.json();
+      const years = shardYears(manifestData).slice(0, INITIAL_YEARS);
+      const shardData = await fetchShards(manifestData, years);
+
+      setManifest(manifestData);
+      setLoadedYears(years.length);
+      setData({
+        roi: manifestData.roi,
+        lastUpdated: manifestData.lastUpdated,
+        expenses: shardData.expenses || [],
+        activities: shardData.activities || [],
+      });
     } catch (err) {
       setError(err.message);
     } finally {
@@ -35,6 +124,27 @@ export default function Home() {
     }
   };
 
+  /**
+   * 再往前加载一年的分片
+   */
+  const loadMore = async () => {
+    const year = shardYears(manifest)[loadedYears];
+    try {
+      setLoadingMore(true);
+      const shardData = await fetchShards(manifest, [year]);
+      setData((prev) => ({
+        ...prev,
+        expenses: [...prev.expenses, ...(shardData.expenses || [])],
+        activities: [...prev.activities, ...(shardData.activities || [])],
+      }));
+      setLoadedYears(loadedYears + 1);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <div style={styles.container}>
@@ -58,6 +168,8 @@ export default function Home() {
 
   if (!data) return null;
 
+  const olderYear = manifest ? shardYears(manifest)[loadedYears] : null;
+
   return (
     <div style={styles.container}>
       <header style={styles.header}>
@@ -74,6 +186,13 @@ export default function Home() {
 
         {/* 活动列表 */}
         <ActivityListReadOnly activities={data.activities} />
+
+        {/* 按年加载更早的分片 */}
+        {olderYear && (
+          <button onClick={loadMore} disabled={loadingMore} style={styles.loadMoreButton}>
+            {loadingMore ? '加载中...' : `加载更早的数据(${olderYear} 年)`}
+          </button>
+        )}
       </div>
 
       <footer style={styles.footer}>
@@ -137,6 +256,17 @@ const styles = {
     color: '#ef4444',
     fontSize: '18px',
   },
+  loadMoreButton: {
+    display: 'block',
+    margin: '24px auto 0',
+    padding: '10px 20px',
+    background: 'white',
+    color: '#1a73e8',
+    border: '1px solid #dadce0',
+    borderRadius: '8px',
+    cursor: 'pointer',
+    fontSize: '14px',
+  },
   retryButton: {
     marginTop: '16px',
     padding: '10px 20px',